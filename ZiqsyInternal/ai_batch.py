@@ -0,0 +1,327 @@
+"""
+Batch AI descriptions for repository files and folders.
+A page's CloudFolder (read from the file index) or an explicit list of paths is
+described on a bounded thread pool, and the results are written to
+FileRepository.ai_description. Provider calls go through a per-provider token
+bucket and are retried with exponential backoff on rate-limit, timeout and
+server errors. Files are described first and folders afterwards, deepest
+first, so each folder's prompt includes its children's descriptions.
+
+To run batches against a local stub instead of the real providers, point
+OPENAI_BASE_URL or ANTHROPIC_BASE_URL at it (the client libraries read both),
+or pass describe= to describe_items.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_, select
+
+from app import app, db
+from ai_service import description_provider, describe_file, describe_folder
+from file_index import ROOT, path_hash
+from models import FileRepository, RepositoryFileIndex
+
+AI_BATCH_WORKERS = int(os.environ.get('AI_BATCH_WORKERS', '4'))
+AI_BATCH_MAX_ITEMS = int(os.environ.get('AI_BATCH_MAX_ITEMS', '5000'))
+AI_RETRY_ATTEMPTS = int(os.environ.get('AI_RETRY_ATTEMPTS', '5'))
+AI_RETRY_BASE_SECONDS = float(os.environ.get('AI_RETRY_BASE_SECONDS', '1'))
+AI_RETRY_MAX_SECONDS = 60.0
+# Requests per minute for each provider; 0 disables the limit
+PROVIDER_RATE_LIMITS = {
+    'openai': float(os.environ.get('AI_RATE_LIMIT_OPENAI', '60')),
+    'anthropic': float(os.environ.get('AI_RATE_LIMIT_ANTHROPIC', '50'))
+}
+RETRY_STATUSES = {408, 409, 429}
+RETRY_ERRORS = ('APIConnectionError', 'APITimeoutError')
+LOOKUP_BATCH_ROWS = 1000
+MAX_REPORTED_ERRORS = 20
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket allowing per_minute calls a minute, in bursts of up to a second's worth"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a call may be made"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for seconds, e.g. after the provider answered 429"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+_limiters_lock = threading.Lock()
+_limiters = {}
+_stats_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = RateLimiter(PROVIDER_RATE_LIMITS.get(provider, 0))
+        return _limiters[provider]
+
+
+def is_retryable(error):
+    """Rate limits, timeouts, conflicts, server errors and dropped connections"""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in RETRY_ERRORS
+
+
+def _retry_after(error):
+    """Seconds from the response's Retry-After header, if it sent one"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return min(float(headers.get('retry-after')), AI_RETRY_MAX_SECONDS)
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(provider, func, *args, attempts=AI_RETRY_ATTEMPTS, stats=None, **kwargs):
+    """func(*args, **kwargs) under the provider's rate limit, with backoff between attempts"""
+    limiter = get_limiter(provider)
+    for attempt in range(attempts):
+        limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                # Full jitter keeps parallel workers from retrying in lockstep
+                delay = random.uniform(0, min(AI_RETRY_MAX_SECONDS, AI_RETRY_BASE_SECONDS * 2 ** attempt))
+            if getattr(e, 'status_code', None) == 429:
+                limiter.pause(delay)
+            if stats is not None:
+                with _stats_lock:
+                    stats['retries'] = stats.get('retries', 0) + 1
+            logger.info(f"Retrying {provider} call in {delay:.1f}s after: {e}")
+            time.sleep(delay)
+
+
+# Collecting items
+
+def _item(path, name, is_folder, children=()):
+    return {'path': path, 'name': name, 'is_folder': is_folder, 'children': list(children)}
+
+
+def _abs_path(root, rel_path):
+    return os.path.join(root, *rel_path.split('/')) if rel_path else root
+
+
+def collect_folder_items(page_id, root, rel_path=ROOT):
+    """Indexed entries at and below rel_path, with each folder's children (run ensure_index first)"""
+    root = os.path.abspath(root)
+    query = select(RepositoryFileIndex.path, RepositoryFileIndex.name, RepositoryFileIndex.is_folder) \
+        .where(RepositoryFileIndex.page_id == page_id)
+    if rel_path:
+        escaped = rel_path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.where(or_(RepositoryFileIndex.path_hash == path_hash(rel_path),
+                                RepositoryFileIndex.path.like(escaped + '/%', escape='\\')))
+    rows = db.session.execute(query).all()
+
+    children = {}
+    for row in rows:
+        if row.path != rel_path:
+            parent = row.path.rsplit('/', 1)[0] if '/' in row.path else ROOT
+            children.setdefault(parent, []).append(_abs_path(root, row.path))
+    return [_item(_abs_path(root, row.path), row.name, row.is_folder, children.get(row.path, ()))
+            for row in rows]
+
+
+def collect_path_items(paths):
+    """Items for explicit paths; folders list their direct children for context"""
+    items = []
+    for path in dict.fromkeys(os.path.abspath(path) for path in paths):
+        if not os.path.exists(path):
+            continue
+        is_folder = os.path.isdir(path)
+        children = []
+        if is_folder:
+            try:
+                with os.scandir(path) as it:
+                    children = [entry.path for entry in it if not entry.name.startswith('.')]
+            except OSError as e:
+                logger.warning(f"Could not list {path}: {e}")
+        items.append(_item(path, os.path.basename(path) or path, is_folder, sorted(children)))
+    return items
+
+
+# Describing
+
+def _default_describe(item, child_descriptions, provider, stats):
+    """Describe one item through ai_service, retrying with backoff"""
+    if item['is_folder']:
+        names = [os.path.basename(child) for child in item['children']]
+        return call_with_retry(provider, describe_folder, item['path'], item['name'], names,
+                               child_descriptions, max_retries=0, stats=stats)
+    extension = item['name'].rsplit('.', 1)[-1] if '.' in item['name'] else ''
+    return call_with_retry(provider, describe_file, item['path'], item['name'], extension,
+                           max_retries=0, stats=stats)
+
+
+def _stored_descriptions(page_id, paths):
+    stored = {}
+    paths = list(paths)
+    for start in range(0, len(paths), LOOKUP_BATCH_ROWS):
+        rows = db.session.execute(
+            select(FileRepository.file_path, FileRepository.ai_description)
+            .where(FileRepository.page_id == page_id,
+                   FileRepository.file_path.in_(paths[start:start + LOOKUP_BATCH_ROWS]),
+                   FileRepository.ai_description.isnot(None), FileRepository.ai_description != '')
+        ).all()
+        stored.update((row.file_path, row.ai_description) for row in rows)
+    return stored
+
+
+def _save_descriptions(page_id, items, descriptions):
+    """Upsert generated descriptions into FileRepository in one commit"""
+    paths = list(descriptions)
+    records = {}
+    for start in range(0, len(paths), LOOKUP_BATCH_ROWS):
+        for record in FileRepository.query.filter(
+                FileRepository.page_id == page_id,
+                FileRepository.file_path.in_(paths[start:start + LOOKUP_BATCH_ROWS])):
+            records[record.file_path] = record
+    for item in items:
+        if item['path'] not in descriptions:
+            continue
+        record = records.get(item['path'])
+        if record:
+            record.ai_description = descriptions[item['path']]
+        else:
+            db.session.add(FileRepository(page_id=page_id, file_path=item['path'], file_name=item['name'][:255],
+                                          ai_description=descriptions[item['path']], is_folder=item['is_folder']))
+    db.session.commit()
+
+
+def _waves(items):
+    """Files first, then folders grouped by depth, deepest first"""
+    files = [item for item in items if not item['is_folder']]
+    folders = {}
+    for item in items:
+        if item['is_folder']:
+            folders.setdefault(item['path'].rstrip(os.sep).count(os.sep), []).append(item)
+    waves = [files] if files else []
+    waves.extend(folders[depth] for depth in sorted(folders, reverse=True))
+    return waves
+
+
+def describe_items(page_id, items, overwrite=False, describe=None, progress=None):
+    """Describe items bottom-up and store the results on the page's FileRepository records.
+
+    Items that already have a stored description are skipped unless overwrite
+    is set; their descriptions still feed their parent folders' prompts.
+    describe(item, child_descriptions) replaces the provider call, and
+    progress(**counters) receives progress updates.
+    """
+    started = time.perf_counter()
+    provider = None
+    if describe is None:
+        provider = description_provider()
+        if not provider:
+            return {'success': False, 'error': 'No AI provider is configured for descriptions'}
+    if len(items) > AI_BATCH_MAX_ITEMS:
+        return {'success': False, 'error': f'{len(items)} items is more than the limit of {AI_BATCH_MAX_ITEMS}; '
+                                           f'describe a smaller folder'}
+
+    known = _stored_descriptions(page_id, {item['path'] for item in items} |
+                                 {child for item in items for child in item['children']})
+    pending = [item for item in items if overwrite or item['path'] not in known]
+    stats = {'items_total': len(items), 'described': 0, 'skipped': len(items) - len(pending), 'failed': 0,
+             'retries': 0}
+    errors = []
+
+    def run(item, child_descriptions):
+        with app.app_context():
+            try:
+                if describe is not None:
+                    return describe(item, child_descriptions)
+                return _default_describe(item, child_descriptions, provider, stats)
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=max(1, AI_BATCH_WORKERS), thread_name_prefix='ziqsy-ai-batch') as pool:
+        for wave in _waves(pending):
+            futures = []
+            for item in wave:
+                child_descriptions = {os.path.basename(child): known[child]
+                                      for child in item['children'] if child in known}
+                futures.append((item, pool.submit(run, item, child_descriptions)))
+            generated = {}
+            for item, future in futures:
+                try:
+                    generated[item['path']] = future.result()
+                    stats['described'] += 1
+                except Exception as e:
+                    stats['failed'] += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({'path': item['path'], 'error': str(e)})
+                    logger.warning(f"Could not describe {item['path']}: {e}")
+            if generated:
+                try:
+                    _save_descriptions(page_id, wave, generated)
+                except Exception as e:
+                    db.session.rollback()
+                    return dict(stats, success=False, error=f'Could not save descriptions: {e}', errors=errors)
+                known.update(generated)
+            if progress:
+                progress(items_processed=stats['described'] + stats['failed'] + stats['skipped'],
+                         described=stats['described'], failed=stats['failed'])
+
+    result = dict(stats, success=True, errors=errors, elapsed_seconds=round(time.perf_counter() - started, 4))
+    if pending and not stats['described']:
+        result['success'] = False
+        result['error'] = errors[0]['error'] if errors else 'No descriptions were generated'
+    return result
+
+
+def describe_batch_job(job, page_id, items, overwrite=False):
+    """Background job wrapper around describe_items"""
+    job.update_progress(items_total=len(items))
+    return describe_items(page_id, items, overwrite, progress=job.update_progress)
+
+
+def folder_children(page_id, folder_path):
+    """Child names and stored child descriptions for a single folder description"""
+    item = next(iter(collect_path_items([folder_path])), None)
+    if not item or not item['is_folder']:
+        return [], {}
+    stored = _stored_descriptions(page_id, item['children']) if page_id else {}
+    names = [os.path.basename(child) for child in item['children']]
+    return names, {os.path.basename(child): stored[child] for child in item['children'] if child in stored}
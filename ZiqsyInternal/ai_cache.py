@@ -0,0 +1,118 @@
+"""
+Persistent cache for LLM responses.
+Entries are keyed on (model, prompt fingerprint, dataset version) and stored in
+the ai_response_cache table. They expire after AI_CACHE_TTL_HOURS and the least
+recently used entries are evicted once AI_CACHE_MAX_ENTRIES is exceeded.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+from models import AIResponseCache
+
+AI_CACHE_TTL = timedelta(hours=float(os.environ.get('AI_CACHE_TTL_HOURS', '24')))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '5000'))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+
+
+def prompt_fingerprint(*parts):
+    """Stable hash of the prompt pieces that determine a response"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def make_cache_key(model, fingerprint, dataset_version=None):
+    return hashlib.sha256(f'{model}|{fingerprint}|{dataset_version or ""}'.encode('utf-8')).hexdigest()
+
+
+def get_cached_response(model, fingerprint, dataset_version=None):
+    """Get a cached payload, or None on a miss"""
+    key = make_cache_key(model, fingerprint, dataset_version)
+    try:
+        entry = db.session.get(AIResponseCache, key)
+        now = datetime.utcnow()
+        if entry is None or entry.expires_at < now:
+            _count('misses')
+            return None
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_accessed_at = now
+        payload = json.loads(entry.response)
+        db.session.commit()
+        _count('hits')
+        return payload
+    except Exception as e:
+        logger.warning(f"AI cache lookup failed: {e}")
+        _rollback()
+        _count('errors')
+        _count('misses')
+        return None
+
+
+def store_response(model, fingerprint, payload, dataset_version=None):
+    """Cache a payload, evicting expired and least recently used entries"""
+    key = make_cache_key(model, fingerprint, dataset_version)
+    now = datetime.utcnow()
+    try:
+        entry = db.session.get(AIResponseCache, key)
+        if entry is None:
+            entry = AIResponseCache(cache_key=key, model=model, dataset_version=dataset_version)
+            db.session.add(entry)
+        entry.response = json.dumps(payload, default=str)
+        entry.created_at = now
+        entry.last_accessed_at = now
+        entry.expires_at = now + AI_CACHE_TTL
+        db.session.commit()
+        _count('stores')
+        _evict(now)
+    except Exception as e:
+        logger.warning(f"AI cache store failed: {e}")
+        _rollback()
+        _count('errors')
+
+
+def _evict(now):
+    evicted = AIResponseCache.query.filter(AIResponseCache.expires_at < now).delete(synchronize_session=False)
+    excess = AIResponseCache.query.count() - AI_CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = [row.cache_key for row in AIResponseCache.query.with_entities(AIResponseCache.cache_key)
+                  .order_by(AIResponseCache.last_accessed_at.asc()).limit(excess)]
+        evicted += AIResponseCache.query.filter(AIResponseCache.cache_key.in_(oldest)).delete(synchronize_session=False)
+    db.session.commit()
+    if evicted:
+        _count('evictions', evicted)
+
+
+def cache_stats():
+    """Hit/miss counters for this process plus the current entry count"""
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    try:
+        stats['entries'] = AIResponseCache.query.count()
+    except Exception:
+        stats['entries'] = None
+    stats['max_entries'] = AI_CACHE_MAX_ENTRIES
+    stats['ttl_hours'] = AI_CACHE_TTL.total_seconds() / 3600
+    return stats
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+def _rollback():
+    try:
+        db.session.rollback()
+    except Exception:
+        pass
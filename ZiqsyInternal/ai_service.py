@@ -1,9 +1,16 @@
 import json
+import logging
 import os
+import time
 import pandas as pd
 from openai import OpenAI
 import anthropic
 from anthropic import Anthropic
+from ai_cache import prompt_fingerprint, get_cached_response, store_response
+from dataset_profile import profile_rows, summarize
+from metrics import AI_FIRST_TOKEN_SECONDS, AI_STREAM_SECONDS
+
+logger = logging.getLogger(__name__)
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
@@ -38,47 +45,88 @@ def get_available_models():
             available[model_id] = config
     return available
 
-def analyze_dataset_with_ai(dataset_df, question, model_id="gpt-4o"):
-    """Analyze dataset with AI using the selected model"""
+ANALYST_SYSTEM_PROMPT = "You are a data analyst expert. Provide clear, actionable insights about datasets based on their structure and content."
+
+def _resolve_model(model_id):
+    """Pick the requested model, or the first available one"""
     available_models = get_available_models()
-    
     if not available_models:
-        return {"error": "No AI models are available. Please configure API keys."}
-    
+        return None, None
     if model_id not in available_models:
         model_id = list(available_models.keys())[0]  # Use first available model
+    return model_id, available_models[model_id]
+
+def get_cached_dataset_analysis(question, model_id, dataset_version):
+    """Look up a cached analysis before the dataset is loaded; None on a miss.
+
+    dataset_version must identify the table as well as its contents, as
+    utils.get_table_version stamps do; the question alone is not table specific.
+    """
+    model_id, model_config = _resolve_model(model_id)
+    if not model_id or not dataset_version:
+        return None
+    cached = get_cached_response(model_id, prompt_fingerprint(ANALYST_SYSTEM_PROMPT, question), dataset_version)
+    if cached:
+        cached['cached'] = True
+    return cached
+
+def analyze_dataset_with_ai(dataset_df, question, model_id="gpt-4o", dataset_version=None):
+    """Analyze dataset with AI using the selected model"""
+    profile = profile_rows(list(dataset_df.columns), dataset_df.itertuples(index=False, name=None))
+    return analyze_dataset_profile_with_ai(profile, question, model_id, dataset_version)
+
+def _analysis_prompt(profile, question):
+    """User prompt describing the dataset profile and the question"""
+    summary = summarize(profile)
+    column_types = {col: info['type'] for col, info in summary['columns'].items()}
+    column_stats = {col: {key: value for key, value in info.items() if key != 'type'}
+                    for col, info in summary['columns'].items()}
     
-    model_config = available_models[model_id]
-    
-    # Prepare dataset summary for context
-    dataset_info = {
-        "shape": dataset_df.shape,
-        "columns": list(dataset_df.columns),
-        "dtypes": dataset_df.dtypes.to_dict(),
-        "sample_data": dataset_df.head(5).to_dict('records'),
-        "summary_stats": dataset_df.describe().to_dict() if len(dataset_df.select_dtypes(include='number').columns) > 0 else {}
-    }
-    
-    # Create context prompt
-    context_prompt = f"""
+    return f"""
     You are analyzing a dataset with the following characteristics:
     
-    Dataset Shape: {dataset_info['shape'][0]} rows, {dataset_info['shape'][1]} columns
+    Dataset Shape: {summary['row_count']} rows, {len(column_types)} columns
     
     Columns and Types:
-    {json.dumps(dataset_info['dtypes'], indent=2)}
+    {json.dumps(column_types, indent=2)}
     
-    Sample Data (first 5 rows):
-    {json.dumps(dataset_info['sample_data'], indent=2)}
+    Sample Data (first {len(summary['sample'])} rows):
+    {json.dumps(summary['sample'], indent=2, default=str)}
     
-    Summary Statistics:
-    {json.dumps(dataset_info['summary_stats'], indent=2)}
+    Summary Statistics (null counts, numeric min/max/mean, most frequent values):
+    {json.dumps(column_stats, indent=2, default=str)}
     
     User Question: {question}
     
     Please provide a detailed, insightful analysis based on the dataset context above. 
     Focus on actionable insights and patterns you can identify from the data structure and sample.
     """
+
+def _analysis_fingerprint(question, context_prompt, dataset_version):
+    if dataset_version:
+        return prompt_fingerprint(ANALYST_SYSTEM_PROMPT, question)
+    return prompt_fingerprint(ANALYST_SYSTEM_PROMPT, context_prompt)
+
+def analyze_dataset_profile_with_ai(profile, question, model_id="gpt-4o", dataset_version=None):
+    """Analyze a dataset from its stored statistics profile; prompt size is O(columns).
+
+    With a dataset_version (which names the table, see utils.get_table_version) the
+    response is cached against (model, question, version); otherwise the full
+    prompt, which embeds the dataset summary, is the fingerprint.
+    """
+    model_id, model_config = _resolve_model(model_id)
+    
+    if not model_id:
+        return {"error": "No AI models are available. Please configure API keys."}
+    
+    # Prepare dataset summary for context
+    context_prompt = _analysis_prompt(profile, question)
+    
+    fingerprint = _analysis_fingerprint(question, context_prompt, dataset_version)
+    cached = get_cached_response(model_id, fingerprint, dataset_version)
+    if cached:
+        cached['cached'] = True
+        return cached
     
     try:
         if model_config["provider"] == "openai":
@@ -87,7 +135,7 @@ def analyze_dataset_with_ai(dataset_df, question, model_id="gpt-4o"):
                 messages=[
                     {
                         "role": "system",
-                        "content": "You are a data analyst expert. Provide clear, actionable insights about datasets based on their structure and content."
+                        "content": ANALYST_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -96,7 +144,7 @@ def analyze_dataset_with_ai(dataset_df, question, model_id="gpt-4o"):
                 ],
                 max_tokens=model_config["max_tokens"]
             )
-            return {
+            result = {
                 "response": response.choices[0].message.content,
                 "model_used": model_config["name"],
                 "provider": "OpenAI"
@@ -112,110 +160,256 @@ def analyze_dataset_with_ai(dataset_df, question, model_id="gpt-4o"):
                         "content": context_prompt
                     }
                 ],
-                system="You are a data analyst expert. Provide clear, actionable insights about datasets based on their structure and content."
+                system=ANALYST_SYSTEM_PROMPT
             )
-            return {
+            result = {
                 "response": response.content[0].text,
                 "model_used": model_config["name"],
                 "provider": "Anthropic"
             }
+        
+        store_response(model_id, fingerprint, result, dataset_version)
+        return result
             
     except Exception as e:
         return {"error": f"AI analysis failed: {str(e)}"}
 
-def generate_file_description(file_path, file_name, file_extension):
-    """Generate AI description for a file based on its path, name, and extension"""
-    if not openai_client:
-        return "AI descriptions require OpenAI API key configuration"
+def stream_dataset_analysis_with_ai(dataset_df, question, model_id="gpt-4o", dataset_version=None):
+    """Streaming variant of analyze_dataset_with_ai; see stream_dataset_profile_analysis"""
+    profile = profile_rows(list(dataset_df.columns), dataset_df.itertuples(index=False, name=None))
+    return stream_dataset_profile_analysis(profile, question, model_id, dataset_version)
+
+def _stream_text(model_id, model_config, context_prompt):
+    """Yield the completion's text deltas from the provider's streaming API"""
+    if model_config["provider"] == "openai":
+        stream = openai_client.chat.completions.create(
+            model=model_id,
+            messages=[
+                {
+                    "role": "system",
+                    "content": ANALYST_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": context_prompt
+                }
+            ],
+            max_tokens=model_config["max_tokens"],
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()  # Stops generation if the client went away
+    else:
+        with anthropic_client.messages.stream(
+            model=model_id,
+            max_tokens=model_config["max_tokens"],
+            messages=[
+                {
+                    "role": "user",
+                    "content": context_prompt
+                }
+            ],
+            system=ANALYST_SYSTEM_PROMPT
+        ) as stream:
+            yield from stream.text_stream
+
+def stream_dataset_profile_analysis(profile, question, model_id="gpt-4o", dataset_version=None):
+    """Analyze a dataset profile, yielding (event, payload) pairs as the answer arrives.
+
+    Events are 'start' (model details), 'token' ({'text'}), then 'done' with the
+    same result dict analyze_dataset_profile_with_ai returns, or 'failed' ({'error'}).
+    Complete answers are cached exactly like the non-streaming call.
+    """
+    model_id, model_config = _resolve_model(model_id)
+    if not model_id:
+        yield "failed", {"error": "No AI models are available. Please configure API keys."}
+        return
+    
+    provider = "OpenAI" if model_config["provider"] == "openai" else "Anthropic"
+    context_prompt = _analysis_prompt(profile, question)
+    fingerprint = _analysis_fingerprint(question, context_prompt, dataset_version)
+    yield "start", {"model_used": model_config["name"], "provider": provider}
     
+    cached = get_cached_response(model_id, fingerprint, dataset_version)
+    if cached:
+        cached['cached'] = True
+        yield "token", {"text": cached.get("response") or ""}
+        yield "done", cached
+        return
+    
+    started = time.perf_counter()
+    first_token = None
+    parts = []
     try:
-        prompt = f"""
-        Analyze this file and provide a brief, professional description of what it likely contains:
-        
-        File path: {file_path}
-        File name: {file_name}
-        File extension: {file_extension}
-        
-        Based on the file name, extension, and path structure, describe what this file likely contains and its purpose.
-        Keep the description concise (1-2 sentences) and professional.
-        
-        Respond with JSON in this format:
-        {{"description": "your description here"}}
-        """
-        
-        response = openai.chat.completions.create(
-            model="gpt-4o",
+        for text in _stream_text(model_id, model_config, context_prompt):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                AI_FIRST_TOKEN_SECONDS.observe(first_token, model=model_id)
+                logger.info(f"AI analysis first token from {model_id} after {first_token:.3f}s")
+            parts.append(text)
+            yield "token", {"text": text}
+    except Exception as e:
+        logger.warning(f"AI analysis stream from {model_id} failed: {e}")
+        yield "failed", {"error": f"AI analysis failed: {str(e)}"}
+        return
+    
+    total = time.perf_counter() - started
+    AI_STREAM_SECONDS.observe(total, model=model_id)
+    result = {
+        "response": "".join(parts),
+        "model_used": model_config["name"],
+        "provider": provider,
+        "first_token_seconds": round(first_token, 3) if first_token is not None else None,
+        "total_seconds": round(total, 3)
+    }
+    store_response(model_id, fingerprint, result, dataset_version)
+    yield "done", result
+
+def _path_version(path):
+    """Use the file's mtime as its version so edited files get fresh descriptions"""
+    try:
+        return str(os.path.getmtime(path))
+    except (OSError, TypeError):
+        return None
+
+DESCRIPTION_MODEL = os.environ.get("AI_DESCRIPTION_MODEL", "gpt-4o")
+DESCRIPTION_UNAVAILABLE = "AI descriptions require an OpenAI or Anthropic API key configuration"
+FILE_ANALYST_PROMPT = "You are a technical file analyst. Provide accurate, concise descriptions of files based on their names and extensions."
+FOLDER_ANALYST_PROMPT = "You are a technical folder analyst. Provide accurate, concise descriptions of folders based on their names and contents."
+MAX_CHILD_DESCRIPTIONS = 20
+
+def description_provider():
+    """Provider ('openai' or 'anthropic') used for file and folder descriptions, or None"""
+    model_id, model_config = _resolve_model(DESCRIPTION_MODEL)
+    return model_config["provider"] if model_id else None
+
+def _describe(system_prompt, prompt, version, fallback, max_retries=None):
+    """Ask the description model for a one-line JSON description; raises on provider errors.
+
+    max_retries overrides the client's own retry count, e.g. 0 when the caller
+    retries with its own backoff.
+    """
+    model_id, model_config = _resolve_model(DESCRIPTION_MODEL)
+    if not model_id:
+        raise RuntimeError(DESCRIPTION_UNAVAILABLE)
+    
+    fingerprint = prompt_fingerprint(prompt)
+    cached = get_cached_response(model_id, fingerprint, version)
+    if cached:
+        return cached["description"]
+    
+    if model_config["provider"] == "openai":
+        client = openai_client if max_retries is None else openai_client.with_options(max_retries=max_retries)
+        response = client.chat.completions.create(
+            model=model_id,
             messages=[
                 {
                     "role": "system",
-                    "content": "You are a technical file analyst. Provide accurate, concise descriptions of files based on their names and extensions."
+                    "content": system_prompt
                 },
                 {
-                    "role": "user", 
+                    "role": "user",
                     "content": prompt
                 }
             ],
             response_format={"type": "json_object"},
             max_tokens=150
         )
-        
         content = response.choices[0].message.content
-        if content:
-            result = json.loads(content)
-            return result.get("description", "File description unavailable")
-        else:
-            return "File description unavailable"
+    else:
+        client = anthropic_client if max_retries is None else anthropic_client.with_options(max_retries=max_retries)
+        response = client.messages.create(
+            model=model_id,
+            max_tokens=150,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            system=system_prompt
+        )
+        content = response.content[0].text if response.content else None
+    
+    if not content:
+        return fallback
+    try:
+        description = json.loads(content).get("description", fallback)
+    except (ValueError, AttributeError):
+        description = content.strip()  # Anthropic has no JSON mode; take plain text as is
+    store_response(model_id, fingerprint, {"description": description}, version)
+    return description
+
+def describe_file(file_path, file_name, file_extension, max_retries=None):
+    """Describe a file from its path, name and extension; raises on provider errors"""
+    prompt = f"""
+        Analyze this file and provide a brief, professional description of what it likely contains:
         
-    except Exception as e:
-        return f"Unable to generate description: {str(e)}"
+        File path: {file_path}
+        File name: {file_name}
+        File extension: {file_extension}
+        
+        Based on the file name, extension, and path structure, describe what this file likely contains and its purpose.
+        Keep the description concise (1-2 sentences) and professional.
+        
+        Respond with JSON in this format:
+        {{"description": "your description here"}}
+        """
+    return _describe(FILE_ANALYST_PROMPT, prompt, _path_version(file_path), "File description unavailable",
+                     max_retries)
 
-def generate_folder_description(folder_path, folder_name, file_list):
-    """Generate AI description for a folder based on its contents"""
-    if not openai_client:
-        return "AI descriptions require OpenAI API key configuration"
+def describe_folder(folder_path, folder_name, file_list, child_descriptions=None, max_retries=None):
+    """Describe a folder from its name and contents; raises on provider errors.
+
+    child_descriptions maps child names to their own descriptions, so folders
+    can be described bottom-up from what is already known about their contents.
+    """
+    file_summary = ", ".join(file_list[:10])  # First 10 files
+    if len(file_list) > 10:
+        file_summary += f" and {len(file_list) - 10} more files"
     
-    try:
-        file_summary = ", ".join(file_list[:10])  # First 10 files
-        if len(file_list) > 10:
-            file_summary += f" and {len(file_list) - 10} more files"
-            
-        prompt = f"""
+    described = ""
+    if child_descriptions:
+        lines = [f"- {name}: {text}" for name, text in list(child_descriptions.items())[:MAX_CHILD_DESCRIPTIONS]]
+        described = "Descriptions of its contents:\n        " + "\n        ".join(lines) + "\n        "
+    
+    prompt = f"""
         Analyze this folder and provide a brief description of what it contains:
         
         Folder path: {folder_path}
         Folder name: {folder_name}
         Contains: {file_summary}
         Total files: {len(file_list)}
-        
+        {described}
         Based on the folder name, path, and contents, describe what this folder is used for.
         Keep the description concise (1-2 sentences) and professional.
         
         Respond with JSON in this format:
         {{"description": "your description here"}}
         """
-        
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a technical folder analyst. Provide accurate, concise descriptions of folders based on their names and contents."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=150
-        )
-        
-        content = response.choices[0].message.content
-        if content:
-            result = json.loads(content)
-            return result.get("description", "Folder description unavailable")
-        else:
-            return "Folder description unavailable"
-        
+    return _describe(FOLDER_ANALYST_PROMPT, prompt, _path_version(folder_path), "Folder description unavailable",
+                     max_retries)
+
+def generate_file_description(file_path, file_name, file_extension):
+    """Generate AI description for a file based on its path, name, and extension"""
+    if not description_provider():
+        return DESCRIPTION_UNAVAILABLE
+    
+    try:
+        return describe_file(file_path, file_name, file_extension)
+    except Exception as e:
+        return f"Unable to generate description: {str(e)}"
+
+def generate_folder_description(folder_path, folder_name, file_list, child_descriptions=None):
+    """Generate AI description for a folder based on its contents"""
+    if not description_provider():
+        return DESCRIPTION_UNAVAILABLE
+    
+    try:
+        return describe_folder(folder_path, folder_name, file_list, child_descriptions)
     except Exception as e:
-        return f"Unable to generate description: {str(e)}"
\ No newline at end of file
+        return f"Unable to generate description: {str(e)}"
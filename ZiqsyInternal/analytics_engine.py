@@ -0,0 +1,267 @@
+"""
+Read-only analytical SQL over page datasets.
+Queries run in an in-process DuckDB database instead of MySQL. Each dynamic
+table a query names as page_<id> is loaded once per table version, from its
+columnar snapshot when one is current (see table_snapshots.py) or else
+streamed off the read replica, and kept in DuckDB as a typed table, so aggregates and
+joins across pages run on the in-memory copy. Every query checks the copy
+against the table's version counter (a primary key lookup) and reloads it when
+the table has changed; the least recently used tables are dropped beyond
+ANALYTICS_MAX_TABLES.
+
+Only single SELECT statements are accepted, DuckDB's file system access is
+switched off, and every query runs under a time budget (interrupted when it
+runs out) and a row budget (results are truncated).
+
+DuckDB is optional; without the duckdb package queries fail with a ValueError.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+import pandas as pd
+from sqlalchemy import text
+
+from db_routing import read_connection
+from dataset_profile import column_type
+from models import DynamicTable, Page
+from table_snapshots import read_snapshot
+from utils import EXPORT_BATCH_ROWS, get_table_columns, get_table_profile, get_table_version
+
+ANALYTICS_MEMORY_LIMIT = os.environ.get('ANALYTICS_MEMORY_LIMIT', '1GB')
+ANALYTICS_THREADS = int(os.environ.get('ANALYTICS_THREADS', '4'))
+ANALYTICS_MAX_TABLES = int(os.environ.get('ANALYTICS_MAX_TABLES', '16'))
+DEFAULT_MAX_ROWS = 1000
+MAX_ROWS = 10000
+DEFAULT_TIMEOUT_SECONDS = 10
+MAX_TIMEOUT_SECONDS = 60
+# Declared column type -> DuckDB type (see column_types.py)
+SCHEMA_TYPES = {'BOOLEAN': 'BOOLEAN', 'INT': 'INTEGER', 'BIGINT': 'BIGINT', 'DOUBLE': 'DOUBLE', 'DATETIME': 'TIMESTAMP'}
+# Profiled type of a text column -> DuckDB type; text booleans ('yes', 'N') stay text
+PROFILE_TYPES = {'integer': 'BIGINT', 'float': 'DOUBLE', 'datetime': 'TIMESTAMP'}
+PAGE_TABLE = re.compile(r'\bpage_(\d+)\b', re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_engine = None
+_tables = OrderedDict()  # page_<id> -> loaded table info, least recently used first
+_load_locks = {}  # page_<id> -> lock held while that table loads
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ValueError('Analytical queries require the duckdb package')
+    return duckdb
+
+
+def get_engine():
+    """The process-wide DuckDB database, created on first use"""
+    global _engine
+    if _engine is not None:
+        return _engine
+    duckdb = _duckdb()
+    with _lock:
+        if _engine is None:
+            engine = duckdb.connect(':memory:', config={'memory_limit': ANALYTICS_MEMORY_LIMIT,
+                                                        'threads': ANALYTICS_THREADS})
+            # Tables are loaded from Python, so queries never need the file system
+            engine.execute('SET enable_external_access = false')
+            engine.execute('SET lock_configuration = true')
+            _engine = engine
+    return _engine
+
+
+# Loading dynamic tables
+
+def column_types(table_name, columns):
+    """Column -> DuckDB type, from the declared schema or, for text columns, the profile"""
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    schema = dynamic_table.get_schema() if dynamic_table else {}
+    profile = get_table_profile(table_name)['columns']
+    types = {}
+    for column in columns:
+        if column == 'id':
+            types[column] = 'BIGINT'
+        elif column in ('created_at', 'updated_at'):
+            types[column] = 'TIMESTAMP'
+        elif schema.get(column) in SCHEMA_TYPES:
+            types[column] = SCHEMA_TYPES[schema[column]]
+        elif column in profile:
+            types[column] = PROFILE_TYPES.get(column_type(profile[column]), 'VARCHAR')
+        else:
+            types[column] = 'VARCHAR'
+    return types
+
+
+def _load_table(engine, name, table_name, version):
+    """Copy a dynamic table into DuckDB as name; returns the loaded table info"""
+    started = time.perf_counter()
+    columns = get_table_columns(table_name)
+    types = column_types(table_name, columns)
+    staging = f'"{name}__staging"'
+    casts = [f'"{column}"' if types[column] == 'VARCHAR' else f'TRY_CAST("{column}" AS {types[column]}) AS "{column}"'
+             for column in columns]
+    conn = engine.cursor()
+    snapshot = read_snapshot(table_name, version)
+    if snapshot is not None:
+        # Scanned straight out of the memory-mapped snapshot file
+        try:
+            conn.register('snapshot', snapshot)
+            conn.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT {", ".join(casts)} FROM snapshot')
+            conn.unregister('snapshot')
+        finally:
+            conn.close()
+        return _loaded(name, table_name, version, snapshot.num_rows, started, 'snapshot')
+
+    rows = 0
+    try:
+        # Values arrive as text and are cast once at the end, so batches never disagree on types
+        conn.execute(f'CREATE OR REPLACE TEMP TABLE {staging} ('
+                     + ', '.join(f'"{column}" VARCHAR' for column in columns) + ')')
+        # Stamped on the connection that reads the rows, so a lagging replica can't mislabel the copy
+        with read_connection() as source:
+            version = get_table_version(table_name, source)
+            result = source.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS).execute(
+                text(f'SELECT * FROM "{table_name}" ORDER BY id'))
+            batch_columns = list(result.keys())
+            for batch in result.partitions(EXPORT_BATCH_ROWS):
+                frame = pd.DataFrame([[None if value is None else str(value) for value in row] for row in batch],
+                                     columns=batch_columns, dtype=object)
+                names = ', '.join(f'"{column}"' for column in batch_columns)
+                conn.register('batch', frame)
+                conn.execute(f'INSERT INTO {staging} ({names}) SELECT * FROM batch')
+                conn.unregister('batch')
+                rows += len(batch)
+        conn.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT {", ".join(casts)} FROM {staging}')
+        conn.execute(f'DROP TABLE {staging}')
+    finally:
+        conn.close()
+    return _loaded(name, table_name, version, rows, started, 'database')
+
+
+def _loaded(name, table_name, version, rows, started, source):
+    load_seconds = time.perf_counter() - started
+    logger.info(f"Loaded {table_name} into the analytics engine as {name} from the {source}: "
+                f"{rows} rows in {load_seconds:.2f}s")
+    return {'name': name, 'table_name': table_name, 'version': version, 'rows': rows, 'source': source,
+            'loaded_at': datetime.utcnow().isoformat(), 'load_seconds': round(load_seconds, 4)}
+
+
+def ensure_loaded(page, keep=()):
+    """Load or refresh page's table as page_<id>; tables named in keep are never evicted"""
+    engine = get_engine()
+    name = f'page_{page.id}'
+    with _lock:
+        load_lock = _load_locks.setdefault(name, threading.Lock())
+
+    with load_lock:
+        version = get_table_version(page.table_name)
+        info = _tables.get(name)
+        if not (info and info['table_name'] == page.table_name and info['version'] == version):
+            info = _load_table(engine, name, page.table_name, version)
+
+        with _lock:
+            _tables[name] = info
+            _tables.move_to_end(name)
+            evict = [other for other in _tables if other not in keep and other != name]
+            evict = evict[:max(0, len(_tables) - ANALYTICS_MAX_TABLES)]
+            for other in evict:
+                del _tables[other]
+        if evict:
+            conn = engine.cursor()
+            try:
+                for other in evict:
+                    conn.execute(f'DROP TABLE IF EXISTS "{other}"')
+            finally:
+                conn.close()
+    return info
+
+
+# Queries
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+
+def run_query(sql, max_rows=DEFAULT_MAX_ROWS, timeout=DEFAULT_TIMEOUT_SECONDS):
+    """Run one read-only SELECT over page datasets, named page_<id> in the SQL.
+
+    Returns the columns, up to max_rows rows and the tables it read. Raises
+    ValueError for rejected or failing queries and when the time budget runs out.
+    """
+    duckdb = _duckdb()
+    sql = (sql or '').strip().rstrip(';').strip()
+    if not sql:
+        raise ValueError('Query is empty')
+    max_rows = max(1, min(int(max_rows), MAX_ROWS))
+    timeout = max(0.1, min(float(timeout), MAX_TIMEOUT_SECONDS))
+
+    # Connections (cursors) are per thread; the engine itself is shared
+    engine = get_engine()
+    conn = engine.cursor()
+    try:
+        statements = conn.extract_statements(sql)
+    except duckdb.Error as e:
+        raise ValueError(str(e))
+    finally:
+        conn.close()
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError('Only a single SELECT query is allowed')
+
+    page_ids = sorted({int(page_id) for page_id in PAGE_TABLE.findall(sql)})
+    if not page_ids:
+        raise ValueError('Name at least one dataset as page_<id>, e.g. SELECT COUNT(*) FROM page_12')
+    pages = {page.id: page for page in Page.query.filter(Page.id.in_(page_ids))}
+    missing = [page_id for page_id in page_ids if page_id not in pages or not pages[page_id].table_name]
+    if missing:
+        raise ValueError(f"No dataset for page {', '.join(str(page_id) for page_id in missing)}")
+    keep = {f'page_{page_id}' for page_id in page_ids}
+    tables = [ensure_loaded(pages[page_id], keep) for page_id in page_ids]
+
+    conn = engine.cursor()
+    timer = threading.Timer(timeout, conn.interrupt)
+    started = time.perf_counter()
+    timer.start()
+    try:
+        # The newline keeps a trailing -- comment from swallowing the wrapper
+        conn.execute(f'SELECT * FROM ({sql}\n) AS query LIMIT {max_rows + 1}')
+        columns = [description[0] for description in conn.description]
+        rows = conn.fetchall()
+    except duckdb.InterruptException:
+        raise ValueError(f'Query exceeded the {timeout:g} second time budget')
+    except duckdb.Error as e:
+        raise ValueError(str(e))
+    finally:
+        timer.cancel()
+        conn.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'columns': columns,
+        'rows': [[_json_value(value) for value in row] for row in rows[:max_rows]],
+        'row_count': min(len(rows), max_rows),
+        'truncated': len(rows) > max_rows,
+        'max_rows': max_rows,
+        'elapsed_seconds': round(elapsed, 4),
+        'tables': [{key: info[key] for key in ('name', 'table_name', 'rows', 'version', 'source', 'loaded_at',
+                                               'load_seconds')}
+                   for info in tables]
+    }
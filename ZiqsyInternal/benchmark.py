@@ -0,0 +1,555 @@
+"""
+Reproducible load test and benchmark suite.
+
+Builds synthetic datasets (10k, 100k and 1M rows by default) in a throwaway
+SQLite database, or in the MySQL stand-in given with --database-url, then
+measures:
+
+- ingestion rows/sec and peak RSS of process_uploaded_file, each size in a
+  forked child so its memory high-water mark isn't shared with other runs
+- throughput and p50/p99 latency of /upload_file, /api/page/<id>/data,
+  /export/<id>, /dashboard and /api/repository/<id>/files through the Flask
+  test client (no network, so the numbers are application + database time)
+
+Results are written as JSON so runs can be compared between versions:
+
+    python benchmark.py --output results/main.json
+    python benchmark.py --sizes 10000,100000 --baseline results/main.json
+    python benchmark.py --compare results/main.json results/branch.json
+
+With --baseline or --compare the exit status is 1 when any metric regressed
+by more than --regression-threshold.
+"""
+
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = '10000,100000,1000000'
+CATEGORIES = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta', 'iota', 'kappa']
+
+# Metrics compared against a baseline, and whether a larger value is better
+COMPARED_METRICS = {
+    'seconds': False,
+    'p50_ms': False,
+    'p99_ms': False,
+    'requests_per_second': True,
+    'rows_per_second': True,
+    'peak_rss_mb': False
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Ziqsy load test and benchmark suite')
+    parser.add_argument('--database-url', help='Database to benchmark against (default: SQLite in the work directory)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated dataset row counts')
+    parser.add_argument('--iterations', type=int, default=50, help='Requests per read endpoint measurement')
+    parser.add_argument('--export-iterations', type=int, default=3, help='Full exports per dataset size')
+    parser.add_argument('--upload-iterations', type=int, default=5, help='Uploads through /upload_file')
+    parser.add_argument('--upload-rows', type=int, default=10000, help='Rows per file sent to /upload_file')
+    parser.add_argument('--repository-files', type=int, default=1000, help='Files listed by the repository page')
+    parser.add_argument('--concurrency', type=int, default=4, help='Client threads for read endpoints')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic data')
+    parser.add_argument('--workdir', help='Directory for generated files and the SQLite database')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+    parser.add_argument('--baseline', help='Compare this run against an earlier results file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two results files and exit')
+    parser.add_argument('--regression-threshold', type=float, default=0.2,
+                        help='Relative change that counts as a regression (0.2 = 20%%)')
+    parser.add_argument('--keep-data', action='store_true', help='Keep the work directory and benchmark rows')
+    return parser.parse_args(argv)
+
+
+# Synthetic data
+
+def write_dataset(path, rows, seed):
+    """Write a CSV with text, integer, decimal, date and boolean columns"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Record Code', 'Customer Name', 'Category', 'Amount', 'Quantity', 'Order Date',
+                         'Active', 'Notes'])
+        for i in range(rows):
+            writer.writerow([
+                f'R{i:08d}',
+                f'Customer {rng.randint(1, rows // 10 + 1)}',
+                rng.choice(CATEGORIES),
+                f'{rng.uniform(1, 10000):.2f}',
+                rng.randint(1, 500),
+                (start + timedelta(minutes=rng.randint(0, 525600))).strftime('%Y-%m-%d'),
+                rng.choice(['true', 'false']),
+                '' if rng.random() < 0.3 else ' '.join(rng.choice(CATEGORIES) for _ in range(rng.randint(3, 12)))
+            ])
+    return path
+
+
+def write_folder_tree(root, files, per_folder=20, fanout=5):
+    """Spread files over nested folders (fanout subfolders each); returns their paths"""
+    paths = []
+    folders = [root]
+    while len(paths) < files:
+        folder = folders.pop(0)
+        os.makedirs(folder, exist_ok=True)
+        for i in range(min(per_folder, files - len(paths))):
+            path = os.path.join(folder, f'file_{len(paths)}.{("csv", "pdf", "txt", "xlsx")[i % 4]}')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('x' * (len(paths) % 4096))
+            paths.append(path)
+        folders.extend(os.path.join(folder, f'folder_{j}') for j in range(fanout))
+    return paths
+
+
+# Statistics
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (pct in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    """Latency percentiles in milliseconds plus throughput for one measurement"""
+    ms = [value * 1000 for value in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(ms, 50), 3) if ms else None,
+        'p90_ms': round(percentile(ms, 90), 3) if ms else None,
+        'p99_ms': round(percentile(ms, 99), 3) if ms else None,
+        'mean_ms': round(statistics.mean(ms), 3) if ms else None,
+        'max_ms': round(max(ms), 3) if ms else None,
+        'requests_per_second': round(len(latencies) / wall_seconds, 3) if wall_seconds > 0 else None
+    }
+
+
+# Memory
+
+def _read_proc_status(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])  # kB
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset VmHWM so the next reading covers only what follows (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    peak = _read_proc_status('VmHWM')
+    if peak is not None:
+        return peak
+    # ru_maxrss is kB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
+
+def current_rss_kb():
+    return _read_proc_status('VmRSS')
+
+
+# Benchmark fixtures
+
+class Fixture:
+    """Benchmark user, section and pages created in the target database"""
+
+    def __init__(self, app, db, models):
+        self.app = app
+        self.db = db
+        self.models = models
+        self.user_id = None
+        self.section_id = None
+        self.page_ids = []
+        self.table_names = []
+
+    def setup(self, repository_files, workdir):
+        User, Section, FileRepository = self.models.User, self.models.Section, self.models.FileRepository
+        stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        user = User(email=f'benchmark-{stamp}@ziqsy.local', is_admin=True)
+        user.set_password(os.urandom(16).hex())
+        section = Section(name=f'Benchmark {stamp}')
+        self.db.session.add_all([user, section])
+        self.db.session.flush()
+        self.user_id, self.section_id = user.id, section.id
+
+        # A folder tree for the repository page, with stored descriptions for every tenth file
+        repository = self.add_page('Benchmark Repository', 'repository')
+        folder = os.path.join(workdir, 'repository')
+        paths = write_folder_tree(folder, repository_files)
+        self.db.session.add(self.models.CloudFolder(page_id=repository, folder_path=folder,
+                                                    folder_name='Benchmark Repository'))
+        self.db.session.bulk_save_objects([
+            FileRepository(page_id=repository, file_path=path, file_name=os.path.basename(path),
+                           ai_description=f'Synthetic file {i}')
+            for i, path in enumerate(paths) if i % 10 == 0
+        ])
+        self.db.session.commit()
+        self.repository_page_id = repository
+        self.repository_folder = os.path.relpath(os.path.dirname(paths[-1]), folder).replace(os.sep, '/') \
+            if paths else ''
+
+    def add_page(self, name, page_type='dataset'):
+        page = self.models.Page(name=name, page_type=page_type, section_id=self.section_id)
+        self.db.session.add(page)
+        self.db.session.commit()
+        self.page_ids.append(page.id)
+        return page.id
+
+    def login(self, client):
+        with client.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+            sess['is_admin'] = True
+
+    def client(self):
+        client = self.app.test_client()
+        self.login(client)
+        return client
+
+    def teardown(self):
+        """Remove everything the run created (for shared MySQL stand-ins)"""
+        from sqlalchemy import text
+        m = self.models
+        session = self.db.session
+        session.rollback()
+        for table_name in self.table_names:
+            session.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+        for model in (m.DatasetProfile, ):
+            session.query(model).filter(model.table_name.in_(self.table_names)).delete(synchronize_session=False)
+        for model in (m.DynamicTable, m.FileRepository, m.CloudFolder, m.RepositoryFileIndex):
+            session.query(model).filter(model.page_id.in_(self.page_ids)).delete(synchronize_session=False)
+        session.query(m.BackgroundJob).filter(m.BackgroundJob.created_by == self.user_id).delete(
+            synchronize_session=False)
+        session.query(m.Page).filter(m.Page.id.in_(self.page_ids)).delete(synchronize_session=False)
+        session.query(m.Section).filter(m.Section.id == self.section_id).delete(synchronize_session=False)
+        session.query(m.User).filter(m.User.id == self.user_id).delete(synchronize_session=False)
+        session.commit()
+
+
+# Measurements
+
+def _ingest_child(conn, app, db, page_id, filepath):
+    """Runs in a forked child: ingest one file and report timing and peak memory"""
+    from models import Page
+    from utils import process_uploaded_file
+    try:
+        with app.app_context():
+            db.engine.dispose(close=False)  # Don't share the parent's pooled connections
+            page = db.session.get(Page, page_id)
+            baseline_kb = current_rss_kb()
+            reset = reset_peak_rss()
+            started = time.perf_counter()
+            result = process_uploaded_file(filepath, page)
+            elapsed = time.perf_counter() - started
+            conn.send({'result': result, 'seconds': elapsed, 'peak_rss_kb': peak_rss_kb(),
+                       'baseline_rss_kb': baseline_kb, 'peak_reset': reset})
+    except Exception as e:
+        conn.send({'result': {'success': False, 'message': str(e)}, 'seconds': 0.0, 'peak_rss_kb': None,
+                   'baseline_rss_kb': None, 'peak_reset': False})
+    finally:
+        conn.close()
+
+
+def measure_ingest(app, db, page_id, filepath, rows):
+    """Ingestion rows/sec and peak RSS for process_uploaded_file"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_ingest_child, args=(child_conn, app, db, page_id, filepath))
+        process.start()
+        child_conn.close()
+        report = parent_conn.recv()
+        process.join()
+        isolated = True
+    else:
+        # Without fork the peak includes everything the benchmark process did before
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        _ingest_child(child_conn, app, db, page_id, filepath)
+        report = parent_conn.recv()
+        isolated = False
+
+    result = report['result']
+    seconds = report['seconds']
+    peak = report['peak_rss_kb']
+    baseline = report['baseline_rss_kb']
+    return {
+        'rows': rows,
+        'success': bool(result.get('success')),
+        'message': result.get('message'),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+        'file_mb': round(os.path.getsize(filepath) / (1024 * 1024), 2),
+        'peak_rss_mb': round(peak / 1024, 1) if peak else None,
+        'peak_rss_growth_mb': round((peak - baseline) / 1024, 1) if peak and baseline else None,
+        'isolated_process': isolated and report['peak_reset']
+    }
+
+
+def measure_requests(fixture, make_request, iterations, concurrency=1, check=None):
+    """Issue iterations requests from concurrency logged-in clients; summarize latency"""
+    concurrency = max(1, min(concurrency, iterations))
+    per_worker = [iterations // concurrency + (1 if i < iterations % concurrency else 0)
+                  for i in range(concurrency)]
+
+    def worker(worker_id, count):
+        client = fixture.client()
+        rng = random.Random(worker_id)
+        latencies, errors = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            response = make_request(client, rng)
+            response.get_data()  # Drain streamed bodies so the full response is timed
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400 or (check and not check(response)):
+                errors += 1
+            response.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        outcomes = [worker(0, iterations)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(worker, range(concurrency), per_worker))
+    wall = time.perf_counter() - started
+
+    latencies = [value for outcome in outcomes for value in outcome[0]]
+    return summarize(latencies, wall, errors=sum(outcome[1] for outcome in outcomes))
+
+
+def measure_uploads(fixture, job_queue, filepath, iterations, rows):
+    """Request latency of /upload_file plus time until the queued job finishes"""
+    page_id = fixture.add_page('Benchmark Uploads')
+    client = fixture.client()
+    request_latencies, job_latencies, errors = [], [], 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with open(filepath, 'rb') as f:
+            sent = time.perf_counter()
+            response = client.post(f'/upload_file/{page_id}', data={'file': (f, 'benchmark.csv')},
+                                   headers={'Accept': 'application/json'}, content_type='multipart/form-data')
+        request_latencies.append(time.perf_counter() - sent)
+        if response.status_code != 202:
+            errors += 1
+            continue
+        job_id = response.get_json()['job_id']
+        while True:
+            job = job_queue.get(job_id)
+            if job and job['status'] in ('succeeded', 'failed'):
+                break
+            time.sleep(0.01)
+        job_latencies.append(time.perf_counter() - sent)
+        if job['status'] != 'succeeded' or not (job.get('result') or {}).get('success'):
+            errors += 1
+    wall = time.perf_counter() - started
+
+    summary = summarize(request_latencies, wall, errors=errors)
+    jobs = summarize(job_latencies, wall)
+    summary['job_p50_ms'] = jobs['p50_ms']
+    summary['job_p99_ms'] = jobs['p99_ms']
+    summary['rows_per_second'] = round(rows * len(job_latencies) / sum(job_latencies), 1) if job_latencies else None
+    return page_id, summary
+
+
+# Comparison
+
+def compare_results(old, new, threshold):
+    """Print per-metric changes; returns the list of regressions"""
+    regressions = []
+    old_benchmarks = old.get('benchmarks', {})
+    print(f"{'benchmark':<32} {'metric':<22} {'old':>12} {'new':>12} {'change':>8}")
+    for name, metrics in sorted(new.get('benchmarks', {}).items()):
+        previous = old_benchmarks.get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = previous.get(metric), metrics.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > threshold:
+                regressions.append((name, metric, before, after))
+                flag = '  REGRESSION'
+            print(f'{name:<32} {metric:<22} {before:>12,.2f} {after:>12,.2f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runner
+
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='ziqsy-benchmark-'))
+    os.makedirs(workdir, exist_ok=True)
+    output = os.path.abspath(args.output)
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+
+    # Configure the app before it is imported; uploads, exports and journals stay in workdir
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['TEMP_STORAGE_JOURNAL'] = os.path.join(workdir, 'temp_storage.journal')
+    os.environ['PROFILE_FOLDER'] = os.path.join(workdir, 'profiles')
+    os.environ['MAX_UPLOAD_MB'] = os.environ.get('MAX_UPLOAD_MB', '256')
+    os.chdir(workdir)
+    sys.path.insert(0, SCRIPT_DIR)
+
+    from app import app, db
+    import models
+    from jobs import job_queue
+    from utils import process_uploaded_file  # noqa: F401 (imported before forking)
+
+    benchmarks = {}
+    fixture = Fixture(app, db, models)
+    with app.app_context():
+        fixture.setup(args.repository_files, workdir)
+        dialect = db.engine.dialect.name
+
+        datasets = {}
+        for size in sizes:
+            filepath = write_dataset(os.path.join(workdir, f'dataset_{size}.csv'), size, args.seed)
+            page_id = fixture.add_page(f'Benchmark {size}')
+            print(f'Ingesting {size:,} rows...', flush=True)
+            db.session.remove()
+            result = measure_ingest(app, db, page_id, filepath, size)
+            benchmarks[f'ingest/{size}'] = result
+            if not result['success']:
+                raise RuntimeError(f"Ingestion of {size} rows failed: {result['message']}")
+            page = db.session.get(models.Page, page_id)
+            fixture.table_names.append(page.table_name)
+            datasets[size] = page_id
+            os.remove(filepath)
+
+        for size, page_id in datasets.items():
+            print(f'Measuring reads on {size:,} rows...', flush=True)
+            benchmarks[f'page_data/{size}'] = measure_requests(
+                fixture,
+                lambda client, rng, page_id=page_id, size=size: client.get(
+                    f'/api/page/{page_id}/data?limit=100&sort=amount&offset={rng.randrange(0, max(1, size - 100))}'),
+                args.iterations, args.concurrency)
+            benchmarks[f'page_data_filtered/{size}'] = measure_requests(
+                fixture,
+                lambda client, rng, page_id=page_id: client.get(
+                    f'/api/page/{page_id}/data?limit=100&sort=amount&eq_category={rng.choice(CATEGORIES)}'),
+                args.iterations, args.concurrency)
+            export = measure_requests(
+                fixture, lambda client, rng, page_id=page_id: client.get(f'/export/{page_id}?format=csv'),
+                args.export_iterations, 1)
+            export['rows_per_second'] = round(size * export['requests_per_second'], 1)
+            benchmarks[f'export/{size}'] = export
+
+        print('Measuring dashboard and repository listing...', flush=True)
+        benchmarks['dashboard'] = measure_requests(
+            fixture, lambda client, rng: client.get('/dashboard'), args.iterations, args.concurrency)
+        repository_url = f'/api/repository/{fixture.repository_page_id}/files'
+        started = time.perf_counter()
+        fixture.client().get(repository_url).close()  # First load builds the file index
+        benchmarks[f'repository_index_build/{args.repository_files}'] = {
+            'seconds': round(time.perf_counter() - started, 3)}
+        benchmarks[f'repository_files/{args.repository_files}'] = measure_requests(
+            fixture, lambda client, rng: client.get(repository_url), args.iterations, args.concurrency)
+        benchmarks[f'repository_files_nested/{args.repository_files}'] = measure_requests(
+            fixture, lambda client, rng: client.get(f'{repository_url}?path={fixture.repository_folder}'),
+            args.iterations, args.concurrency)
+
+        print(f'Measuring uploads of {args.upload_rows:,} rows...', flush=True)
+        upload_file = write_dataset(os.path.join(workdir, 'upload.csv'), args.upload_rows, args.seed + 1)
+        upload_page_id, benchmarks[f'upload_file/{args.upload_rows}'] = measure_uploads(
+            fixture, job_queue, upload_file, args.upload_iterations, args.upload_rows)
+        upload_page = db.session.get(models.Page, upload_page_id)
+        if upload_page.table_name:
+            fixture.table_names.append(upload_page.table_name)
+
+        # Snapshot jobs queued by the uploads still read the tables teardown drops
+        job_queue.wait_idle()
+        if not args.keep_data:
+            fixture.teardown()
+
+    results = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'dialect': dialect
+        },
+        'config': {
+            'sizes': sizes,
+            'iterations': args.iterations,
+            'export_iterations': args.export_iterations,
+            'upload_iterations': args.upload_iterations,
+            'upload_rows': args.upload_rows,
+            'repository_files': args.repository_files,
+            'concurrency': args.concurrency,
+            'seed': args.seed
+        },
+        'benchmarks': benchmarks
+    }
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f'Wrote results to {output}')
+
+    if not args.keep_data and not args.workdir:
+        os.chdir(SCRIPT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+        return 1 if compare_results(old, new, args.regression_threshold) else 0
+
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None  # run() changes directory
+    results = run(args)
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        return 1 if compare_results(baseline, results, args.regression_threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
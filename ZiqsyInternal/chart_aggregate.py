@@ -0,0 +1,389 @@
+"""
+Server-side aggregation and downsampling for dataset charts.
+Charts are computed where the data lives so the browser receives a few hundred
+points rather than the table: group-by aggregates, histograms and time buckets
+run as GROUP BY queries, and line/scatter series are streamed ordered by X into
+NumPy arrays and reduced to a target number of points with
+Largest-Triangle-Three-Buckets (LTTB) or an even stride. Column kinds come from
+the stored dataset profile, so no scan is needed to tell numeric columns apart.
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from app import db
+from db_routing import read_connection
+from dataset_profile import column_type
+from models import DynamicTable
+from utils import get_table_columns, get_table_profile
+
+AGGREGATES = {'sum': 'SUM', 'avg': 'AVG', 'count': 'COUNT', 'min': 'MIN', 'max': 'MAX'}
+TIME_BUCKETS = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2629746, 'year': 31556952}
+NUMERIC_SQL_TYPES = ('BOOLEAN', 'INT', 'BIGINT', 'DOUBLE')
+DOWNSAMPLE_METHODS = ('lttb', 'stride', 'none')
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+DEFAULT_GROUPS = 50
+MAX_GROUPS = 1000
+DEFAULT_BINS = 20
+MAX_BINS = 200
+FETCH_BATCH_ROWS = 50000
+
+
+# Column kinds and SQL expressions
+
+def column_kinds(table_name):
+    """Column -> 'numeric', 'datetime', 'boolean' or 'text', from the dataset profile"""
+    profile = get_table_profile(table_name)
+    kinds = {}
+    for column in get_table_columns(table_name):
+        if column == 'id':
+            kinds[column] = 'numeric'
+        elif column in ('created_at', 'updated_at'):
+            kinds[column] = 'datetime'
+        elif column in profile['columns']:
+            kind = column_type(profile['columns'][column])
+            kinds[column] = {'integer': 'numeric', 'float': 'numeric'}.get(kind, kind if kind != 'empty' else 'text')
+        else:
+            kinds[column] = 'text'
+    return kinds
+
+
+def _schema(table_name):
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    return dynamic_table.get_schema() if dynamic_table else {}
+
+
+def _numeric_sql(column, schema, dialect):
+    """Column as a number; legacy tables store numbers as text"""
+    if column == 'id' or schema.get(column) in NUMERIC_SQL_TYPES:
+        return f'"{column}"'
+    sql_type = {'postgresql': 'DOUBLE PRECISION', 'sqlite': 'REAL'}.get(dialect, 'DOUBLE')
+    return f"CAST(NULLIF(\"{column}\", '') AS {sql_type})"
+
+
+def _time_bucket_sql(column, bucket, dialect):
+    """Start of the bucket containing the column's timestamp"""
+    expr = f'"{column}"'
+    if dialect == 'postgresql':
+        return f"date_trunc('{bucket}', CAST({expr} AS TIMESTAMP))"
+    if dialect == 'sqlite':
+        return {
+            'minute': f"strftime('%Y-%m-%d %H:%M:00', {expr})",
+            'hour': f"strftime('%Y-%m-%d %H:00:00', {expr})",
+            'day': f'date({expr})',
+            'week': f"date({expr}, 'weekday 0', '-6 days')",
+            'month': f"strftime('%Y-%m-01', {expr})",
+            'year': f"strftime('%Y-01-01', {expr})"
+        }[bucket]
+    return {
+        'minute': f"DATE_FORMAT({expr}, '%Y-%m-%d %H:%i:00')",
+        'hour': f"DATE_FORMAT({expr}, '%Y-%m-%d %H:00:00')",
+        'day': f'DATE({expr})',
+        'week': f'DATE(DATE_SUB({expr}, INTERVAL WEEKDAY({expr}) DAY))',
+        'month': f"DATE_FORMAT({expr}, '%Y-%m-01')",
+        'year': f"DATE_FORMAT({expr}, '%Y-01-01')"
+    }[bucket]
+
+
+def _where_sql(columns, filters=None, exact_filters=None, not_null=()):
+    """WHERE clause for the data API's substring and exact filters"""
+    clauses, params = [], {}
+    for i, (column, value) in enumerate((filters or {}).items()):
+        if column not in columns:
+            raise ValueError(f'Unknown filter column: {column}')
+        clauses.append(f'LOWER("{column}") LIKE :f{i}')
+        params[f'f{i}'] = f'%{str(value).lower()}%'
+    for i, (column, value) in enumerate((exact_filters or {}).items()):
+        if column not in columns:
+            raise ValueError(f'Unknown filter column: {column}')
+        clauses.append(f'"{column}" = :e{i}')
+        params[f'e{i}'] = value
+    clauses.extend(f'"{column}" IS NOT NULL' for column in not_null)
+    return (f' WHERE {" AND ".join(clauses)}' if clauses else ''), params
+
+
+def _label(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+
+def _value(value):
+    return None if value is None else round(float(value), 6)
+
+
+# Downsampling
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps; x must be sorted"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    # Bucket i covers edges[i]:edges[i + 1]; the first and last points are kept as is
+    edges = np.append((np.arange(threshold - 1) * every).astype(np.int64) + 1, n)
+    edges[threshold - 2] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def stride_indices(n, threshold):
+    """Evenly spaced indices, first and last included"""
+    if threshold >= n:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, threshold).round().astype(np.int64))
+
+
+def _to_float(values, kind):
+    """Vectorized conversion of a fetched column; unparseable values become NaN"""
+    if kind == 'datetime':
+        stamps = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce')
+        seconds = (stamps - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+        return seconds.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64,
+                                                                                     na_value=np.nan)
+
+
+# Chart modes
+
+def aggregate_groups(table_name, x, y=None, agg='count', limit=DEFAULT_GROUPS, order='value',
+                     filters=None, exact_filters=None):
+    """agg(y) per distinct x, largest first (order='value') or by x (order='label')"""
+    columns = get_table_columns(table_name)
+    _check_columns(columns, x, y)
+    if agg not in AGGREGATES:
+        raise ValueError(f'Unknown aggregate: {agg}')
+    if agg != 'count' and not y:
+        raise ValueError(f'{agg} needs a Y column')
+    limit = max(1, min(int(limit), MAX_GROUPS))
+
+    dialect = db.engine.dialect.name
+    metric = 'COUNT(*)' if agg == 'count' and not y else \
+        f'{AGGREGATES[agg]}({_numeric_sql(y, _schema(table_name), dialect)})'
+    where_sql, params = _where_sql(columns, filters, exact_filters)
+    order_sql = 'value DESC, label' if order == 'value' else 'label'
+    with read_connection() as conn:
+        rows = conn.execute(text(
+            f'SELECT "{x}" AS label, {metric} AS value, COUNT(*) AS row_count FROM "{table_name}"{where_sql} '
+            f'GROUP BY "{x}" ORDER BY {order_sql} LIMIT {limit + 1}'), params).all()
+
+    return {
+        'mode': 'group',
+        'x': x,
+        'y': y,
+        'agg': agg,
+        'labels': [_label(row.label) for row in rows[:limit]],
+        'values': [_value(row.value) for row in rows[:limit]],
+        'counts': [row.row_count for row in rows[:limit]],
+        'truncated': len(rows) > limit
+    }
+
+
+def histogram(table_name, x, bins=DEFAULT_BINS, filters=None, exact_filters=None):
+    """Row counts in equal-width bins over a numeric column"""
+    columns = get_table_columns(table_name)
+    _check_columns(columns, x)
+    bins = max(1, min(int(bins), MAX_BINS))
+    dialect = db.engine.dialect.name
+    expr = _numeric_sql(x, _schema(table_name), dialect)
+    where_sql, params = _where_sql(columns, filters, exact_filters)
+    where_sql += f' AND {expr} IS NOT NULL' if where_sql else f' WHERE {expr} IS NOT NULL'
+
+    with read_connection() as conn:
+        low, high, total = conn.execute(text(
+            f'SELECT MIN({expr}), MAX({expr}), COUNT(*) FROM "{table_name}"{where_sql}'), params).one()
+        if low is None:
+            return {'mode': 'histogram', 'x': x, 'labels': [], 'values': [], 'edges': [], 'rows': 0}
+        low, high = float(low), float(high)
+        width = (high - low) / bins or 1.0
+        # SQLite has no FLOOR by default, but values are >= low so truncating is the same
+        offset = f'({expr} - :low) / :width'
+        bin_sql = f'CAST({offset} AS INTEGER)' if dialect == 'sqlite' else f'FLOOR({offset})'
+        rows = conn.execute(text(
+            f'SELECT {bin_sql} AS bin, COUNT(*) AS row_count FROM "{table_name}"{where_sql} GROUP BY {bin_sql}'),
+            dict(params, low=low, width=width)).all()
+
+    counts = [0] * bins
+    for row in rows:
+        counts[min(max(int(row.bin), 0), bins - 1)] += row.row_count  # The maximum lands in the last bin
+    edges = [round(low + width * i, 6) for i in range(bins + 1)]
+    return {
+        'mode': 'histogram',
+        'x': x,
+        'labels': [f'{edges[i]:g} – {edges[i + 1]:g}' for i in range(bins)],
+        'values': counts,
+        'edges': edges,
+        'rows': total
+    }
+
+
+def time_series(table_name, x, y=None, agg='count', bucket='auto', points=DEFAULT_POINTS,
+                filters=None, exact_filters=None):
+    """agg(y) per time bucket of a datetime column; 'auto' picks the bucket from the range"""
+    columns = get_table_columns(table_name)
+    _check_columns(columns, x, y)
+    if agg not in AGGREGATES:
+        raise ValueError(f'Unknown aggregate: {agg}')
+    if agg != 'count' and not y:
+        raise ValueError(f'{agg} needs a Y column')
+    if bucket != 'auto' and bucket not in TIME_BUCKETS:
+        raise ValueError(f'Unknown time bucket: {bucket}')
+    points = max(1, min(int(points), MAX_POINTS))
+
+    dialect = db.engine.dialect.name
+    where_sql, params = _where_sql(columns, filters, exact_filters, not_null=[x])
+    with read_connection() as conn:
+        if bucket == 'auto':
+            low, high = conn.execute(text(f'SELECT MIN("{x}"), MAX("{x}") FROM "{table_name}"{where_sql}'),
+                                     params).one()
+            bucket = _auto_bucket(low, high, points)
+        metric = 'COUNT(*)' if agg == 'count' and not y else \
+            f'{AGGREGATES[agg]}({_numeric_sql(y, _schema(table_name), dialect)})'
+        bucket_sql = _time_bucket_sql(x, bucket, dialect)
+        rows = conn.execute(text(
+            f'SELECT {bucket_sql} AS label, {metric} AS value, COUNT(*) AS row_count FROM "{table_name}"{where_sql} '
+            f'GROUP BY {bucket_sql} ORDER BY label'), params).all()
+
+    labels = [_label(row.label) for row in rows]
+    values = [_value(row.value) for row in rows]
+    if len(rows) > points:
+        # Still too many buckets for the chart; keep the shape with LTTB
+        keep = lttb_indices(np.arange(len(values), dtype=np.float64),
+                            np.array([v if v is not None else np.nan for v in values], dtype=np.float64), points)
+        labels = [labels[i] for i in keep]
+        values = [values[i] for i in keep]
+    return {'mode': 'time', 'x': x, 'y': y, 'agg': agg, 'bucket': bucket, 'labels': labels, 'values': values,
+            'buckets': len(rows)}
+
+
+def _auto_bucket(low, high, points):
+    try:
+        low, high = pd.Timestamp(low), pd.Timestamp(high)
+    except (TypeError, ValueError):
+        return 'day'
+    if pd.isna(low) or pd.isna(high):
+        return 'day'
+    span = (high - low).total_seconds()
+    for name, seconds in TIME_BUCKETS.items():
+        if span / seconds <= points:
+            return name
+    return 'year'
+
+
+def series(table_name, x, y, points=DEFAULT_POINTS, downsample='lttb', filters=None, exact_filters=None):
+    """(x, y) pairs ordered by x, reduced to about points pairs.
+
+    x must be numeric or datetime. Rows are streamed in batches straight into
+    float arrays, so memory is two floats per row rather than one dict.
+    """
+    columns = get_table_columns(table_name)
+    _check_columns(columns, x, y)
+    if not y:
+        raise ValueError('A Y column is required')
+    if downsample not in DOWNSAMPLE_METHODS:
+        raise ValueError(f'Unknown downsampling method: {downsample}')
+    points = max(3, min(int(points), MAX_POINTS))
+    kinds = column_kinds(table_name)
+    x_kind = kinds.get(x)
+    if x_kind not in ('numeric', 'datetime'):
+        raise ValueError('Line and scatter charts need a numeric or date X axis; use group mode for categories')
+
+    dialect = db.engine.dialect.name
+    schema = _schema(table_name)
+    x_sql = _numeric_sql(x, schema, dialect) if x_kind == 'numeric' else f'"{x}"'
+    y_sql = _numeric_sql(y, schema, dialect)
+    where_sql, params = _where_sql(columns, filters, exact_filters, not_null=[x, y])
+
+    xs, ys = [], []
+    with read_connection() as conn:
+        result = conn.execution_options(stream_results=True).execute(text(
+            f'SELECT {x_sql} AS x, {y_sql} AS y FROM "{table_name}"{where_sql} ORDER BY {x_sql}, id'), params)
+        while True:
+            rows = result.fetchmany(FETCH_BATCH_ROWS)
+            if not rows:
+                break
+            xs.append(_to_float([row[0] for row in rows], x_kind))
+            ys.append(_to_float([row[1] for row in rows], 'numeric'))
+
+    x_values = np.concatenate(xs) if xs else np.empty(0)
+    y_values = np.concatenate(ys) if ys else np.empty(0)
+    valid = ~(np.isnan(x_values) | np.isnan(y_values))
+    x_values, y_values = x_values[valid], y_values[valid]
+
+    if downsample == 'lttb':
+        keep = lttb_indices(x_values, y_values, points)
+    elif downsample == 'stride':
+        keep = stride_indices(len(x_values), points)
+    else:
+        keep = np.arange(min(len(x_values), MAX_POINTS))
+    x_kept, y_kept = x_values[keep], y_values[keep]
+
+    if x_kind == 'datetime':
+        labels = [datetime.utcfromtimestamp(value).isoformat() for value in x_kept.tolist()]
+    else:
+        labels = np.round(x_kept, 6).tolist()
+    return {
+        'mode': 'series',
+        'x': x,
+        'y': y,
+        'x_kind': x_kind,
+        'downsample': downsample,
+        'labels': labels,
+        'values': np.round(y_kept, 6).tolist(),
+        'rows': int(len(x_values))
+    }
+
+
+def _check_columns(columns, *names):
+    for name in names:
+        if name and name not in columns:
+            raise ValueError(f'Unknown column: {name}')
+    if not names[0]:
+        raise ValueError('An X column is required')
+
+
+def aggregate(table_name, args):
+    """Dispatch an /aggregate request's query arguments to one of the chart modes"""
+    mode = args.get('mode', 'group')
+    filters = {key[len('filter_'):]: value for key, value in args.items()
+               if key.startswith('filter_') and value != ''}
+    exact_filters = {key[len('eq_'):]: value for key, value in args.items() if key.startswith('eq_')}
+    x, y = args.get('x'), args.get('y') or None
+    if mode == 'columns':
+        return {'mode': 'columns', 'columns': column_kinds(table_name)}
+    if mode == 'group':
+        return aggregate_groups(table_name, x, y, args.get('agg', 'count'),
+                                _int_arg(args, 'limit', DEFAULT_GROUPS), args.get('order', 'value'),
+                                filters, exact_filters)
+    if mode == 'histogram':
+        return histogram(table_name, x, _int_arg(args, 'bins', DEFAULT_BINS), filters, exact_filters)
+    if mode == 'time':
+        return time_series(table_name, x, y, args.get('agg', 'count'), args.get('bucket', 'auto'),
+                           _int_arg(args, 'points', DEFAULT_POINTS), filters, exact_filters)
+    if mode == 'series':
+        return series(table_name, x, y, _int_arg(args, 'points', DEFAULT_POINTS), args.get('downsample', 'lttb'),
+                      filters, exact_filters)
+    raise ValueError(f'Unknown mode: {mode}')
+
+
+def _int_arg(args, name, default):
+    try:
+        return int(args.get(name, default))
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a whole number')
@@ -0,0 +1,202 @@
+"""
+Column type inference for dynamic tables.
+Upload chunks are mapped from pandas dtypes to SQL column types
+(BOOLEAN, INT, BIGINT, DOUBLE, DATETIME, VARCHAR(n), TEXT). When a later chunk
+needs a wider type, widen_type picks the narrowest type that holds both, so
+existing rows convert without loss.
+"""
+
+import re
+from datetime import datetime
+
+import pandas as pd
+
+INT_MIN, INT_MAX = -2**31, 2**31 - 1
+BIGINT_MIN, BIGINT_MAX = -2**63, 2**63 - 1
+VARCHAR_SIZES = (16, 32, 64, 128, 255)  # Longer text is stored as TEXT
+NUMERIC_TEXT_LENGTH = 32  # Enough for any INT/BIGINT/DOUBLE written as text
+
+# Database type of columns with no values yet. Their schema type stays None, so
+# the first chunk with values changes the column straight to its own type
+# instead of widening step by step through the VARCHAR sizes.
+UNKNOWN_TYPE = f'VARCHAR({VARCHAR_SIZES[0]})'
+
+NUMERIC_RANK = {'BOOLEAN': 0, 'INT': 1, 'BIGINT': 2, 'DOUBLE': 3}
+TRUE_STRINGS = {'true', 't', 'yes', 'y', '1'}
+ISO_DATETIME = re.compile(r'\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?')
+
+
+def varchar_length(sql_type):
+    """Length of a VARCHAR(n) type, or None for other types"""
+    match = re.fullmatch(r'VARCHAR\((\d+)\)', sql_type)
+    return int(match.group(1)) if match else None
+
+
+def is_text_type(sql_type):
+    return sql_type == 'TEXT' or varchar_length(sql_type) is not None
+
+
+def text_type(length):
+    """Smallest VARCHAR bucket that fits length characters, or TEXT"""
+    for size in VARCHAR_SIZES:
+        if length <= size:
+            return f'VARCHAR({size})'
+    return 'TEXT'
+
+
+def _integer_type(minimum, maximum):
+    if INT_MIN <= minimum and maximum <= INT_MAX:
+        return 'INT'
+    if BIGINT_MIN <= minimum and maximum <= BIGINT_MAX:
+        return 'BIGINT'
+    # Wider than any SQL integer; keep the digits rather than round to DOUBLE
+    return text_type(max(len(str(minimum)), len(str(maximum))))
+
+
+def infer_column_type(series):
+    """SQL type for a pandas Series, or None if it holds only nulls"""
+    values = series.dropna()
+    if values.empty:
+        return None
+
+    dtype = values.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return _integer_type(int(values.min()), int(values.max()))
+    if pd.api.types.is_float_dtype(dtype):
+        # Integer columns with gaps arrive as float64
+        if (values % 1 == 0).all() and values.abs().max() < 2**53:
+            return _integer_type(int(values.min()), int(values.max()))
+        return 'DOUBLE'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'DATETIME'
+    return _infer_object_type(values.tolist())
+
+
+def _infer_object_type(values):
+    """Type for a column of mixed Python objects (JSON and Excel uploads)"""
+    if all(isinstance(v, bool) for v in values):
+        return 'BOOLEAN'
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return _integer_type(min(values), max(values))
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return 'DOUBLE'
+    if all(isinstance(v, datetime) for v in values):
+        return 'DATETIME'
+    if all(isinstance(v, str) and ISO_DATETIME.fullmatch(v.strip()) for v in values):
+        try:
+            pd.to_datetime(pd.Series(values))
+            return 'DATETIME'
+        except (ValueError, TypeError, OverflowError):
+            pass
+    return text_type(max(len(str(v)) for v in values))
+
+
+def infer_schema(df):
+    """Map each column of a DataFrame to a SQL type (None for all-null columns)"""
+    return {col: infer_column_type(df[col]) for col in df.columns}
+
+
+def widen_type(current, new):
+    """Narrowest type that can hold values of both types"""
+    if current is None:
+        return new
+    if new is None or current == new:
+        return current
+    if current in NUMERIC_RANK and new in NUMERIC_RANK:
+        return current if NUMERIC_RANK[current] >= NUMERIC_RANK[new] else new
+    if current == 'TEXT' or new == 'TEXT':
+        return 'TEXT'
+
+    # Mixed kinds fall back to text long enough for either side
+    lengths = [varchar_length(t) or (NUMERIC_TEXT_LENGTH if t != 'BOOLEAN' else 5)
+               for t in (current, new)]
+    return text_type(max(lengths))
+
+
+def normalize_sql_type(reflected_type):
+    """Map a type reflected from the database back onto the inferred type names"""
+    name = str(reflected_type).upper()
+    if name.startswith('VARCHAR'):
+        length = re.search(r'\((\d+)\)', name)
+        return f'VARCHAR({length.group(1)})' if length else 'TEXT'
+    if name in ('BOOLEAN', 'BOOL') or name.startswith('TINYINT'):
+        return 'BOOLEAN'
+    if name.startswith('BIGINT'):
+        return 'BIGINT'
+    if name.startswith(('INT', 'SMALLINT', 'MEDIUMINT')):
+        return 'INT'
+    if name.startswith(('DOUBLE', 'FLOAT', 'REAL', 'DECIMAL', 'NUMERIC')):
+        return 'DOUBLE'
+    if name.startswith(('DATETIME', 'TIMESTAMP')):
+        return 'DATETIME'
+    return 'TEXT'
+
+
+def is_null(value):
+    if value is None:
+        return True
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False  # list-like values from JSON
+
+
+def to_db_value(value, sql_type):
+    """Convert a DataFrame value into a driver parameter for the column type"""
+    if is_null(value):
+        return None
+    if sql_type is None or is_text_type(sql_type):
+        return str(value)
+    if sql_type == 'BOOLEAN':
+        if isinstance(value, str):
+            return value.strip().lower() in TRUE_STRINGS
+        return bool(value)
+    if sql_type in ('INT', 'BIGINT'):
+        return int(value)
+    if sql_type == 'DOUBLE':
+        return float(value)
+    if sql_type == 'DATETIME':
+        timestamp = pd.Timestamp(value)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        return timestamp.to_pydatetime()
+    return str(value)
+
+
+def coerce_input(value, sql_type):
+    """Convert a value typed in by a user (usually a string) for the column type.
+
+    Empty strings become NULL in non-text columns. Raises ValueError if the
+    value doesn't fit the type.
+    """
+    if sql_type is None or is_text_type(sql_type):
+        return None if value is None else str(value)
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return None
+    if isinstance(value, str):
+        text = value.strip()
+        if sql_type == 'BOOLEAN':
+            if text.lower() in TRUE_STRINGS:
+                return True
+            if text.lower() in {'false', 'f', 'no', 'n', '0'}:
+                return False
+            raise ValueError(f'{value!r} is not a boolean')
+        if sql_type in ('INT', 'BIGINT'):
+            number = float(text)
+            if not number.is_integer():
+                raise ValueError(f'{value!r} is not an integer')
+            return int(text) if text.lstrip('+-').isdigit() else int(number)
+        if sql_type == 'DOUBLE':
+            return float(text)
+        if sql_type == 'DATETIME':
+            return to_db_value(pd.Timestamp(text), sql_type)
+    return to_db_value(value, sql_type)
+
+
+def convert_rows(df, schema):
+    """Rows of DataFrame values converted for their column types"""
+    columns = [[to_db_value(value, schema.get(col)) for value in df[col].tolist()]
+               for col in df.columns]
+    return zip(*columns)
@@ -40,6 +40,7 @@ CREATE TABLE dynamic_table (
     table_name VARCHAR(100) NOT NULL UNIQUE,
     page_id INT NOT NULL,
     columns_info TEXT NULL,
+    data_version BIGINT NOT NULL DEFAULT 0,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (page_id) REFERENCES pages(id) ON DELETE CASCADE
 );
@@ -57,6 +58,7 @@ CREATE TABLE file_repository (
     tags VARCHAR(500) NULL,
     is_folder BOOLEAN DEFAULT FALSE,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FULLTEXT INDEX ft_file_repository_search (file_name, description, ai_description, user_notes, tags),
     FOREIGN KEY (page_id) REFERENCES pages(id) ON DELETE CASCADE
 );
 
@@ -70,6 +72,40 @@ CREATE TABLE cloud_folder (
     FOREIGN KEY (page_id) REFERENCES pages(id) ON DELETE CASCADE
 );
 
+-- Normalized file tags
+CREATE TABLE tag (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE file_repository_tag (
+    file_id INT NOT NULL,
+    tag_id INT NOT NULL,
+    PRIMARY KEY (file_id, tag_id),
+    INDEX idx_file_repository_tag_tag (tag_id, file_id),
+    FOREIGN KEY (file_id) REFERENCES file_repository(id) ON DELETE CASCADE,
+    FOREIGN KEY (tag_id) REFERENCES tag(id) ON DELETE CASCADE
+);
+
+-- Indexed contents of each repository page's cloud folder
+CREATE TABLE repository_file_index (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    page_id INT NOT NULL,
+    path_hash VARCHAR(40) NOT NULL,
+    parent_hash VARCHAR(40) NULL,
+    path VARCHAR(2000) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    is_folder BOOLEAN DEFAULT FALSE,
+    size BIGINT NULL,
+    mtime DOUBLE NULL,
+    extension VARCHAR(50) NULL,
+    indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_repository_file_index_path (page_id, path_hash),
+    INDEX idx_repository_file_index_parent (page_id, parent_hash),
+    FOREIGN KEY (page_id) REFERENCES pages(id) ON DELETE CASCADE
+);
+
 -- User invitations
 CREATE TABLE user_invitation (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -82,6 +118,42 @@ CREATE TABLE user_invitation (
     FOREIGN KEY (created_by) REFERENCES users(id)
 );
 
+-- Background jobs (uploads, exports, AI calls)
+CREATE TABLE background_job (
+    id VARCHAR(36) PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    page_id INT NULL,
+    created_by INT NULL,
+    progress TEXT NULL,
+    result TEXT NULL,
+    error TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL
+);
+
+-- Cached LLM responses
+CREATE TABLE ai_response_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    model VARCHAR(100) NOT NULL,
+    dataset_version VARCHAR(255) NULL,
+    response TEXT NOT NULL,
+    hit_count INT DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_accessed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_ai_response_cache_last_accessed (last_accessed_at),
+    INDEX idx_ai_response_cache_expires (expires_at)
+);
+
+-- Incremental statistics per dynamic table
+CREATE TABLE dataset_profile (
+    table_name VARCHAR(100) PRIMARY KEY,
+    profile LONGTEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
 CREATE INDEX idx_pages_section_id ON pages(section_id);
 CREATE INDEX idx_dynamic_table_page_id ON dynamic_table(page_id);
@@ -0,0 +1,241 @@
+"""
+Incremental statistics profile for dynamic tables.
+A profile holds the row count, per-column type evidence, null counts,
+min/max/mean for numeric values, approximate top-k values and a small sample.
+Top-k uses space-saving counters: a value that takes over an evicted counter
+inherits its count, which is recorded as that counter's possible error so
+reported counts are guaranteed lower bounds.
+Rows can be added and removed one batch at a time, so the profile stays
+current as data changes without rescanning the table.
+"""
+
+from datetime import datetime
+
+SAMPLE_ROWS = 5
+TOP_K = 10
+TRACKED_VALUES = 100  # Space-saving counters kept per column for top-k
+MAX_VALUE_LENGTH = 100
+
+NULL_STRINGS = {'', 'nan', 'NaN', 'None', 'null', 'NULL', 'NaT'}
+TRUE_STRINGS = {'true', 'True', 'TRUE', 't', 'yes', 'Yes'}
+FALSE_STRINGS = {'false', 'False', 'FALSE', 'f', 'no', 'No'}
+SKIP_COLUMNS = {'id', 'created_at', 'updated_at'}
+
+
+def empty_profile():
+    return {'row_count': 0, 'columns': {}, 'sample': []}
+
+
+def _empty_column(nulls=0):
+    return {
+        'count': 0,  # non-null values
+        'nulls': nulls,
+        'numeric': 0,
+        'integer': 0,
+        'boolean': 0,
+        'datetime': 0,
+        'sum': 0.0,
+        'min': None,
+        'max': None,
+        'extremes_stale': False,  # min/max are only bounds after removals
+        'values': {},
+        'errors': {}  # Counts inherited from evicted values; the overcount bound per value
+    }
+
+
+def is_null(value):
+    if value is None:
+        return True
+    if isinstance(value, float) and value != value:  # NaN
+        return True
+    return isinstance(value, str) and value.strip() in NULL_STRINGS
+
+
+def _classify(value):
+    """Return (number or None, is_integer, is_boolean, is_datetime) for a non-null value"""
+    if isinstance(value, bool):
+        return None, False, True, False
+    if isinstance(value, (int, float)):
+        return float(value), float(value).is_integer(), False, False
+    if isinstance(value, datetime):
+        return None, False, False, True
+
+    text = str(value).strip()
+    if text in TRUE_STRINGS or text in FALSE_STRINGS:
+        return None, False, True, False
+    try:
+        number = float(text)
+        if number == number and number not in (float('inf'), float('-inf')):
+            return number, number.is_integer() and '.' not in text and 'e' not in text.lower(), False, False
+    except ValueError:
+        pass
+    if len(text) >= 8 and text[0].isdigit():
+        try:
+            datetime.fromisoformat(text)
+            return None, False, False, True
+        except ValueError:
+            pass
+    return None, False, False, False
+
+
+def _track_value(values, errors, key):
+    if key in values:
+        values[key] += 1
+    elif len(values) < TRACKED_VALUES:
+        values[key] = 1
+    else:
+        # Space-saving: replace the smallest counter and inherit its count as error
+        smallest = min(values, key=values.get)
+        inherited = values.pop(smallest)
+        errors.pop(smallest, None)
+        values[key] = inherited + 1
+        errors[key] = inherited
+
+
+def add_rows(profile, columns, rows):
+    """Fold new rows (sequences ordered like columns) into the profile"""
+    columns = list(columns)
+    profiled = [(i, col) for i, col in enumerate(columns) if col not in SKIP_COLUMNS]
+    stats = profile['columns']
+    for _, col in profiled:
+        if col not in stats:
+            # Rows that existed before this column was added hold NULL for it
+            stats[col] = _empty_column(nulls=profile['row_count'])
+
+    added = 0
+    for row in rows:
+        added += 1
+        if len(profile['sample']) < SAMPLE_ROWS:
+            profile['sample'].append({col: _jsonable(row[i]) for i, col in enumerate(columns)})
+        for i, col in profiled:
+            _add_value(stats[col], row[i])
+
+    # Existing columns missing from this batch are NULL for the new rows
+    batch_columns = {col for _, col in profiled}
+    for col, col_stats in stats.items():
+        if col not in batch_columns:
+            col_stats['nulls'] += added
+    profile['row_count'] += added
+    return profile
+
+
+def remove_rows(profile, columns, rows):
+    """Take removed rows (sequences ordered like columns) back out of the profile"""
+    columns = list(columns)
+    stats = profile['columns']
+    removed_ids = set()
+    removed = 0
+    for row in rows:
+        removed += 1
+        for i, col in enumerate(columns):
+            if col == 'id':
+                removed_ids.add(row[i])
+            elif col in stats:
+                _remove_value(stats[col], row[i])
+
+    if removed_ids:
+        profile['sample'] = [r for r in profile['sample'] if r.get('id') not in removed_ids]
+    profile['row_count'] = max(0, profile['row_count'] - removed)
+    return profile
+
+
+def _add_value(col_stats, value):
+    if is_null(value):
+        col_stats['nulls'] += 1
+        return
+    col_stats['count'] += 1
+    number, is_integer, is_boolean, is_datetime = _classify(value)
+    if number is not None:
+        col_stats['numeric'] += 1
+        col_stats['integer'] += int(is_integer)
+        col_stats['sum'] += number
+        if col_stats['min'] is None or number < col_stats['min']:
+            col_stats['min'] = number
+        if col_stats['max'] is None or number > col_stats['max']:
+            col_stats['max'] = number
+    col_stats['boolean'] += int(is_boolean)
+    col_stats['datetime'] += int(is_datetime)
+    # Profiles saved before errors were tracked have no 'errors' entry
+    _track_value(col_stats['values'], col_stats.setdefault('errors', {}), str(value)[:MAX_VALUE_LENGTH])
+
+
+def _remove_value(col_stats, value):
+    if is_null(value):
+        col_stats['nulls'] = max(0, col_stats['nulls'] - 1)
+        return
+    col_stats['count'] = max(0, col_stats['count'] - 1)
+    number, is_integer, is_boolean, is_datetime = _classify(value)
+    if number is not None:
+        col_stats['numeric'] = max(0, col_stats['numeric'] - 1)
+        col_stats['integer'] = max(0, col_stats['integer'] - int(is_integer))
+        col_stats['sum'] -= number
+        if number == col_stats['min'] or number == col_stats['max']:
+            col_stats['extremes_stale'] = True
+    col_stats['boolean'] = max(0, col_stats['boolean'] - int(is_boolean))
+    col_stats['datetime'] = max(0, col_stats['datetime'] - int(is_datetime))
+    key = str(value)[:MAX_VALUE_LENGTH]
+    errors = col_stats.setdefault('errors', {})
+    if key in col_stats['values']:
+        col_stats['values'][key] -= 1
+        if col_stats['values'][key] <= 0:
+            del col_stats['values'][key]
+            errors.pop(key, None)
+        elif errors.get(key, 0) > col_stats['values'][key]:
+            errors[key] = col_stats['values'][key]
+
+
+def column_type(col_stats):
+    """Most specific type that covers every non-null value seen"""
+    count = col_stats['count']
+    if count == 0:
+        return 'empty'
+    if col_stats['boolean'] == count:
+        return 'boolean'
+    if col_stats['integer'] == count:
+        return 'integer'
+    if col_stats['numeric'] == count:
+        return 'float'
+    if col_stats['datetime'] == count:
+        return 'datetime'
+    return 'text'
+
+
+def summarize(profile, top_k=TOP_K):
+    """Compact, JSON-ready view of the profile for prompts and API responses"""
+    columns = {}
+    for col, col_stats in profile['columns'].items():
+        summary = {
+            'type': column_type(col_stats),
+            'non_null': col_stats['count'],
+            'nulls': col_stats['nulls'],
+            'distinct_tracked': len(col_stats['values'])
+        }
+        if col_stats['numeric']:
+            summary['mean'] = round(col_stats['sum'] / col_stats['numeric'], 6)
+            summary['min'] = col_stats['min']
+            summary['max'] = col_stats['max']
+            if col_stats['extremes_stale']:
+                summary['min_max_note'] = 'bounds; rows at the extremes were removed'
+        # Guaranteed counts only; values that may owe their whole count to
+        # evicted values (e.g. in high-cardinality columns) are left out
+        errors = col_stats.get('errors', {})
+        guaranteed = [(value, count - errors.get(value, 0)) for value, count in col_stats['values'].items()]
+        top = sorted([item for item in guaranteed if item[1] > 0], key=lambda item: item[1], reverse=True)[:top_k]
+        if errors and all(count <= 1 for _, count in top):
+            # Counters are saturated and none is known to repeat: nothing stands out
+            top = []
+            summary['top_values_note'] = 'high cardinality; no value is known to repeat'
+        summary['top_values'] = [{'value': value, 'count': count} for value, count in top]
+        columns[col] = summary
+    return {'row_count': profile['row_count'], 'columns': columns, 'sample': profile['sample']}
+
+
+def profile_rows(columns, rows):
+    """Build a profile from scratch over an iterable of rows"""
+    return add_rows(empty_profile(), columns, rows)
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return None if is_null(value) else value
+    return str(value)
@@ -0,0 +1,195 @@
+"""
+Circuit breaker around the database engine.
+Connection failures seen by the engine are counted; after DB_BREAKER_FAILURES
+within DB_BREAKER_WINDOW seconds the circuit opens and new connection attempts
+fail immediately with DatabaseUnavailable, so routes go straight to their
+temp_storage fallback instead of waiting out a connect timeout. While open, a
+background thread probes the database (half-open) and closes the circuit on
+the first successful round-trip.
+
+The read replica, when configured, has its own breaker (replica_breaker);
+db_routing skips the replica and reads from the primary while it is open.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+DB_BREAKER_FAILURES = int(os.environ.get('DB_BREAKER_FAILURES', '3'))
+DB_BREAKER_WINDOW = float(os.environ.get('DB_BREAKER_WINDOW', '30'))
+DB_BREAKER_PROBE_SECONDS = float(os.environ.get('DB_BREAKER_PROBE_SECONDS', '5'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(SQLAlchemyError):
+    """Raised instead of connecting while the circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=DB_BREAKER_FAILURES, window=DB_BREAKER_WINDOW,
+                 probe_interval=DB_BREAKER_PROBE_SECONDS, name='Database', track_failover=True):
+        self.name = name
+        self.track_failover = track_failover  # Only the primary's failures send requests to temp storage
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.probe_interval = probe_interval
+        self.engine = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._failures = []  # monotonic times of recent failures
+        self._state = CLOSED
+        self._state_since = time.monotonic()
+        self._probe_thread = None
+        self._stats = {
+            'failures': 0,
+            'short_circuited': 0,
+            'opened': 0,
+            'probes': 0,
+            'probe_failures': 0,
+            'last_error': None,
+            'failover_count': 0,
+            'failover_total_seconds': 0.0,
+            'failover_max_seconds': 0.0,
+            'failover_last_seconds': None
+        }
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_open(self):
+        return self._state != CLOSED
+
+    def init_app(self, app, engine):
+        """Attach to engine and time requests so fail-over latency can be measured"""
+        from flask import g
+
+        @app.before_request
+        def _start_request_timer():
+            g.request_started = time.perf_counter()
+
+        self.attach(engine)
+
+    def attach(self, engine):
+        """Count connection errors on engine and fail fast while the circuit is open"""
+        self.engine = engine
+
+        @event.listens_for(engine, 'do_connect')
+        def _short_circuit(dialect, conn_rec, cargs, cparams):
+            if self._state != CLOSED and not getattr(self._local, 'probing', False):
+                with self._lock:
+                    self._stats['short_circuited'] += 1
+                self.record_failover()
+                raise DatabaseUnavailable(f'{self.name} circuit is open')
+
+        @event.listens_for(engine, 'handle_error')
+        def _count_failure(context):
+            if isinstance(context.original_exception, DatabaseUnavailable):
+                return
+            if context.is_disconnect or context.connection is None:
+                self.record_failure(context.original_exception)
+
+    def record_failure(self, error):
+        """Count a connection failure; opens the circuit once the threshold is hit"""
+        if getattr(self._local, 'probing', False):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._stats['failures'] += 1
+            self._stats['last_error'] = str(error)[:500]
+            self._failures = [t for t in self._failures if now - t < self.window] + [now]
+            should_open = self._state == CLOSED and len(self._failures) >= self.failure_threshold
+            if should_open:
+                self._set_state(OPEN)
+                self._stats['opened'] += 1
+        self.record_failover()
+        if should_open:
+            logger.warning(f"{self.name} circuit opened after {len(self._failures)} failures: {error}")
+            self._start_probe()
+
+    def record_failover(self):
+        """Record how long the current request spent before falling back"""
+        if not self.track_failover:
+            return
+        try:
+            from flask import g, has_request_context
+            if not has_request_context() or 'request_started' not in g or g.get('failover_recorded'):
+                return
+            g.failover_recorded = True  # Once per request, at the first failure
+            elapsed = time.perf_counter() - g.request_started
+        except Exception:
+            return
+        with self._lock:
+            self._stats['failover_count'] += 1
+            self._stats['failover_total_seconds'] += elapsed
+            self._stats['failover_max_seconds'] = max(self._stats['failover_max_seconds'], elapsed)
+            self._stats['failover_last_seconds'] = elapsed
+
+    def _set_state(self, state):
+        self._state = state
+        self._state_since = time.monotonic()
+
+    def _start_probe(self):
+        if self._probe_thread and self._probe_thread.is_alive():
+            return
+        self._probe_thread = threading.Thread(target=self._probe_loop, name='db-circuit-probe', daemon=True)
+        self._probe_thread.start()
+
+    def _probe_loop(self):
+        while self._state != CLOSED:
+            time.sleep(self.probe_interval)
+            self.probe()
+
+    def probe(self):
+        """Try one round-trip; closes the circuit on success"""
+        with self._lock:
+            self._set_state(HALF_OPEN)
+            self._stats['probes'] += 1
+        self._local.probing = True
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+        except Exception as e:
+            with self._lock:
+                self._stats['probe_failures'] += 1
+                self._stats['last_error'] = str(e)[:500]
+                self._set_state(OPEN)
+            return False
+        finally:
+            self._local.probing = False
+
+        with self._lock:
+            self._failures = []
+            self._set_state(CLOSED)
+        logger.info(f"{self.name} circuit closed; it is reachable again")
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['state_seconds'] = round(time.monotonic() - self._state_since, 3)
+            stats['recent_failures'] = len(self._failures)
+        count = stats['failover_count']
+        stats['failover_avg_seconds'] = round(stats['failover_total_seconds'] / count, 4) if count else None
+        stats['failover_total_seconds'] = round(stats['failover_total_seconds'], 4)
+        stats['failover_max_seconds'] = round(stats['failover_max_seconds'], 4)
+        if stats['failover_last_seconds'] is not None:
+            stats['failover_last_seconds'] = round(stats['failover_last_seconds'], 4)
+        stats['failure_threshold'] = self.failure_threshold
+        stats['window_seconds'] = self.window
+        return stats
+
+
+# Global circuit breaker instances
+db_breaker = CircuitBreaker()
+replica_breaker = CircuitBreaker(name='Read replica', track_failover=False)
@@ -0,0 +1,129 @@
+"""
+Connection pool instrumentation and read-replica routing.
+TimedQueuePool records how long each checkout waits for a free connection so
+the pool can be sized from real load. Heavy read paths open connections with
+read_connection(), which uses the 'replica' bind when DATABASE_REPLICA_URL is
+set and falls back to the primary if the replica can't be reached, or straight
+away while the replica's circuit breaker is open; writes always go through
+db.session on the primary.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from db_health import DatabaseUnavailable, replica_breaker
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_wait_stats = {}  # pool label -> counters
+
+
+def _empty_wait_stats():
+    return {
+        'checkouts': 0,
+        'timeouts': 0,
+        'wait_total_seconds': 0.0,
+        'wait_max_seconds': 0.0,
+        'buckets': [0] * (len(WAIT_BUCKETS) + 1)
+    }
+
+
+def _record_wait(label, seconds, timed_out=False):
+    with _lock:
+        stats = _wait_stats.setdefault(label, _empty_wait_stats())
+        if timed_out:
+            stats['timeouts'] += 1
+            return
+        stats['checkouts'] += 1
+        stats['wait_total_seconds'] += seconds
+        stats['wait_max_seconds'] = max(stats['wait_max_seconds'], seconds)
+        bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if seconds < bound), len(WAIT_BUCKETS))
+        stats['buckets'][bucket] += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    label = 'primary'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            # TimeoutError when the pool and overflow are exhausted
+            _record_wait(self.label, time.perf_counter() - started, timed_out=True)
+            raise
+        _record_wait(self.label, time.perf_counter() - started)
+        return connection
+
+
+def timed_pool_class(label):
+    """TimedQueuePool subclass reporting under label (survives pool recreation)"""
+    return type(f'TimedQueuePool_{label}', (TimedQueuePool,), {'label': label})
+
+
+def get_read_engine():
+    """Engine for heavy reads: the replica when configured and reachable, else the primary"""
+    from app import db
+    if replica_breaker.is_open():
+        return db.engine
+    return db.engines.get('replica', db.engine)
+
+
+def has_replica():
+    from app import db
+    return 'replica' in db.engines
+
+
+@contextmanager
+def read_connection():
+    """Connection for read-only queries, preferring the replica"""
+    from app import db
+    engine = get_read_engine()
+    try:
+        conn = engine.connect()
+    except (OperationalError, DatabaseUnavailable) as e:
+        if engine is db.engine:
+            raise
+        logger.warning(f"Read replica unavailable, reading from primary: {e}")
+        conn = db.engine.connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    """Pool occupancy and checkout wait times for the primary and replica"""
+    from app import db
+    engines = {'primary': db.engine}
+    if has_replica():
+        engines['replica'] = db.engines['replica']
+
+    stats = {}
+    for label, engine in engines.items():
+        pool = engine.pool
+        with _lock:
+            waits = dict(_wait_stats.get(label, _empty_wait_stats()))
+            waits['buckets'] = list(waits['buckets'])
+        checkouts = waits['checkouts']
+        waits['wait_avg_seconds'] = round(waits['wait_total_seconds'] / checkouts, 6) if checkouts else None
+        waits['wait_total_seconds'] = round(waits['wait_total_seconds'], 6)
+        waits['wait_max_seconds'] = round(waits['wait_max_seconds'], 6)
+        waits['bucket_bounds_seconds'] = list(WAIT_BUCKETS)
+        entry = {'pool_class': type(pool).__name__, 'checkout_wait': waits}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                entry[name] = getattr(pool, name)()
+        stats[label] = entry
+    return stats
@@ -0,0 +1,402 @@
+"""
+Persistent file index for repository pages.
+The page's CloudFolder is walked once into the repository_file_index table
+(recursive, with size, mtime and extension) and the repository API serves one
+folder at a time from there. Later refreshes are incremental: entries are
+compared by mtime/size and only changed rows are written. Where inotify is
+available (the optional inotify_simple package on Linux) a watcher marks the
+directories that changed so a refresh rescans just those; otherwise the tree
+is re-walked in the background once the index is FILE_INDEX_REFRESH_SECONDS old.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select, update
+
+from app import db
+from models import RepositoryFileIndex
+
+FILE_INDEX_REFRESH_SECONDS = float(os.environ.get('FILE_INDEX_REFRESH_SECONDS', '300'))
+FILE_INDEX_WATCH = os.environ.get('FILE_INDEX_WATCH', 'true').lower() in ('1', 'true', 'yes')
+# Rows per executemany round-trip when writing index changes
+WRITE_BATCH_ROWS = 1000
+ROOT = ''  # Relative path of the indexed folder itself
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_states = {}  # page_id -> {'root', 'watcher', 'refreshing'}
+
+
+def path_hash(rel_path):
+    return hashlib.sha1(rel_path.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def normalize_rel_path(rel_path):
+    """Clean a client-supplied folder path; raises ValueError if it leaves the root"""
+    parts = [part for part in (rel_path or '').replace('\\', '/').split('/') if part not in ('', '.')]
+    if '..' in parts:
+        raise ValueError('Invalid folder path')
+    return '/'.join(parts)
+
+
+def _join(rel_dir, name):
+    return f'{rel_dir}/{name}' if rel_dir else name
+
+
+def _parent(rel_path):
+    return rel_path.rsplit('/', 1)[0] if '/' in rel_path else ROOT
+
+
+# Scanning
+
+def _scan_children(root, rel_dir):
+    """Index entries for the direct children of rel_dir (hidden files skipped)"""
+    entries = []
+    try:
+        with os.scandir(os.path.join(root, rel_dir) if rel_dir else root) as it:
+            for item in it:
+                if item.name.startswith('.'):
+                    continue
+                try:
+                    is_folder = item.is_dir(follow_symlinks=False)
+                    stat = item.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                extension = '' if is_folder else os.path.splitext(item.name)[1][1:].lower()[:50]
+                entries.append({
+                    'path': _join(rel_dir, item.name),
+                    'parent': rel_dir,
+                    'name': item.name,
+                    'is_folder': is_folder,
+                    'size': None if is_folder else stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'extension': extension or None
+                })
+    except OSError as e:
+        logger.warning(f"Could not scan {os.path.join(root, rel_dir)}: {e}")
+    return entries
+
+
+def _walk(root, rel_dir=ROOT):
+    """All entries below rel_dir; symlinked folders aren't followed"""
+    pending = [rel_dir]
+    while pending:
+        for entry in _scan_children(root, pending.pop()):
+            yield entry
+            if entry['is_folder']:
+                pending.append(entry['path'])
+
+
+# Index maintenance
+
+def _load_index(page_id):
+    rows = db.session.execute(
+        select(RepositoryFileIndex.id, RepositoryFileIndex.path, RepositoryFileIndex.is_folder,
+               RepositoryFileIndex.size, RepositoryFileIndex.mtime)
+        .where(RepositoryFileIndex.page_id == page_id)
+    )
+    return {row.path: row for row in rows}
+
+
+def _index_row(page_id, entry, now):
+    return {
+        'page_id': page_id,
+        'path_hash': path_hash(entry['path']),
+        'parent_hash': path_hash(entry['parent']) if entry['parent'] is not None else None,
+        'path': entry['path'],
+        'name': entry['name'][:255],
+        'is_folder': entry['is_folder'],
+        'size': entry['size'],
+        'mtime': entry['mtime'],
+        'extension': entry['extension'],
+        'indexed_at': now
+    }
+
+
+def refresh_index(page_id, root, directories=None):
+    """Bring the page's index in line with the folder on disk.
+
+    With directories (relative paths reported changed by the watcher) only
+    those folders are rescanned, plus any new subfolders found in them;
+    otherwise the whole tree is walked. Only new, changed and removed entries
+    are written.
+    """
+    started = time.perf_counter()
+    root = os.path.abspath(root)
+    if not os.path.isdir(root):
+        return {'success': False, 'error': f'Folder {root} does not exist'}
+
+    existing = _load_index(page_id)
+    scanned = {}
+    removed = set()
+    if directories is None:
+        scanned = {entry['path']: entry for entry in _walk(root)}
+        removed = set(existing) - set(scanned) - {ROOT}
+    else:
+        for rel_dir in directories:
+            if rel_dir != ROOT and rel_dir not in existing:
+                continue  # Inside a folder that is itself new; covered by its parent's rescan
+            children = _scan_children(root, rel_dir)
+            for entry in children:
+                scanned[entry['path']] = entry
+                if entry['is_folder'] and entry['path'] not in existing:
+                    scanned.update((sub['path'], sub) for sub in _walk(root, entry['path']))
+            current = {entry['path'] for entry in children}
+            gone = [path for path in existing
+                    if path != ROOT and _parent(path) == rel_dir and path not in current]
+            for path in gone:
+                removed.add(path)
+                if existing[path].is_folder:
+                    prefix = path + '/'
+                    removed.update(sub for sub in existing if sub.startswith(prefix))
+
+    now = datetime.utcnow()
+    inserts, updates = [], []
+    for path, entry in scanned.items():
+        row = existing.get(path)
+        if row is None:
+            inserts.append(_index_row(page_id, entry, now))
+        elif (row.is_folder, row.size, row.mtime) != (entry['is_folder'], entry['size'], entry['mtime']):
+            updates.append({'id': row.id, 'is_folder': entry['is_folder'], 'size': entry['size'],
+                            'mtime': entry['mtime'], 'extension': entry['extension'], 'indexed_at': now})
+
+    # The root row records when the index was last brought up to date
+    root_entry = {'path': ROOT, 'parent': None, 'name': os.path.basename(root) or root, 'is_folder': True,
+                  'size': None, 'mtime': os.stat(root).st_mtime, 'extension': None}
+    if ROOT in existing:
+        updates.append({'id': existing[ROOT].id, 'mtime': root_entry['mtime'], 'indexed_at': now})
+    else:
+        inserts.append(_index_row(page_id, root_entry, now))
+
+    try:
+        removed_ids = [existing[path].id for path in removed]
+        for start in range(0, len(removed_ids), WRITE_BATCH_ROWS):
+            db.session.execute(delete(RepositoryFileIndex)
+                               .where(RepositoryFileIndex.id.in_(removed_ids[start:start + WRITE_BATCH_ROWS])))
+        for start in range(0, len(inserts), WRITE_BATCH_ROWS):
+            db.session.execute(insert(RepositoryFileIndex), inserts[start:start + WRITE_BATCH_ROWS])
+        for start in range(0, len(updates), WRITE_BATCH_ROWS):
+            db.session.execute(update(RepositoryFileIndex), updates[start:start + WRITE_BATCH_ROWS])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e)}
+
+    return {
+        'success': True,
+        'scanned': len(scanned),
+        'added': len(inserts) - (ROOT not in existing),
+        'updated': len(updates) - (ROOT in existing),
+        'removed': len(removed),
+        'elapsed_seconds': round(time.perf_counter() - started, 4)
+    }
+
+
+def refresh_index_job(job, page_id, root):
+    """Background job: incremental full-tree refresh"""
+    try:
+        result = refresh_index(page_id, root)
+        job.update_progress(rows_processed=result.get('scanned'))
+        return result
+    finally:
+        with _lock:
+            state = _states.get(page_id)
+            if state:
+                state['refreshing'] = False
+
+
+def clear_index(page_id):
+    """Forget a page's index, e.g. when its folder changes"""
+    with _lock:
+        state = _states.pop(page_id, None)
+    if state and state['watcher']:
+        state['watcher'].stop()
+    db.session.execute(delete(RepositoryFileIndex).where(RepositoryFileIndex.page_id == page_id))
+    db.session.commit()
+
+
+def ensure_index(page_id, root, force=False):
+    """Make the index usable for a request without re-walking the tree every time.
+
+    The first call builds the index; afterwards watched folders are rescanned
+    if inotify reported changes, and unwatched ones are refreshed in the
+    background when stale (or synchronously with force).
+    """
+    root = os.path.abspath(root)
+    with _lock:
+        state = _states.get(page_id)
+        if state and state['root'] != root:
+            if state['watcher']:
+                state['watcher'].stop()
+            state = None
+        if state is None:
+            state = _states[page_id] = {'root': root, 'watcher': None, 'refreshing': False}
+
+    root_row = db.session.execute(
+        select(RepositoryFileIndex.indexed_at)
+        .where(RepositoryFileIndex.page_id == page_id, RepositoryFileIndex.path_hash == path_hash(ROOT))
+    ).first()
+
+    watcher = state['watcher']
+    if root_row is None or force:
+        if watcher is None and FILE_INDEX_WATCH:
+            # Watch before walking so changes made during the walk aren't missed
+            watcher = state['watcher'] = _start_watcher(root)
+        elif watcher:
+            watcher.take_changes()
+        return refresh_index(page_id, root)
+
+    if watcher and watcher.is_alive():
+        directories, full = watcher.take_changes()
+        if full:
+            return refresh_index(page_id, root)
+        if directories:
+            return refresh_index(page_id, root, directories)
+        return {'success': True, 'watching': True}
+
+    if root_row.indexed_at < datetime.utcnow() - timedelta(seconds=FILE_INDEX_REFRESH_SECONDS):
+        with _lock:
+            if state['refreshing']:
+                return {'success': True, 'refreshing': True}
+            state['refreshing'] = True
+        from jobs import job_queue
+        job_queue.submit('file_index', refresh_index_job, page_id, root, page_id=page_id)
+        return {'success': True, 'refreshing': True}
+    return {'success': True}
+
+
+def list_folder(page_id, root, rel_path=ROOT):
+    """Indexed children of one folder, folders first"""
+    rows = RepositoryFileIndex.query.filter_by(page_id=page_id, parent_hash=path_hash(rel_path)).all()
+    root = os.path.abspath(root)
+    items = []
+    for row in rows:
+        abs_path = os.path.join(root, *row.path.split('/'))
+        items.append({
+            'name': row.name,
+            'path': abs_path,
+            'rel_path': row.path,
+            'is_folder': row.is_folder,
+            'size': row.size,
+            'extension': row.extension,
+            'modified_at': datetime.utcfromtimestamp(row.mtime).isoformat() if row.mtime is not None else None,
+            'url': f"file://{abs_path}"
+        })
+    items.sort(key=lambda x: (not x['is_folder'], x['name'].lower()))
+    return items
+
+
+def index_info(page_id):
+    """When the page's index was last refreshed and whether it is being watched"""
+    root_row = RepositoryFileIndex.query.filter_by(page_id=page_id, path_hash=path_hash(ROOT)).first()
+    state = _states.get(page_id)
+    watcher = state['watcher'] if state else None
+    return {
+        'indexed_at': root_row.indexed_at.isoformat() if root_row and root_row.indexed_at else None,
+        'watching': bool(watcher and watcher.is_alive()),
+        'refreshing': bool(state and state['refreshing'])
+    }
+
+
+# inotify watcher
+
+def _start_watcher(root):
+    """Start an inotify watcher for root, or None where inotify isn't available"""
+    try:
+        import inotify_simple  # noqa: F401
+    except ImportError:
+        return None
+    try:
+        watcher = _Watcher(root)
+    except OSError as e:
+        # e.g. ENOSPC when fs.inotify.max_user_watches is exhausted
+        logger.warning(f"Not watching {root} for changes, falling back to polling: {e}")
+        return None
+    watcher.start()
+    return watcher
+
+
+class _Watcher:
+    """Collects the folders under root that changed since the last take_changes()"""
+
+    def __init__(self, root):
+        from inotify_simple import INotify, flags
+        self.root = root
+        self.flags = flags
+        self.mask = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE | flags.ATTRIB |
+                     flags.MOVED_FROM | flags.MOVED_TO)
+        self.inotify = INotify()
+        self._watches = {}  # watch descriptor -> relative folder path
+        self._changes_lock = threading.Lock()
+        self._changed = set()
+        self._full = False
+        self._stopped = False
+        self._thread = None
+        self._add_tree(ROOT)
+
+    def _add_tree(self, rel_dir):
+        self._add_watch(rel_dir)
+        for entry in _walk(self.root, rel_dir):
+            if entry['is_folder']:
+                self._add_watch(entry['path'])
+
+    def _add_watch(self, rel_dir):
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        wd = self.inotify.add_watch(path, self.mask)
+        self._watches[wd] = rel_dir
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='file-index-watcher', daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stopped = True
+        try:
+            self.inotify.close()
+        except OSError:
+            pass
+
+    def take_changes(self):
+        """(changed folders, needs full refresh) since the previous call"""
+        with self._changes_lock:
+            changed, full = self._changed, self._full
+            self._changed, self._full = set(), False
+        return changed, full
+
+    def _run(self):
+        flags = self.flags
+        while not self._stopped:
+            try:
+                events = self.inotify.read(timeout=1000)
+            except (OSError, ValueError):
+                return  # Closed by stop()
+            for event in events:
+                if event.mask & flags.Q_OVERFLOW:
+                    with self._changes_lock:
+                        self._full = True
+                    continue
+                rel_dir = self._watches.get(event.wd)
+                if rel_dir is None:
+                    continue
+                if event.mask & flags.IGNORED:
+                    self._watches.pop(event.wd, None)
+                    continue
+                with self._changes_lock:
+                    self._changed.add(rel_dir)
+                if event.mask & flags.ISDIR and event.mask & (flags.CREATE | flags.MOVED_TO) \
+                        and not event.name.startswith('.'):
+                    try:
+                        self._add_tree(_join(rel_dir, event.name))
+                    except OSError as e:
+                        logger.warning(f"Lost inotify watch on {self.root}, falling back to polling: {e}")
+                        self.stop()
+                        return
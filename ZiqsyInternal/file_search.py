@@ -0,0 +1,226 @@
+"""
+Ranked full-text search over repository file records.
+File names, descriptions, AI descriptions, notes and tags are searched through
+the database's own inverted index: an FTS5 table kept in sync by triggers on
+SQLite, or a FULLTEXT index on MySQL. Both are created on first use. Other
+databases fall back to a LIKE scan with a simple field-weighted score.
+Results carry tag facet counts, and can be narrowed by tag, through the
+normalized file_repository_tag links (see file_tags.py).
+"""
+
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+from app import db
+from file_tags import normalize_tags
+from models import FileRepository, Page
+
+SEARCH_FIELDS = ('file_name', 'description', 'ai_description', 'user_notes', 'tags')
+# Relevance weight of each field, in SEARCH_FIELDS order
+FIELD_WEIGHTS = (10.0, 2.0, 1.0, 3.0, 5.0)
+FTS_TABLE = 'file_repository_fts'
+FULLTEXT_INDEX = 'ft_file_repository_search'
+MYSQL_MIN_TOKEN = 3  # innodb_ft_min_token_size; shorter words aren't indexed
+MAX_TERMS = 10
+MAX_RESULTS = 100
+MAX_FACETS = 50
+SNIPPET_CHARS = 160
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_backend = None  # 'fts5', 'fulltext' or 'like' once the index has been checked
+
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+# Index setup
+
+def ensure_search_index():
+    """Create the dialect's full-text index if needed; returns the backend in use"""
+    global _backend
+    if _backend:
+        return _backend
+    with _lock:
+        if _backend:
+            return _backend
+        dialect = db.engine.dialect.name
+        try:
+            if dialect == 'sqlite':
+                _backend = _ensure_fts5()
+            elif dialect == 'mysql':
+                _backend = _ensure_fulltext()
+            else:
+                _backend = 'like'
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Full-text index unavailable, searching with LIKE: {e}")
+            _backend = 'like'
+    return _backend
+
+
+def _ensure_fts5():
+    exists = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                {'name': FTS_TABLE}).first()
+    if exists:
+        return 'fts5'
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+    statements = [
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, content='file_repository', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON file_repository BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON file_repository BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON file_repository BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+    ]
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+    logger.info(f"Created {FTS_TABLE} search index")
+    return 'fts5'
+
+
+def _ensure_fulltext():
+    exists = db.session.execute(text(
+        "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+        "AND table_name = 'file_repository' AND index_name = :name LIMIT 1"), {'name': FULLTEXT_INDEX}).first()
+    if not exists:
+        # InnoDB builds FULLTEXT indexes in place without blocking writes
+        db.session.execute(text(f"ALTER TABLE file_repository ADD FULLTEXT INDEX {FULLTEXT_INDEX} "
+                                f"({', '.join(SEARCH_FIELDS)})"))
+        db.session.commit()
+        logger.info(f"Created {FULLTEXT_INDEX} search index")
+    return 'fulltext'
+
+
+# Query building
+
+def _match_sql(backend, terms, params):
+    """SELECT id, score for records matching every term"""
+    if not terms:
+        return 'SELECT id, 0 AS score FROM file_repository'
+    if backend == 'fts5':
+        params['match'] = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+        return (f'SELECT rowid AS id, -bm25({FTS_TABLE}, {weights}) AS score '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match')
+    if backend == 'fulltext':
+        params['match'] = ' '.join(f'+{term}*' for term in terms)
+        match = f"MATCH({', '.join(SEARCH_FIELDS)}) AGAINST (:match IN BOOLEAN MODE)"
+        return f'SELECT id, {match} AS score FROM file_repository WHERE {match}'
+
+    score_parts, conditions = [], []
+    for i, term in enumerate(terms):
+        params[f'term_{i}'] = f'%{term}%'
+        fields = [f"LOWER(COALESCE({field}, '')) LIKE :term_{i}" for field in SEARCH_FIELDS]
+        conditions.append('(' + ' OR '.join(fields) + ')')
+        score_parts.extend(f'CASE WHEN {field} THEN {weight} ELSE 0 END'
+                           for field, weight in zip(fields, FIELD_WEIGHTS))
+    return (f"SELECT id, {' + '.join(score_parts)} AS score FROM file_repository "
+            f"WHERE {' AND '.join(conditions)}")
+
+
+def _tag_condition(tag_param):
+    """Whether file f is linked to the named tag (primary key lookups on both tables)"""
+    return (f'EXISTS (SELECT 1 FROM file_repository_tag ft JOIN tag t ON t.id = ft.tag_id '
+            f'WHERE ft.file_id = f.id AND t.name = :{tag_param})')
+
+
+def _snippet(record, terms):
+    """Text around the first term found in the descriptive fields"""
+    for field in ('description', 'ai_description', 'user_notes'):
+        value = getattr(record, field) or ''
+        lowered = value.lower()
+        positions = [lowered.find(term) for term in terms if term in lowered]
+        if positions:
+            start = max(0, min(positions) - SNIPPET_CHARS // 4)
+            snippet = value[start:start + SNIPPET_CHARS]
+            return ('…' if start else '') + snippet + ('…' if start + SNIPPET_CHARS < len(value) else '')
+    return (record.description or record.ai_description or '')[:SNIPPET_CHARS] or None
+
+
+def search_files(query, page_id=None, tags=None, limit=20, offset=0):
+    """Ranked repository file records matching query, with tag facets.
+
+    Every word of query must match (as a prefix) in some field; tags narrows
+    the results to records carrying all of them.
+    """
+    started = time.perf_counter()
+    backend = ensure_search_index()
+    terms = search_terms(query)
+    if backend == 'fulltext' and any(len(term) < MYSQL_MIN_TOKEN for term in terms):
+        backend = 'like'  # Short words aren't in the FULLTEXT index
+    tags = normalize_tags(tags)
+    limit = max(1, min(int(limit), MAX_RESULTS))
+    offset = max(0, int(offset))
+
+    params = {}
+    conditions = []
+    if page_id is not None:
+        conditions.append('f.page_id = :page_id')
+        params['page_id'] = page_id
+    for i, tag in enumerate(tags):
+        params[f'tag_{i}'] = tag
+        conditions.append(_tag_condition(f'tag_{i}'))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    base = f'FROM ({_match_sql(backend, terms, params)}) m JOIN file_repository f ON f.id = m.id'
+    matched = f'{base} {where}'
+
+    total = db.session.execute(text(f'SELECT COUNT(*) {matched}'), params).scalar()
+    ranked = db.session.execute(text(f'SELECT m.id, m.score {matched} ORDER BY m.score DESC, m.id '
+                                     f'LIMIT :limit OFFSET :offset'),
+                                dict(params, limit=limit, offset=offset)).all()
+
+    facets = db.session.execute(text(
+        f'SELECT t.name, COUNT(*) AS tag_count {base} '
+        f'JOIN file_repository_tag ft ON ft.file_id = f.id JOIN tag t ON t.id = ft.tag_id {where} '
+        f'GROUP BY t.name ORDER BY tag_count DESC, t.name LIMIT :facet_limit'),
+        dict(params, facet_limit=MAX_FACETS)).all()
+
+    scores = {row.id: row.score for row in ranked}
+    records = {}
+    if scores:
+        for record, page_name in (db.session.query(FileRepository, Page.name)
+                                  .join(Page, Page.id == FileRepository.page_id)
+                                  .filter(FileRepository.id.in_(list(scores)))):
+            records[record.id] = (record, page_name)
+
+    results = []
+    for row in ranked:
+        if row.id not in records:
+            continue
+        record, page_name = records[row.id]
+        results.append({
+            'id': record.id,
+            'page_id': record.page_id,
+            'page_name': page_name,
+            'file_name': record.file_name,
+            'file_path': record.file_path,
+            'is_folder': record.is_folder,
+            'file_url': record.file_url,
+            'tags': normalize_tags(record.tags),
+            'snippet': _snippet(record, terms),
+            'score': round(float(row.score or 0), 4)
+        })
+
+    return {
+        'results': results,
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'facets': [{'tag': row.name, 'count': row.tag_count} for row in facets],
+        'backend': backend,
+        'elapsed_seconds': round(time.perf_counter() - started, 4)
+    }
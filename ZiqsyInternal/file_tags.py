@@ -0,0 +1,192 @@
+"""
+Normalized tags for repository files.
+Each distinct tag is one row in the tag table and file_repository_tag links
+files to tags, indexed both ways, so "files tagged X" and tag counts are index
+lookups rather than LIKE scans over FileRepository.tags. The comma-separated
+tags column is kept as a display copy and rewritten by set_file_tags.
+
+Existing CSV tags are migrated with:
+
+    python file_tags.py
+"""
+
+import re
+
+from sqlalchemy import and_, delete, exists, func, insert, select, true
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import FileRepository, FileRepositoryTag, Page, Tag
+
+MAX_TAG_LENGTH = 100
+MIGRATION_BATCH_ROWS = 1000
+MAX_QUERY_RESULTS = 200
+
+
+def normalize_tags(tags):
+    """Comma-separated string or list -> unique lowercase tags, in order"""
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    names = []
+    for tag in tags or []:
+        name = re.sub(r'\s+', ' ', str(tag or '')).strip().lower()[:MAX_TAG_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def get_tag_ids(names, create=False):
+    """Map tag names to ids, creating missing tags when create is set"""
+    if not names:
+        return {}
+    ids = dict(db.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    if create:
+        for name in names:
+            if name in ids:
+                continue
+            try:
+                with db.session.begin_nested():
+                    tag = Tag(name=name)
+                    db.session.add(tag)
+                ids[name] = tag.id
+            except IntegrityError:
+                # Created concurrently by another request
+                ids[name] = db.session.execute(select(Tag.id).where(Tag.name == name)).scalar_one()
+    return ids
+
+
+def set_file_tags(record, tags):
+    """Replace a file's tags; updates the display column and the tag links"""
+    names = normalize_tags(tags)
+    record.tags = ', '.join(names) or None
+    db.session.flush()  # Assigns record.id for new files
+    wanted = set(get_tag_ids(names, create=True).values())
+    current = set(db.session.execute(
+        select(FileRepositoryTag.tag_id).where(FileRepositoryTag.file_id == record.id)).scalars())
+    if current - wanted:
+        db.session.execute(delete(FileRepositoryTag).where(FileRepositoryTag.file_id == record.id,
+                                                           FileRepositoryTag.tag_id.in_(current - wanted)))
+    if wanted - current:
+        db.session.execute(insert(FileRepositoryTag),
+                           [{'file_id': record.id, 'tag_id': tag_id} for tag_id in wanted - current])
+    return names
+
+
+def migrate_csv_tags(batch_size=MIGRATION_BATCH_ROWS):
+    """Link every file to the tags in its comma-separated column; safe to re-run"""
+    stats = {'files': 0, 'links': 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(FileRepository.id, FileRepository.tags)
+            .where(FileRepository.id > last_id, FileRepository.tags.isnot(None), FileRepository.tags != '')
+            .order_by(FileRepository.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        tags_by_file = {row.id: normalize_tags(row.tags) for row in rows}
+        tag_ids = get_tag_ids(sorted({name for names in tags_by_file.values() for name in names}), create=True)
+        links = [{'file_id': file_id, 'tag_id': tag_ids[name]}
+                 for file_id, names in tags_by_file.items() for name in names]
+        db.session.execute(delete(FileRepositoryTag).where(FileRepositoryTag.file_id.in_(list(tags_by_file))))
+        if links:
+            db.session.execute(insert(FileRepositoryTag), links)
+        db.session.commit()
+        stats['files'] += len(rows)
+        stats['links'] += len(links)
+    stats['tags'] = db.session.execute(select(func.count()).select_from(Tag)).scalar()
+    return stats
+
+
+def tag_counts(page_id=None, prefix=None, limit=100):
+    """Tags with the number of files carrying them, most used first"""
+    query = (select(Tag.name, func.count().label('count'))
+             .join(FileRepositoryTag, FileRepositoryTag.tag_id == Tag.id)
+             .join(FileRepository, FileRepository.id == FileRepositoryTag.file_id)
+             .group_by(Tag.name)
+             .order_by(func.count().desc(), Tag.name)
+             .limit(limit))
+    if page_id is not None:
+        query = query.where(FileRepository.page_id == page_id)
+    prefix = normalize_tags([prefix])
+    if prefix:
+        query = query.where(Tag.name.like(prefix[0] + '%'))
+    return [{'tag': name, 'count': count} for name, count in db.session.execute(query)]
+
+
+def _has_tag(tag_ids):
+    return exists().where(FileRepositoryTag.file_id == FileRepository.id, FileRepositoryTag.tag_id.in_(tag_ids))
+
+
+def query_files_by_tags(all_tags=None, any_tags=None, none_tags=None, page_id=None, limit=50, offset=0):
+    """Files carrying all of all_tags, at least one of any_tags and none of none_tags.
+
+    Returns the page of files, the total and how often each tag occurs among
+    all matching files.
+    """
+    all_names, any_names, none_names = normalize_tags(all_tags), normalize_tags(any_tags), normalize_tags(none_tags)
+    ids = get_tag_ids(all_names + any_names + none_names)
+    limit = max(1, min(int(limit), MAX_QUERY_RESULTS))
+    offset = max(0, int(offset))
+    empty = {'files': [], 'total': 0, 'limit': limit, 'offset': offset, 'tag_counts': []}
+
+    conditions = []
+    if page_id is not None:
+        conditions.append(FileRepository.page_id == page_id)
+    for name in all_names:
+        if name not in ids:
+            return empty  # Nothing carries a tag that doesn't exist
+        conditions.append(_has_tag([ids[name]]))
+    if any_names:
+        any_ids = [ids[name] for name in any_names if name in ids]
+        if not any_ids:
+            return empty
+        conditions.append(_has_tag(any_ids))
+    none_ids = [ids[name] for name in none_names if name in ids]
+    if none_ids:
+        conditions.append(~_has_tag(none_ids))
+    where = and_(*conditions) if conditions else true()
+
+    total = db.session.execute(select(func.count()).select_from(FileRepository).where(where)).scalar()
+    rows = db.session.execute(
+        select(FileRepository, Page.name)
+        .join(Page, Page.id == FileRepository.page_id)
+        .where(where)
+        .order_by(FileRepository.file_name, FileRepository.id)
+        .limit(limit).offset(offset)
+    ).all()
+
+    matched = select(FileRepository.id).where(where).subquery()
+    counts = db.session.execute(
+        select(Tag.name, func.count().label('count'))
+        .join(FileRepositoryTag, FileRepositoryTag.tag_id == Tag.id)
+        .join(matched, matched.c.id == FileRepositoryTag.file_id)
+        .group_by(Tag.name)
+        .order_by(func.count().desc(), Tag.name)
+        .limit(100)
+    ).all()
+
+    return {
+        'files': [{
+            'id': record.id,
+            'page_id': record.page_id,
+            'page_name': page_name,
+            'file_name': record.file_name,
+            'file_path': record.file_path,
+            'is_folder': record.is_folder,
+            'file_url': record.file_url,
+            'tags': normalize_tags(record.tags)
+        } for record, page_name in rows],
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'tag_counts': [{'tag': name, 'count': count} for name, count in counts]
+    }
+
+
+if __name__ == '__main__':
+    from app import app
+    with app.app_context():
+        result = migrate_csv_tags()
+        print(f"Migrated tags for {result['files']} files: {result['links']} links, {result['tags']} tags")
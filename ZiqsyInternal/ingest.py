@@ -0,0 +1,145 @@
+"""
+Batched ingestion engine for dynamic tables and data migrations.
+Rows are written with parameterized executemany INSERTs (which the MySQL
+drivers collapse into multi-row INSERT statements), one transaction per batch.
+"""
+
+import logging
+import os
+import time
+
+DEFAULT_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '1000'))
+
+logger = logging.getLogger(__name__)
+
+
+class SessionTarget:
+    """Ingestion target backed by a SQLAlchemy session.
+
+    before_commit, if given, is called before every commit, inside the
+    transaction being committed.
+    """
+
+    def __init__(self, session, before_commit=None):
+        from sqlalchemy import text
+        self._text = text
+        self.session = session
+        self.before_commit = before_commit
+
+    def placeholder(self, index):
+        return f':c{index}'
+
+    def executemany(self, sql, rows):
+        params = [{f'c{i}': value for i, value in enumerate(row)} for row in rows]
+        self.session.execute(self._text(sql), params)
+
+    def commit(self):
+        if self.before_commit:
+            self.before_commit()
+        self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
+
+
+class DBAPITarget:
+    """Ingestion target backed by a raw DB-API connection (format paramstyle)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.cursor()
+
+    def placeholder(self, index):
+        return '%s'
+
+    def executemany(self, sql, rows):
+        self.cursor.executemany(sql, [tuple(row) for row in rows])
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.cursor.close()
+
+
+def build_insert_sql(target, table_name, columns, quote_char='"'):
+    """Build a parameterized INSERT statement for the given columns"""
+    column_sql = ', '.join(f'{quote_char}{col}{quote_char}' for col in columns)
+    placeholders = ', '.join(target.placeholder(i) for i in range(len(columns)))
+    return f'INSERT INTO {quote_char}{table_name}{quote_char} ({column_sql}) VALUES ({placeholders})'
+
+
+def iter_batches(rows, batch_size):
+    """Yield lists of at most batch_size rows from any iterable"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_insert(target, table_name, columns, rows, batch_size=None, quote_char='"',
+                isolate_errors=False, progress=None):
+    """Insert rows into table_name in committed batches and report throughput.
+
+    rows is any iterable of sequences ordered like columns. When isolate_errors
+    is set, a failing batch is retried row by row so only the bad rows are
+    skipped; otherwise the first failure stops the run. progress, if given, is
+    called with the running row count after every committed batch.
+    """
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    sql = build_insert_sql(target, table_name, columns, quote_char)
+
+    rows_inserted = 0
+    rows_failed = 0
+    batches = 0
+    started = time.perf_counter()
+
+    for batch in iter_batches(rows, batch_size):
+        try:
+            target.executemany(sql, batch)
+            target.commit()
+            rows_inserted += len(batch)
+        except Exception as e:
+            target.rollback()
+            if not isolate_errors:
+                return _ingest_result(False, rows_inserted, rows_failed + len(batch), batches,
+                                      started, table_name, error=str(e))
+            for row in batch:
+                try:
+                    target.executemany(sql, [row])
+                    target.commit()
+                    rows_inserted += 1
+                except Exception as row_error:
+                    target.rollback()
+                    rows_failed += 1
+                    logger.warning(f"Skipping row for {table_name}: {row_error} ({row})")
+        batches += 1
+        if progress:
+            progress(rows_inserted)
+
+    return _ingest_result(True, rows_inserted, rows_failed, batches, started, table_name)
+
+
+def _ingest_result(success, rows_inserted, rows_failed, batches, started, table_name, error=None):
+    elapsed = time.perf_counter() - started
+    rows_per_second = rows_inserted / elapsed if elapsed > 0 else float(rows_inserted)
+    logger.info(f"Ingested {rows_inserted} rows into {table_name} in {batches} batches "
+                f"({elapsed:.2f}s, {rows_per_second:,.0f} rows/sec)")
+    result = {
+        'success': success,
+        'rows_inserted': rows_inserted,
+        'rows_failed': rows_failed,
+        'batches': batches,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(rows_per_second, 1)
+    }
+    if error:
+        result['error'] = error
+    return result
@@ -0,0 +1,197 @@
+"""
+Background job runner for uploads, exports and AI calls.
+Jobs run on a local thread pool so request threads return immediately. State is
+kept in memory and mirrored to the background_job table so any worker process
+can answer status requests; no external broker is needed.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import BackgroundJob
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+PROGRESS_FLUSH_SECONDS = 1.0
+FINISHED_JOB_TTL = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """In-memory view of a background job, handed to the job function"""
+
+    def __init__(self, job_type, page_id=None, user_id=None):
+        self.id = str(uuid.uuid4())
+        self.job_type = job_type
+        self.page_id = page_id
+        self.user_id = user_id
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self._last_flush = 0.0
+
+    def update_progress(self, **counters):
+        """Record progress counters such as rows_processed or bytes_read"""
+        self.progress.update({key: value for key, value in counters.items() if value is not None})
+        now = time.monotonic()
+        if now - self._last_flush >= PROGRESS_FLUSH_SECONDS:
+            self._last_flush = now
+            job_queue.persist(self)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'page_id': self.page_id,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobQueue:
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ziqsy-job')
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_type, func, *args, page_id=None, user_id=None, **kwargs):
+        """Queue func(job, *args, **kwargs) and return the Job immediately"""
+        job = Job(job_type, page_id=page_id, user_id=user_id)
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        self.persist(job)
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """Get job state as a dict, from memory or from the jobs table"""
+        job = self.jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        try:
+            record = db.session.get(BackgroundJob, job_id)
+        except Exception as e:
+            logger.error(f"Could not load job {job_id}: {e}")
+            return None
+        if not record:
+            return None
+        return {
+            'id': record.id,
+            'job_type': record.job_type,
+            'status': record.status,
+            'page_id': record.page_id,
+            'progress': record.get_progress(),
+            'result': record.get_result(),
+            'error': record.error,
+            'created_at': record.created_at.isoformat() if record.created_at else None,
+            'started_at': record.started_at.isoformat() if record.started_at else None,
+            'finished_at': record.finished_at.isoformat() if record.finished_at else None
+        }
+
+    def wait_idle(self, timeout=None):
+        """Block until no job is queued or running; returns False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                busy = any(job.status in ('queued', 'running') for job in self.jobs.values())
+            if not busy:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def _run(self, job, func, args, kwargs):
+        with app.app_context():
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            self.persist(job)
+            try:
+                result = func(job, *args, **kwargs)
+                job.result = result
+                if isinstance(result, dict) and result.get('success') is False:
+                    job.status = 'failed'
+                    job.error = result.get('message') or result.get('error')
+                else:
+                    job.status = 'succeeded'
+            except Exception as e:
+                logger.exception(f"Job {job.id} ({job.job_type}) failed")
+                try:
+                    db.session.rollback()
+                except Exception:
+                    pass
+                job.status = 'failed'
+                job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            self.persist(job)
+            db.session.remove()
+
+    def persist(self, job):
+        """Mirror job state to the database; the in-memory copy stays authoritative"""
+        try:
+            with app.app_context():
+                record = db.session.get(BackgroundJob, job.id)
+                if not record:
+                    record = BackgroundJob(id=job.id, job_type=job.job_type, page_id=job.page_id,
+                                           created_by=job.user_id, created_at=job.created_at)
+                    db.session.add(record)
+                record.status = job.status
+                record.progress = json.dumps(job.progress)
+                record.result = json.dumps(job.result, default=str) if job.result is not None else None
+                record.error = job.error
+                record.started_at = job.started_at
+                record.finished_at = job.finished_at
+                db.session.commit()
+        except Exception as e:
+            logger.warning(f"Could not persist job {job.id}: {e}")
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - FINISHED_JOB_TTL
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            self.jobs.pop(job_id)
+        self._sweep_exports()
+
+    def _sweep_exports(self):
+        """Remove export files once their job has expired, whichever worker wrote them.
+
+        A file stops changing when its export finishes, so its mtime is the
+        job's finish time; exports still being written are never old enough.
+        """
+        folder = app.config['EXPORT_FOLDER']
+        cutoff = time.time() - FINISHED_JOB_TTL.total_seconds()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass  # Already removed by another worker
+
+
+# Global job queue instance
+job_queue = JobQueue()
@@ -0,0 +1,216 @@
+"""
+Request and SQL instrumentation exposed in Prometheus text format.
+Every request is timed per route, SQL statements are counted and timed through
+SQLAlchemy cursor events (per request and per bind), statements slower than
+SLOW_QUERY_SECONDS are logged with their SQL, and admins can send an
+X-Profile header to get a cProfile dump of a single request. No external
+client library is needed; /admin/metrics renders the registry below.
+"""
+
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event
+
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', '0.5'))
+PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER', 'profiles')
+PROFILE_HEADER = 'X-Profile'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+logger = logging.getLogger(__name__)
+
+
+class Metric:
+    def __init__(self, name, help_text, metric_type, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _labels(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.label_names, key)) + (extra or [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_items(items))
+        return lines
+
+
+class Counter(Metric):
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, 'counter', label_names)
+
+    def inc(self, amount=1, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_items(self, items):
+        return [f'{self.name}{self._format_labels(key)} {_number(value)}' for key, value in items]
+
+
+class Histogram(Metric):
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, 'histogram', label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def _render_items(self, items):
+        lines = []
+        for key, state in items:
+            for bound, count in zip(self.buckets, state['buckets']):
+                lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", _number(bound))])} {count}')
+            lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", "+Inf")])} {state["count"]}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {_number(state["sum"])}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {state["count"]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+REQUEST_SECONDS = Histogram('ziqsy_request_duration_seconds', 'Request latency by route',
+                            ('route', 'method', 'status'))
+REQUEST_SQL_QUERIES = Histogram('ziqsy_request_sql_queries', 'SQL statements per request by route',
+                                ('route',), buckets=COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('ziqsy_request_sql_duration_seconds', 'Time spent in SQL per request by route',
+                                ('route',))
+SQL_SECONDS = Histogram('ziqsy_sql_query_duration_seconds', 'SQL statement latency by bind', ('bind',))
+SLOW_QUERIES = Counter('ziqsy_sql_slow_queries_total', 'SQL statements slower than SLOW_QUERY_SECONDS', ('bind',))
+PROFILES = Counter('ziqsy_request_profiles_total', 'Requests profiled with cProfile', ('route',))
+AI_FIRST_TOKEN_SECONDS = Histogram('ziqsy_ai_first_token_seconds', 'Time to first streamed token by model', ('model',))
+AI_STREAM_SECONDS = Histogram('ziqsy_ai_stream_duration_seconds', 'Streamed AI response duration by model', ('model',),
+                              buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0))
+
+REGISTRY = [REQUEST_SECONDS, REQUEST_SQL_QUERIES, REQUEST_SQL_SECONDS, SQL_SECONDS, SLOW_QUERIES, PROFILES,
+            AI_FIRST_TOKEN_SECONDS, AI_STREAM_SECONDS]
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_metrics(app, engines):
+    """Install request timing, cProfile and SQL hooks; engines maps bind label -> engine"""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+
+    @app.before_request
+    def _start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        if request.headers.get(PROFILE_HEADER) and session.get('is_admin'):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _record_metrics(response):
+        if 'metrics_started' not in g:
+            return response
+        route = _route()
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            response.headers['X-Profile-File'] = _dump_profile(profiler, route)
+            PROFILES.inc(route=route)
+        REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_started, route=route,
+                                method=request.method, status=response.status_code)
+        REQUEST_SQL_QUERIES.observe(g.sql_queries, route=route)
+        REQUEST_SQL_SECONDS.observe(g.sql_seconds, route=route)
+        return response
+
+    for label, engine in engines.items():
+        _instrument_engine(engine, label)
+
+
+def _instrument_engine(engine, label):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        SQL_SECONDS.observe(elapsed, bind=label)
+        route = None
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += elapsed
+            route = _route()
+        if elapsed >= SLOW_QUERY_SECONDS:
+            SLOW_QUERIES.inc(bind=label)
+            logger.warning(f"Slow query ({elapsed:.3f}s, {label}, route={route}): "
+                           f"{' '.join(statement.split())[:2000]}")
+
+
+def _dump_profile(profiler, route):
+    name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    path = os.path.join(PROFILE_FOLDER, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}_{name}.prof")
+    profiler.dump_stats(path)
+    logger.info(f"Wrote request profile for {route} to {path}")
+    return os.path.basename(path)
+
+
+def render_metrics(gauges=None, counters=None):
+    """Prometheus text exposition of the registry plus point-in-time gauges and counters.
+
+    gauges and counters are lists of (name, help, {labels tuple: value}) or
+    (name, help, value); counters are cumulative totals read from elsewhere and
+    should be named *_total.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for metric_type, samples in (('gauge', gauges), ('counter', counters)):
+        for name, help_text, value in samples or []:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if isinstance(value, dict):
+                for labels, sample in sorted(value.items()):
+                    label_sql = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f'{name}{{{label_sql}}} {_number(sample)}')
+            else:
+                lines.append(f'{name} {_number(value)}')
+    return '\n'.join(lines) + '\n'
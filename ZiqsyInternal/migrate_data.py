@@ -2,6 +2,7 @@ import csv
 import mysql.connector
 from datetime import datetime
 import os
+from ingest import DBAPITarget, bulk_insert
 
 # MySQL connection configuration
 MYSQL_CONFIG = {
@@ -15,45 +16,38 @@ MYSQL_CONFIG = {
 def connect_mysql():
     return mysql.connector.connect(**MYSQL_CONFIG)
 
-def migrate_table_data(csv_file, table_name, column_mapping):
+def convert_value(value):
+    """Convert a PostgreSQL CSV export value for MySQL"""
+    # Handle boolean conversion
+    if value in ['t', 'true', 'True', '1']:
+        return True
+    elif value in ['f', 'false', 'False', '0']:
+        return False
+    elif value == '' or value == 'NULL':
+        return None
+    return value
+
+def migrate_table_data(csv_file, table_name, column_mapping, batch_size=None):
     """Migrate data from CSV to MySQL table"""
     conn = connect_mysql()
-    cursor = conn.cursor()
+    target = DBAPITarget(conn)
     
     with open(csv_file, 'r', encoding='utf-8') as file:
         reader = csv.DictReader(file)
+        rows = (
+            [convert_value(row.get(csv_col, '')) for csv_col in column_mapping]
+            for row in reader
+        )
         
-        for row in reader:
-            # Convert data types for MySQL
-            converted_row = {}
-            for csv_col, mysql_col in column_mapping.items():
-                value = row.get(csv_col, '')
-                
-                # Handle boolean conversion
-                if value in ['t', 'true', 'True', '1']:
-                    converted_row[mysql_col] = True
-                elif value in ['f', 'false', 'False', '0']:
-                    converted_row[mysql_col] = False
-                elif value == '' or value == 'NULL':
-                    converted_row[mysql_col] = None
-                else:
-                    converted_row[mysql_col] = value
-            
-            # Build INSERT query
-            columns = list(converted_row.keys())
-            placeholders = ', '.join(['%s'] * len(columns))
-            query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-            
-            try:
-                cursor.execute(query, list(converted_row.values()))
-            except Exception as e:
-                print(f"Error inserting row into {table_name}: {e}")
-                print(f"Row data: {converted_row}")
+        # Bad rows are skipped individually, matching the old row-by-row behaviour
+        result = bulk_insert(target, table_name, list(column_mapping.values()), rows,
+                             batch_size=batch_size, quote_char='`', isolate_errors=True)
     
-    conn.commit()
-    cursor.close()
+    target.close()
     conn.close()
-    print(f"Migrated data to {table_name}")
+    print(f"Migrated {result['rows_inserted']} rows to {table_name} "
+          f"({result['rows_failed']} skipped, {result['rows_per_second']:,.0f} rows/sec)")
+    return result
 
 # Define column mappings (PostgreSQL -> MySQL)
 COLUMN_MAPPINGS = {
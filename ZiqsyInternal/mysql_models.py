@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime, timedelta
+from sqlalchemy.dialects import mysql
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 
@@ -62,6 +63,8 @@ class DynamicTable(db.Model):
     table_name = db.Column(db.String(100), unique=True, nullable=False)
     page_id = db.Column(db.Integer, db.ForeignKey('pages.id', ondelete='CASCADE'), nullable=False)
     columns_info = db.Column(db.Text, nullable=True)  # JSON info about columns
+    # Bumped in the same transaction as every write to the table (see utils.bump_table_version)
+    data_version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def get_columns_info(self):
@@ -72,6 +75,27 @@ class DynamicTable(db.Model):
     def set_columns_info(self, columns_dict):
         self.columns_info = json.dumps(columns_dict)
 
+    def get_schema(self):
+        """Column name -> SQL type; older records hold a plain list of TEXT columns"""
+        info = self.get_columns_info()
+        if isinstance(info, list):
+            return {col: 'TEXT' for col in info}
+        return info.get('columns', {})
+
+    def set_schema(self, schema):
+        info = self.get_columns_info()
+        self.set_columns_info({
+            'columns': schema,
+            'indexes': info.get('indexes', []) if isinstance(info, dict) else []
+        })
+
+    def get_indexes(self):
+        info = self.get_columns_info()
+        return info.get('indexes', []) if isinstance(info, dict) else []
+
+    def set_indexes(self, indexes):
+        self.set_columns_info({'columns': self.get_schema(), 'indexes': indexes})
+
 class FileRepository(db.Model):
     __tablename__ = 'file_repository'
     
@@ -83,9 +107,46 @@ class FileRepository(db.Model):
     ai_description = db.Column(db.Text, nullable=True)  # AI-generated description
     user_notes = db.Column(db.Text, nullable=True)  # User notes about the file/folder
     file_url = db.Column(db.String(500), nullable=True)
-    tags = db.Column(db.String(500), nullable=True)  # Comma-separated tags
+    tags = db.Column(db.String(500), nullable=True)  # Comma-separated display copy; queries use tag_links
     is_folder = db.Column(db.Boolean, default=False)  # True if this is a folder
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    tag_links = db.relationship('FileRepositoryTag', cascade='all, delete-orphan')
+
+class Tag(db.Model):
+    __tablename__ = 'tag'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)  # Normalized: lowercase, single spaces
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FileRepositoryTag(db.Model):
+    __tablename__ = 'file_repository_tag'
+    __table_args__ = (
+        db.Index('idx_file_repository_tag_tag', 'tag_id', 'file_id'),
+    )
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('file_repository.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+
+class RepositoryFileIndex(db.Model):
+    __tablename__ = 'repository_file_index'
+    __table_args__ = (
+        db.UniqueConstraint('page_id', 'path_hash', name='uq_repository_file_index_path'),
+        db.Index('idx_repository_file_index_parent', 'page_id', 'parent_hash'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    page_id = db.Column(db.Integer, db.ForeignKey('pages.id', ondelete='CASCADE'), nullable=False)
+    path_hash = db.Column(db.String(40), nullable=False)  # sha1 of path, so long paths stay indexable
+    parent_hash = db.Column(db.String(40), nullable=True)  # sha1 of the parent folder's path; NULL for the root
+    path = db.Column(db.String(2000), nullable=False)  # Relative to the page's cloud folder, '/'-separated
+    name = db.Column(db.String(255), nullable=False)
+    is_folder = db.Column(db.Boolean, default=False)
+    size = db.Column(db.BigInteger, nullable=True)  # Bytes; NULL for folders
+    mtime = db.Column(db.Double, nullable=True)  # st_mtime, compared on refresh
+    extension = db.Column(db.String(50), nullable=True)
+    indexed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class CloudFolder(db.Model):
     __tablename__ = 'cloud_folder'
@@ -108,3 +169,54 @@ class UserInvitation(db.Model):
     is_used = db.Column(db.Boolean, default=False)
 
 
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_job'
+    
+    id = db.Column(db.String(36), primary_key=True)  # UUID
+    job_type = db.Column(db.String(50), nullable=False)  # upload, export, ai_analysis
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    page_id = db.Column(db.Integer, nullable=True)
+    created_by = db.Column(db.Integer, nullable=True)
+    progress = db.Column(db.Text, nullable=True)  # JSON progress counters (rows_processed, bytes_read, ...)
+    result = db.Column(db.Text, nullable=True)  # JSON result payload
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def get_progress(self):
+        if self.progress:
+            return json.loads(self.progress)
+        return {}
+
+    def get_result(self):
+        if self.result:
+            return json.loads(self.result)
+        return None
+
+class AIResponseCache(db.Model):
+    __tablename__ = 'ai_response_cache'
+    
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256 of model, prompt fingerprint and dataset version
+    model = db.Column(db.String(100), nullable=False)
+    dataset_version = db.Column(db.String(255), nullable=True)
+    response = db.Column(db.Text, nullable=False)  # JSON payload returned to callers
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class DatasetProfile(db.Model):
+    __tablename__ = 'dataset_profile'
+    
+    table_name = db.Column(db.String(100), primary_key=True)
+    # JSON statistics maintained by dataset_profile.py; LONGTEXT on MySQL as in create_mysql_schema.sql
+    profile = db.Column(db.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_profile(self):
+        return json.loads(self.profile)
+
+    def set_profile(self, profile_dict):
+        self.profile = json.dumps(profile_dict, default=str)
@@ -0,0 +1,87 @@
+"""
+In-process cache of the sidebar navigation tree (sections and their pages).
+Sections and pages are loaded in one eager query and kept as plain dicts, the
+same shape temp_storage returns, so templates render them without touching
+the database. Section/page writes invalidate the cache and touch a shared
+stamp file (NAV_STAMP_FILE); every worker process checks the stamp on each
+read and reloads when it has moved, so writes show up in all workers at once.
+The TTL remains as a backstop, e.g. for workers on other hosts.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+
+from app import db
+from db_routing import get_read_engine
+from models import Section
+
+NAV_CACHE_TTL = float(os.environ.get('NAV_CACHE_TTL', '30'))
+# Seconds after a navigation write during which reads skip the replica
+REPLICA_LAG_GRACE = float(os.environ.get('NAV_REPLICA_LAG_GRACE', '10'))
+NAV_STAMP_FILE = os.environ.get('NAV_STAMP_FILE', 'navigation.stamp')
+
+_lock = threading.Lock()
+_cache = {'sections': None, 'loaded_at': 0.0, 'stamp': None}
+
+
+def _read_stamp():
+    """Modification time of the shared stamp file in nanoseconds, or None before the first write"""
+    try:
+        return os.stat(NAV_STAMP_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_navigation_sections():
+    """Get sections with their pages for the sidebar"""
+    stamp = _read_stamp()
+    with _lock:
+        if (_cache['sections'] is not None and _cache['stamp'] == stamp
+                and time.monotonic() - _cache['loaded_at'] < NAV_CACHE_TTL):
+            return _cache['sections']
+
+    # Read from the replica when one is configured, except right after a write
+    # (in any worker) so the change is visible despite replication lag
+    use_replica = stamp is None or time.time() - stamp / 1e9 >= REPLICA_LAG_GRACE
+    with Session(get_read_engine() if use_replica else db.engine) as read_session:
+        sections = read_session.scalars(
+            select(Section).options(joinedload(Section.pages)).order_by(Section.id)).unique().all()
+        tree = [_section_to_dict(section) for section in sections]
+
+    with _lock:
+        _cache['sections'] = tree
+        _cache['loaded_at'] = time.monotonic()
+        _cache['stamp'] = stamp
+    return tree
+
+
+def invalidate_navigation():
+    """Drop the cached tree after sections or pages change, in this and every other worker"""
+    with _lock:
+        _cache['sections'] = None
+    try:
+        with open(NAV_STAMP_FILE, 'a'):
+            pass
+        os.utime(NAV_STAMP_FILE, None)
+    except OSError:
+        pass  # Other workers fall back to the TTL
+
+
+def _section_to_dict(section):
+    pages = sorted(section.pages, key=lambda page: page.id)
+    return {
+        'id': section.id,
+        'name': section.name,
+        'created_at': section.created_at,
+        'pages': [{
+            'id': page.id,
+            'name': page.name,
+            'page_type': page.page_type,
+            'section_id': page.section_id,
+            'created_at': page.created_at
+        } for page in pages]
+    }
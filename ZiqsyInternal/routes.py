@@ -1,22 +1,45 @@
-from flask import render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from app import app, db
 from models import User, Section, Page, DynamicTable, FileRepository, CloudFolder, UserInvitation
 from temp_storage import temp_storage
+from db_health import db_breaker, replica_breaker
+from db_routing import has_replica, pool_stats
+from metrics import render_metrics
+from jobs import job_queue
+from navigation import get_navigation_sections, invalidate_navigation
 from datetime import datetime, timedelta
 from utils import (
     create_dynamic_table, 
     insert_csv_data, 
-    get_dynamic_table_data,
+    query_dynamic_table,
+    get_table_version,
+    count_table_rows,
+    get_table_profile,
+    get_table_columns,
     update_dynamic_table_row,
     delete_dynamic_table_row,
-    export_table_to_csv,
+    apply_row_mutations,
+    export_table_to_file,
+    stream_table_export,
+    EXPORT_FORMATS,
     process_uploaded_file
 )
 import os
+import uuid
 import markdown
 from datetime import datetime
-from ai_service import generate_file_description, generate_folder_description, get_available_models, analyze_dataset_with_ai
+from ai_service import generate_file_description, generate_folder_description, get_available_models, analyze_dataset_profile_with_ai, get_cached_dataset_analysis, stream_dataset_profile_analysis
+from ai_cache import cache_stats
+from ai_batch import AI_BATCH_MAX_ITEMS, collect_folder_items, collect_path_items, describe_batch_job, folder_children
+from table_indexes import list_indexes, suggest_indexes, declare_index, build_index, drop_index
+from analytics_engine import run_query, DEFAULT_MAX_ROWS, DEFAULT_TIMEOUT_SECONDS
+from chart_aggregate import aggregate
+from table_snapshots import read_table_rows, request_snapshot
+from table_facets import facet_columns, parse_selection, get_facets, get_facet_items, ensure_facet_indexes
+from file_index import ensure_index, list_folder, index_info, clear_index, normalize_rel_path
+from file_search import search_files
+from file_tags import set_file_tags, tag_counts, query_files_by_tags
 import pandas as pd
 import json
 
@@ -69,7 +92,7 @@ def dashboard():
         return redirect(url_for('login'))
     
     try:
-        sections = Section.query.all()
+        sections = get_navigation_sections()
     except Exception as e:
         app.logger.error(f"Database error in dashboard: {e}")
         sections = temp_storage.get_sections()
@@ -89,6 +112,7 @@ def create_section():
             section = Section(name=name)
             db.session.add(section)
             db.session.commit()
+            invalidate_navigation()
             flash(f'Section "{name}" created successfully!', 'success')
         except Exception as e:
             app.logger.error(f"Database error creating section: {e}")
@@ -107,6 +131,7 @@ def delete_section(section_id):
         section = Section.query.get_or_404(section_id)
         db.session.delete(section)
         db.session.commit()
+        invalidate_navigation()
         flash(f'Section "{section.name}" deleted successfully!', 'success')
     except Exception as e:
         app.logger.error(f"Database error deleting section: {e}")
@@ -130,6 +155,7 @@ def create_page():
             page = Page(name=name, page_type=page_type, section_id=int(section_id))
             db.session.add(page)
             db.session.commit()
+            invalidate_navigation()
             flash(f'Page "{name}" created successfully!', 'success')
         except Exception as e:
             app.logger.error(f"Database error creating page: {e}")
@@ -148,6 +174,7 @@ def delete_page(page_id):
         page = Page.query.get_or_404(page_id)
         db.session.delete(page)
         db.session.commit()
+        invalidate_navigation()
         flash(f'Page "{page.name}" deleted successfully!', 'success')
     except Exception as e:
         app.logger.error(f"Database error deleting page: {e}")
@@ -164,7 +191,7 @@ def view_page(page_id):
     
     try:
         page = Page.query.get_or_404(page_id)
-        sections = Section.query.all()  # For sidebar
+        sections = get_navigation_sections()  # For sidebar
     except Exception as e:
         app.logger.error(f"Database error in view_page: {e}")
         # Use temporary storage as fallback
@@ -227,26 +254,53 @@ def upload_file(page_id):
         return redirect(url_for('view_page', page_id=page_id))
     
     if file and file.filename:
-        filename = secure_filename(file.filename)
+        # Unique name so queued uploads of the same file don't overwrite each other
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         
-        try:
-            # Process the uploaded file based on page type
-            result = process_uploaded_file(filepath, page)
-            if result['success']:
-                flash(result['message'], 'success')
-            else:
-                flash(result['message'], 'error')
-        except Exception as e:
-            flash(f'Error processing file: {str(e)}', 'error')
-        finally:
-            # Clean up uploaded file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+        fallback_page = page if isinstance(page, dict) else None
+        job = job_queue.submit('upload', _process_upload_job, filepath, page_id, fallback_page,
+                               page_id=page_id, user_id=session.get('user_id'))
+        
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'job_id': job.id, 'status_url': url_for('get_job_status', job_id=job.id)}), 202
+        
+        flash('File upload queued for processing.', 'info')
+        return redirect(url_for('view_page', page_id=page_id, job=job.id))
     
     return redirect(url_for('view_page', page_id=page_id))
 
+def _process_upload_job(job, filepath, page_id, fallback_page=None):
+    """Background job: stream an uploaded file into the page's dynamic table"""
+    try:
+        try:
+            page = db.session.get(Page, page_id) or fallback_page
+        except Exception as e:
+            app.logger.error(f"Database error in upload job: {e}")
+            page = fallback_page
+        if not page:
+            return {'success': False, 'message': 'Page not found.'}
+        
+        job.update_progress(rows_processed=0, bytes_read=0, bytes_total=os.path.getsize(filepath))
+        result = process_uploaded_file(filepath, page, progress=job.update_progress)
+        table_name = getattr(page, 'table_name', None)
+        if result.get('success') and table_name:
+            _request_snapshot(table_name, page_id, job.user_id)
+        return result
+    finally:
+        # Clean up uploaded file
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+def _request_snapshot(table_name, page_id, user_id):
+    """Queue a columnar snapshot of a table that was just written to; failures are only logged"""
+    try:
+        request_snapshot(table_name, lambda func, *args: job_queue.submit(
+            'snapshot', func, *args, page_id=page_id, user_id=user_id))
+    except Exception as e:
+        app.logger.error(f"Could not queue snapshot of {table_name}: {e}")
+
 # API endpoints for dynamic data
 @app.route('/api/page/<int:page_id>/data', methods=['GET'])
 def get_page_data(page_id):
@@ -263,15 +317,118 @@ def get_page_data(page_id):
             return jsonify([])
         table_name = page.get('table_name') if isinstance(page, dict) else None
     
+    # Without paging parameters keep the legacy full-table list response
+    paging_keys = ('limit', 'offset', 'cursor', 'sort', 'order')
+    paginated = any(key in request.args for key in paging_keys) or any(
+        key.startswith(('filter_', 'eq_')) for key in request.args)
+    
     try:
+        if table_name and paginated:
+            filters = {key[len('filter_'):]: value for key, value in request.args.items()
+                       if key.startswith('filter_') and value != ''}
+            exact_filters = {key[len('eq_'):]: value for key, value in request.args.items()
+                             if key.startswith('eq_')}
+            result = query_dynamic_table(
+                table_name,
+                limit=request.args.get('limit', 100, type=int),
+                offset=request.args.get('offset', 0, type=int),
+                cursor=request.args.get('cursor'),
+                sort=request.args.get('sort'),
+                order=request.args.get('order', 'asc'),
+                filters=filters,
+                exact_filters=exact_filters
+            )
+            return jsonify(result)
         if table_name:
-            data = get_dynamic_table_data(table_name)
-            return jsonify(data)
+            # Whole table: served from the columnar snapshot while that is current
+            return jsonify(read_table_rows(table_name))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         app.logger.error(f"Error loading table data: {e}")
-        return jsonify([])
+        return jsonify({'rows': [], 'total': 0} if paginated else [])
+    
+    return jsonify({'rows': [], 'total': 0} if paginated else [])
+
+@app.route('/api/page/<int:page_id>/aggregate', methods=['GET'])
+def get_page_aggregate(page_id):
+    """Chart data aggregated or downsampled on the server (mode=group|histogram|time|series|columns)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'error': 'No dataset available for this page'}), 400
+    
+    try:
+        return jsonify(aggregate(page.table_name, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error aggregating chart data: {e}")
+        return jsonify({'error': f'Could not aggregate data: {str(e)}'}), 500
+
+@app.route('/api/analytics/query', methods=['POST'])
+def analytics_query():
+    """Read-only SQL over page datasets (page_<id>) in the embedded analytics engine"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json() or {}
+    try:
+        return jsonify(run_query(data.get('sql'),
+                                 max_rows=data.get('max_rows', DEFAULT_MAX_ROWS),
+                                 timeout=data.get('timeout', DEFAULT_TIMEOUT_SECONDS)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error running analytics query: {e}")
+        return jsonify({'error': f'Query failed: {str(e)}'}), 500
+
+@app.route('/api/page/<int:page_id>/facets', methods=['GET'])
+def get_page_facets(page_id):
+    """Category values and counts; facet_<column>=value (repeatable) selects values"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify([])
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'facets': [], 'total': 0})
+    
+    try:
+        selection = parse_selection(request.args, facet_columns(page.table_name))
+        result = get_facets(page.table_name, selection)
+        if not result['cached']:
+            ensure_facet_indexes(page.table_name, page_id, lambda func, *args: job_queue.submit(
+                'index_build', func, *args, page_id=page_id, user_id=session.get('user_id')))
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error computing facets: {e}")
+        return jsonify({'error': f'Could not load categories: {str(e)}'}), 500
+
+@app.route('/api/page/<int:page_id>/facets/items', methods=['GET'])
+def get_page_facet_items(page_id):
+    """Rows matching the selected facet values, keyset paged by id"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'rows': [], 'total': 0, 'next_cursor': None})
+    
+    try:
+        selection = parse_selection(request.args, facet_columns(page.table_name))
+        return jsonify(get_facet_items(page.table_name, selection,
+                                       limit=request.args.get('limit', 100, type=int),
+                                       cursor=request.args.get('cursor')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error loading facet items: {e}")
+        return jsonify({'error': f'Could not load items: {str(e)}'}), 500
 
 @app.route('/api/page/<int:page_id>/data', methods=['POST'])
 def update_page_data(page_id):
@@ -288,59 +445,243 @@ def update_page_data(page_id):
             result = delete_dynamic_table_row(page.table_name, data['id'])
         else:
             result = {'success': False, 'message': 'Invalid action'}
-        
+        # No snapshot here: rewriting the whole table per cell edit costs more than
+        # the reads it saves, which fall back to the database until the next
+        # upload or batch edit
         return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/page/<int:page_id>/data/batch', methods=['POST'])
+def batch_update_page_data(page_id):
+    """Apply many insert/update/delete operations in one transaction"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'success': False, 'message': 'This page has no data yet', 'results': []}), 400
+    
+    data = request.json or {}
+    result = apply_row_mutations(page.table_name, data.get('operations'))
+    if result['success']:
+        _request_snapshot(page.table_name, page_id, session.get('user_id'))
+    return jsonify(result), 200 if result['success'] else 400
+
 @app.route('/export/<int:page_id>')
 def export_page_data(page_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     page = Page.query.get_or_404(page_id)
+    export_format = request.args.get('format', 'csv').lower()
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
+    
+    if page.table_name and request.args.get('async'):
+        job = job_queue.submit('export', _export_job, page.table_name, page.name, export_format, compress,
+                               page_id=page_id, user_id=session.get('user_id'))
+        return jsonify({'job_id': job.id, 'status_url': url_for('get_job_status', job_id=job.id)}), 202
     
     if page.table_name:
         try:
-            filepath = export_table_to_csv(page.table_name, page.name)
-            return send_file(filepath, as_attachment=True, download_name=f'{page.name}_export.csv')
+            chunks = stream_table_export(page.table_name, export_format, compress)
+            mimetype, extension = EXPORT_FORMATS[export_format]
+            download_name = f'{page.name}_export.{extension}'
+            if compress:
+                mimetype = 'application/gzip'
+                download_name += '.gz'
+            return Response(
+                stream_with_context(chunks),
+                mimetype=mimetype,
+                headers={'Content-Disposition': f'attachment; filename="{secure_filename(download_name)}"'}
+            )
         except Exception as e:
             flash(f'Error exporting data: {str(e)}', 'error')
     
     return redirect(url_for('view_page', page_id=page_id))
 
+def _export_job(job, table_name, page_name, export_format='csv', compress=False):
+    """Background job: export a dynamic table to a file for later download"""
+    filepath = export_table_to_file(table_name, export_format, compress, directory=app.config['EXPORT_FOLDER'])
+    job.update_progress(bytes_read=os.path.getsize(filepath))
+    extension = EXPORT_FORMATS[export_format][1] + ('.gz' if compress else '')
+    return {
+        'success': True,
+        'file_path': filepath,
+        'download_name': f'{page_name}_export.{extension}'
+    }
+
+# Secondary indexes
+@app.route('/api/page/<int:page_id>/indexes', methods=['GET'])
+def get_page_indexes(page_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'indexes': [], 'suggestions': [], 'columns': []})
+    
+    columns = [col for col in get_table_columns(page.table_name) if col != 'id']
+    return jsonify({
+        'indexes': list_indexes(page.table_name),
+        'suggestions': suggest_indexes(page.table_name),
+        'columns': columns
+    })
+
+@app.route('/api/page/<int:page_id>/indexes', methods=['POST'])
+def create_page_index(page_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'success': False, 'message': 'This page has no data yet'}), 400
+    
+    data = request.json or {}
+    try:
+        declaration = declare_index(page.table_name, page_id, data.get('columns') or [])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if declaration['status'] == 'ready':
+        return jsonify({'success': True, 'index': declaration})
+    
+    job = job_queue.submit('index_build', build_index, page.table_name, declaration['name'],
+                           declaration['columns'], page_id=page_id, user_id=session.get('user_id'))
+    return jsonify({
+        'success': True,
+        'index': declaration,
+        'job_id': job.id,
+        'status_url': url_for('get_job_status', job_id=job.id)
+    }), 202
+
+@app.route('/api/page/<int:page_id>/indexes/<index_name>', methods=['DELETE'])
+def delete_page_index(page_id, index_name):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'success': False, 'message': 'This page has no data yet'}), 400
+    
+    return jsonify(drop_index(page.table_name, index_name))
+
+# Database health
+@app.route('/api/health/db')
+def get_db_health():
+    """Circuit breaker state, fail-over latency and pending fallback writes"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    stats = db_breaker.stats()
+    stats['temp_storage_pending'] = temp_storage.pending_changes()
+    if has_replica():
+        stats['replica'] = replica_breaker.stats()
+    return jsonify(stats)
+
+@app.route('/api/health/pool')
+def get_pool_health():
+    """Connection pool occupancy and checkout wait times for primary and replica"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(pool_stats())
+
+# Background jobs
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Don't leak server-side paths to the browser
+    result = job.get('result')
+    if isinstance(result, dict) and 'file_path' in result:
+        job['result'] = {key: value for key, value in result.items() if key != 'file_path'}
+        job['result']['download_url'] = url_for('download_job_result', job_id=job_id)
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/download')
+def download_job_result(job_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    job = job_queue.get(job_id)
+    result = job.get('result') if job else None
+    if not job or job['status'] != 'succeeded' or not isinstance(result, dict) or 'file_path' not in result:
+        return jsonify({'error': 'No downloadable result for this job'}), 404
+    if not os.path.exists(result['file_path']):
+        return jsonify({'error': 'Export file has expired'}), 410
+    
+    return send_file(result['file_path'], as_attachment=True, download_name=result.get('download_name'))
+
 # Repository management
-@app.route('/api/repository/<int:page_id>/files', methods=['GET', 'POST'])
+@app.route('/api/repository/<int:page_id>/files', methods=['POST'])
 def manage_repository_files(page_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
     page = Page.query.get_or_404(page_id)
     
-    if request.method == 'POST':
-        data = request.json or {}
-        file_repo = FileRepository(
-            page_id=page_id,
-            file_path=data.get('file_path', ''),
-            file_name=data.get('file_name', ''),
-            description=data.get('description', ''),
-            file_url=data.get('file_url', ''),
-            tags=data.get('tags', '')
-        )
-        db.session.add(file_repo)
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'File added successfully'})
-    
-    files = FileRepository.query.filter_by(page_id=page_id).all()
-    return jsonify([{
-        'id': f.id,
-        'file_path': f.file_path,
-        'file_name': f.file_name,
-        'description': f.description,
-        'file_url': f.file_url,
-        'tags': f.tags,
-        'created_at': f.created_at.isoformat()
-    } for f in files])
+    data = request.json or {}
+    file_repo = FileRepository(
+        page_id=page_id,
+        file_path=data.get('file_path', ''),
+        file_name=data.get('file_name', ''),
+        description=data.get('description', ''),
+        file_url=data.get('file_url', '')
+    )
+    db.session.add(file_repo)
+    set_file_tags(file_repo, data.get('tags', ''))
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'File added successfully'})
+
+@app.route('/api/repository/search')
+def search_repository_files():
+    """Ranked search over file names, descriptions, notes and tags (?q=, ?tags=a,b, ?page_id=)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    query = request.args.get('q', '').strip()
+    tags = request.args.get('tags', '')
+    page_id = request.args.get('page_id', type=int)
+    if not query and not tags and page_id is None:
+        return jsonify({'error': 'Enter a search term or tag'}), 400
+    
+    try:
+        result = search_files(query, page_id=page_id, tags=tags,
+                              limit=request.args.get('limit', 20, type=int),
+                              offset=request.args.get('offset', 0, type=int))
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error searching repository files: {e}")
+        return jsonify({'error': 'Search is temporarily unavailable', 'results': [], 'total': 0, 'facets': []})
+
+@app.route('/api/tags')
+def get_tags():
+    """Tags with file counts (?page_id= to count one page, ?prefix= for autocomplete)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    tags = tag_counts(page_id=request.args.get('page_id', type=int), prefix=request.args.get('prefix'),
+                      limit=min(request.args.get('limit', 100, type=int), 1000))
+    return jsonify({'tags': tags})
+
+@app.route('/api/repository/files/tagged')
+def get_tagged_files():
+    """Files by tag set: ?all=a,b&any=c,d&none=e, optionally within ?page_id="""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    all_tags, any_tags, none_tags = (request.args.get(key, '') for key in ('all', 'any', 'none'))
+    if not (all_tags or any_tags):
+        return jsonify({'error': 'Give at least one tag in all or any'}), 400
+    
+    result = query_files_by_tags(all_tags, any_tags, none_tags, page_id=request.args.get('page_id', type=int),
+                                 limit=request.args.get('limit', 50, type=int),
+                                 offset=request.args.get('offset', 0, type=int))
+    return jsonify(result)
 
 @app.route('/api/repository/file/<int:file_id>', methods=['PUT', 'DELETE'])
 def manage_repository_file(file_id):
@@ -352,7 +693,8 @@ def manage_repository_file(file_id):
     if request.method == 'PUT':
         data = request.json
         file_repo.description = data.get('description', file_repo.description)
-        file_repo.tags = data.get('tags', file_repo.tags)
+        if 'tags' in data:
+            set_file_tags(file_repo, data['tags'])
         file_repo.file_url = data.get('file_url', file_repo.file_url)
         db.session.commit()
         return jsonify({'success': True, 'message': 'File updated successfully'})
@@ -384,6 +726,8 @@ def set_cloud_folder(page_id):
         # Check if cloud folder already exists for this page
         cloud_folder = CloudFolder.query.filter_by(page_id=page_id).first()
         if cloud_folder:
+            if cloud_folder.folder_path != folder_path:
+                clear_index(page_id)  # Rebuilt from the new folder on the next load
             cloud_folder.folder_path = folder_path
             cloud_folder.folder_name = folder_name
         else:
@@ -403,56 +747,47 @@ def set_cloud_folder(page_id):
     
     return redirect(url_for('view_page', page_id=page_id))
 
-@app.route('/api/repository/<int:page_id>/files')
+@app.route('/api/repository/<int:page_id>/files', methods=['GET'])
 def get_repository_files(page_id):
-    app.logger.info(f"Repository files API called for page {page_id}")
-    
-    # Direct file scanning without database dependency
-    import os
+    """One folder of the page's file index (?path=relative/folder, ?refresh=1 to rescan)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        folder_path = '/home/runner/workspace'
-        files = []
+        cloud_folder = CloudFolder.query.filter_by(page_id=page_id).first()
+        if not cloud_folder:
+            return jsonify({'error': 'No folder selected for this page'})
         
-        if os.path.exists(folder_path):
-            items = os.listdir(folder_path)
-            app.logger.info(f"Found {len(items)} items in {folder_path}")
-            
-            for item in sorted(items):
-                # Skip hidden files and system files
-                if item.startswith('.'):
-                    continue
-                    
-                item_path = os.path.join(folder_path, item)
-                is_folder = os.path.isdir(item_path)
-                
-                # Get file size if it's a file
-                size = None
-                if not is_folder:
-                    try:
-                        size = os.path.getsize(item_path)
-                    except OSError:
-                        size = 0
-                
-                files.append({
-                    'name': item,
-                    'path': item_path,
-                    'is_folder': is_folder,
-                    'size': size,
-                    'url': f"file://{item_path}"
-                })
-            
-            app.logger.info(f"Successfully processed {len(files)} files/folders")
-            
-            # Sort files: folders first, then files, both alphabetically
-            files.sort(key=lambda x: (not x['is_folder'], x['name'].lower()))
-            
-            return jsonify({'files': files})
-        else:
-            return jsonify({'error': f'Folder {folder_path} does not exist'})
-            
+        try:
+            rel_path = normalize_rel_path(request.args.get('path', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        refresh = ensure_index(page_id, cloud_folder.folder_path,
+                               force=request.args.get('refresh') in ('1', 'true', 'yes'))
+        if not refresh['success']:
+            return jsonify({'error': refresh['error']})
+        
+        files = list_folder(page_id, cloud_folder.folder_path, rel_path)
+        
+        # Attach stored AI descriptions and notes so the page needn't ask again
+        try:
+            paths = [f['path'] for f in files]
+            records = {r.file_path: r for r in FileRepository.query.filter(
+                FileRepository.page_id == page_id, FileRepository.file_path.in_(paths)).all()} if paths else {}
+            for f in files:
+                record = records.get(f['path'])
+                if record:
+                    f['ai_description'] = record.ai_description
+                    f['user_notes'] = record.user_notes
+        except Exception as e:
+            app.logger.error(f"Error loading repository records: {e}")
+        
+        return jsonify(dict(index_info(page_id), files=files, path=rel_path))
+    
     except Exception as e:
-        app.logger.error(f"Error scanning files: {e}")
+        db.session.rollback()
+        app.logger.error(f"Error loading file index: {e}")
         return jsonify({'error': f'Scanning error: {str(e)}'})
 
 
@@ -463,22 +798,96 @@ def get_ai_description():
     
     try:
         data = request.get_json()
+        page_id = data.get('page_id')
         file_path = data.get('file_path')
         file_name = data.get('file_name')
         is_folder = data.get('is_folder', False)
         
         if is_folder:
-            description = generate_folder_description(file_path, file_name, [])
+            file_list, child_descriptions = folder_children(page_id, file_path)
+            description = generate_folder_description(file_path, file_name, file_list, child_descriptions)
         else:
             file_extension = file_name.split('.')[-1] if '.' in file_name else ''
             description = generate_file_description(file_path, file_name, file_extension)
         
+        if page_id and not description.startswith(('Unable to generate', 'AI descriptions require')):
+            _save_ai_description(page_id, file_path, file_name, is_folder, description)
+        
         return jsonify({'description': description})
         
     except Exception as e:
         app.logger.error(f"Error generating AI description: {e}")
         return jsonify({'description': 'Unable to generate description'})
 
+def _save_ai_description(page_id, file_path, file_name, is_folder, description):
+    """Write a generated description back to the page's FileRepository record"""
+    try:
+        file_record = FileRepository.query.filter_by(page_id=page_id, file_path=file_path).first()
+        if file_record:
+            file_record.ai_description = description
+        else:
+            file_record = FileRepository(
+                page_id=page_id,
+                file_path=file_path,
+                file_name=file_name,
+                ai_description=description,
+                is_folder=is_folder
+            )
+            db.session.add(file_record)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error saving AI description: {e}")
+
+@app.route('/api/repository/<int:page_id>/ai-descriptions', methods=['POST'])
+def batch_ai_descriptions(page_id):
+    """Describe a folder of the page's CloudFolder (path) or a list of paths in the background"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    cloud_folder = CloudFolder.query.filter_by(page_id=page_id).first()
+    if not cloud_folder:
+        return jsonify({'success': False, 'message': 'No folder selected for this page'}), 400
+    
+    data = request.get_json() or {}
+    root = os.path.abspath(cloud_folder.folder_path)
+    try:
+        if data.get('paths'):
+            paths = [os.path.abspath(os.path.join(root, path)) for path in data['paths']]
+            if any(os.path.commonpath([root, path]) != root for path in paths):
+                return jsonify({'success': False, 'message': 'Paths must be inside the page folder'}), 400
+            items = collect_path_items(paths)
+        else:
+            rel_path = normalize_rel_path(data.get('path', ''))
+            refresh = ensure_index(page_id, root)
+            if not refresh['success']:
+                return jsonify({'success': False, 'message': refresh['error']}), 400
+            items = collect_folder_items(page_id, root, rel_path)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if not items:
+        return jsonify({'success': False, 'message': 'Nothing to describe'}), 400
+    if len(items) > AI_BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'message': f'{len(items)} items is more than the limit of '
+                                                     f'{AI_BATCH_MAX_ITEMS}; describe a smaller folder'}), 400
+    
+    job = job_queue.submit('ai_descriptions', describe_batch_job, page_id, items, bool(data.get('overwrite')),
+                           page_id=page_id, user_id=session.get('user_id'))
+    return jsonify({
+        'success': True,
+        'items': len(items),
+        'job_id': job.id,
+        'status_url': url_for('get_job_status', job_id=job.id)
+    }), 202
+
+@app.route('/api/ai/cache/stats')
+def get_ai_cache_stats():
+    """AI response cache hit/miss counters"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(cache_stats())
+
 @app.route('/api/repository/file/notes', methods=['POST'])
 def save_file_notes():
     if 'user_id' not in session:
@@ -523,7 +932,7 @@ def get_ai_models():
         models = get_available_models()
         return jsonify({'models': models})
     except Exception as e:
-        print(f"Error getting AI models: {e}")
+        app.logger.error(f"Error getting AI models: {e}")
         return jsonify({'models': {}, 'error': str(e)})
 
 @app.route('/api/ai/analyze-dataset', methods=['POST'])
@@ -547,35 +956,98 @@ def ai_analyze_dataset():
         if not page.table_name:
             return jsonify({'error': 'No dataset available for this page'})
         
-        # Get dataset data
-        dataset_data = get_dynamic_table_data(page.table_name)
-        
-        if not dataset_data:
-            return jsonify({'error': 'Dataset is empty'})
+        if data.get('async'):
+            job = job_queue.submit('ai_analysis', _ai_analysis_job, page.table_name, question, model_id,
+                                   page_id=page.id, user_id=session.get('user_id'))
+            return jsonify({'job_id': job.id, 'status_url': url_for('get_job_status', job_id=job.id)}), 202
         
-        # Convert to DataFrame for analysis
-        import pandas as pd
-        df = pd.DataFrame(dataset_data)
-        
-        # Analyze with AI
-        result = analyze_dataset_with_ai(df, question, model_id)
-        
-        return jsonify(result)
+        return jsonify(_analyze_table(page.table_name, question, model_id))
         
     except Exception as e:
-        print(f"Error in AI dataset analysis: {e}")
+        app.logger.error(f"Error in AI dataset analysis: {e}")
         return jsonify({'error': f'Analysis failed: {str(e)}'})
+
+def _analyze_table(table_name, question, model_id):
+    """Run the AI analysis over a dynamic table's statistics profile"""
+    # Answer repeated questions from the cache without reading the table
+    dataset_version = get_table_version(table_name)
+    cached = get_cached_dataset_analysis(question, model_id, dataset_version)
+    if cached:
+        return cached
+    
+    # Analyze the stored profile instead of loading the table; rebuild it if
+    # the row count has drifted from the table
+    profile = get_table_profile(table_name, expected_rows=count_table_rows(table_name))
+    
+    if not profile['row_count']:
+        return {'error': 'Dataset is empty'}
+    
+    return analyze_dataset_profile_with_ai(profile, question, model_id, dataset_version=dataset_version)
+
+@app.route('/api/ai/analyze-dataset/stream')
+def ai_analyze_dataset_stream():
+    """Analyze a dataset with AI, streaming the answer as Server-Sent Events"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    page_id = request.args.get('page_id', type=int)
+    question = request.args.get('question', '').strip()
+    model_id = request.args.get('model_id', 'gpt-4o')
+    if not page_id or not question:
+        return jsonify({'error': 'Page ID and question are required'}), 400
+    
+    page = Page.query.get_or_404(page_id)
+    if not page.table_name:
+        return jsonify({'error': 'No dataset available for this page'}), 400
+    
+    return Response(
+        stream_with_context(_stream_table_analysis(page.table_name, question, model_id)),
+        mimetype='text/event-stream',
+        # Keep proxies from buffering the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+def _stream_table_analysis(table_name, question, model_id):
+    """SSE events for an AI analysis of a dynamic table's statistics profile"""
+    # A comment line first so the browser sees the response start right away
+    yield ': analysis started\n\n'
+    try:
+        dataset_version = get_table_version(table_name)
+        cached = get_cached_dataset_analysis(question, model_id, dataset_version)
+        if cached:
+            yield _sse('start', {'model_used': cached.get('model_used'), 'provider': cached.get('provider')})
+            yield _sse('token', {'text': cached.get('response') or ''})
+            yield _sse('done', cached)
+            return
+        
+        profile = get_table_profile(table_name, expected_rows=count_table_rows(table_name))
+        if not profile['row_count']:
+            yield _sse('failed', {'error': 'Dataset is empty'})
+            return
         
+        for event, payload in stream_dataset_profile_analysis(profile, question, model_id,
+                                                              dataset_version=dataset_version):
+            yield _sse(event, payload)
     except Exception as e:
-        app.logger.error(f"Error saving file notes: {e}")
-        return jsonify({'success': False, 'error': str(e)})
+        app.logger.error(f"Error in streaming AI dataset analysis: {e}")
+        yield _sse('failed', {'error': f'Analysis failed: {str(e)}'})
+
+def _ai_analysis_job(job, table_name, question, model_id):
+    """Background job: run an AI dataset analysis"""
+    result = _analyze_table(table_name, question, model_id)
+    if 'error' in result:
+        return {'success': False, 'message': result['error']}
+    return result
 
 # Documentation routes
 @app.route('/docs')
 def documentation():
     """Main documentation hub page"""
     try:
-        sections = Section.query.all()
+        sections = get_navigation_sections()
     except:
         sections = temp_storage.get_sections()
     return render_template('documentation.html', sections=sections)
@@ -605,7 +1077,7 @@ def view_documentation(doc_type):
     html_content = markdown.markdown(content, extensions=['tables', 'fenced_code', 'codehilite'])
     
     try:
-        sections = Section.query.all()
+        sections = get_navigation_sections()
     except:
         sections = temp_storage.get_sections()
     
@@ -708,6 +1180,53 @@ def update_theme_preference():
         app.logger.error(f"Error updating theme: {e}")
         return jsonify({'error': 'Failed to update theme'}), 500
 
+# Instrumentation
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Prometheus metrics: request/SQL timings plus breaker, pool, cache and job gauges and counters"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    gauges = []
+    counters = []  # Cumulative since the process started
+    breaker = db_breaker.stats()
+    gauges.append(('ziqsy_db_circuit_open', 'Database circuit breaker open (1) or closed (0)',
+                   int(breaker['state'] != 'closed')))
+    gauges.append(('ziqsy_db_failover_seconds_max', 'Slowest request fail-over to temp storage',
+                   breaker['failover_max_seconds']))
+    if breaker['failover_avg_seconds'] is not None:
+        gauges.append(('ziqsy_db_failover_seconds_avg', 'Average request fail-over to temp storage',
+                       breaker['failover_avg_seconds']))
+    for name in ('failures', 'short_circuited', 'opened', 'probes', 'probe_failures'):
+        counters.append((f'ziqsy_db_circuit_{name}_total', f'Database circuit breaker {name.replace("_", " ")} so far',
+                         breaker[name]))
+    gauges.append(('ziqsy_temp_storage_pending_changes', 'Fallback changes waiting to be replayed',
+                   temp_storage.pending_changes()))
+    
+    try:
+        pools = pool_stats()
+        for field in ('checkedout', 'checkedin', 'overflow', 'size'):
+            gauges.append((f'ziqsy_db_pool_{field}', f'Connection pool {field}',
+                           {(('bind', bind),): stats[field] for bind, stats in pools.items() if field in stats}))
+        gauges.append(('ziqsy_db_pool_checkout_wait_seconds_max', 'Longest wait for a pooled connection',
+                       {(('bind', bind),): stats['checkout_wait']['wait_max_seconds'] for bind, stats in pools.items()}))
+        counters.append(('ziqsy_db_pool_checkout_timeouts_total', 'Checkouts that timed out waiting for a connection',
+                         {(('bind', bind),): stats['checkout_wait']['timeouts'] for bind, stats in pools.items()}))
+    except Exception as e:
+        app.logger.error(f"Could not collect pool metrics: {e}")
+    
+    ai_cache = cache_stats()
+    for name in ('hits', 'misses', 'evictions'):
+        counters.append((f'ziqsy_ai_cache_{name}_total', f'AI response cache {name} in this process', ai_cache[name]))
+    
+    job_counts = {}
+    for job in list(job_queue.jobs.values()):
+        key = (('status', job.status), ('type', job.job_type))
+        job_counts[key] = job_counts.get(key, 0) + 1
+    gauges.append(('ziqsy_jobs', 'Background jobs held in memory by status and type', job_counts))
+    
+    return Response(render_metrics(gauges, counters), mimetype='text/plain; version=0.0.4')
+
 # Admin user management
 @app.route('/admin/users')
 def admin_users():
@@ -719,7 +1238,7 @@ def admin_users():
     try:
         users = User.query.order_by(User.created_at.desc()).all()
         invitations = UserInvitation.query.filter_by(is_used=False).order_by(UserInvitation.created_at.desc()).all()
-        sections = Section.query.all()
+        sections = get_navigation_sections()
     except:
         users = []
         invitations = []
@@ -276,6 +276,205 @@ window.ZiqsyAdmin = {
         }
     },
 
+    // Background job polling
+    jobs: {
+        /**
+         * Poll /api/jobs/<id> until the job finishes
+         */
+        poll: function(jobId, onProgress = null, interval = 1000) {
+            return new Promise((resolve, reject) => {
+                const check = () => {
+                    fetch(`/api/jobs/${jobId}`)
+                        .then(response => response.json())
+                        .then(job => {
+                            if (job.error && !job.status) {
+                                reject(new Error(job.error));
+                            } else if (job.status === 'succeeded' || job.status === 'failed') {
+                                resolve(job);
+                            } else {
+                                if (onProgress) onProgress(job.progress || {});
+                                setTimeout(check, interval);
+                            }
+                        })
+                        .catch(reject);
+                };
+                check();
+            });
+        },
+
+        /**
+         * Follow a queued upload and report its outcome
+         */
+        trackUpload: function(jobId) {
+            this.poll(jobId)
+                .then(job => {
+                    const message = (job.result && job.result.message) || job.error || 'Upload finished';
+                    if (job.status === 'succeeded') {
+                        ZiqsyAdmin.notifications.success(message);
+                        if (typeof window.loadPageData === 'function') {
+                            window.loadPageData();
+                        }
+                    } else {
+                        ZiqsyAdmin.notifications.error(message);
+                    }
+                })
+                .catch(error => ZiqsyAdmin.notifications.error('Lost track of upload: ' + error.message));
+        }
+    },
+
+    // Batched row edits for dynamic tables
+    rows: {
+        pending: {},
+        timers: {},
+
+        /**
+         * Send operations to /api/page/<id>/data/batch in one request
+         */
+        apply: function(pageId, operations) {
+            return fetch(`/api/page/${pageId}/data/batch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ operations: operations })
+            }).then(response => response.json());
+        },
+
+        /**
+         * Queue one operation; edits made within the delay go out as one batch.
+         * Resolves with the operation's own result.
+         */
+        queue: function(pageId, operation, delay = 300) {
+            return new Promise((resolve, reject) => {
+                (this.pending[pageId] = this.pending[pageId] || []).push({ operation, resolve, reject });
+                clearTimeout(this.timers[pageId]);
+                this.timers[pageId] = setTimeout(() => this.flush(pageId), delay);
+            });
+        },
+
+        flush: function(pageId) {
+            const queued = this.pending[pageId] || [];
+            delete this.pending[pageId];
+            if (queued.length === 0) return;
+
+            this.apply(pageId, queued.map(item => item.operation))
+                .then(batch => {
+                    queued.forEach((item, index) => {
+                        const result = (batch.results || [])[index] || {};
+                        item.resolve({
+                            success: batch.success && result.status === 'ok',
+                            message: result.message || (result.status === 'not_found' ? 'Row not found' : batch.message)
+                        });
+                    });
+                })
+                .catch(error => queued.forEach(item => item.reject(error)));
+        }
+    },
+
+    // Secondary index management for dataset and list pages
+    indexes: {
+        pageId: function() {
+            const modal = document.getElementById('indexManagerModal');
+            return modal ? modal.dataset.pageId : null;
+        },
+
+        /**
+         * Load declared indexes, suggestions and columns into the modal
+         */
+        load: function() {
+            const pageId = this.pageId();
+            if (!pageId) return;
+            fetch(`/api/page/${pageId}/indexes`)
+                .then(response => response.json())
+                .then(data => this.render(data))
+                .catch(error => ZiqsyAdmin.notifications.error('Could not load indexes: ' + error.message));
+        },
+
+        render: function(data) {
+            const escape = ZiqsyAdmin.indexes.escape;
+            const list = document.getElementById('indexList');
+            const indexes = data.indexes || [];
+            list.innerHTML = indexes.length ? indexes.map(index => `
+                <div class="d-flex justify-content-between align-items-center border-bottom py-1">
+                    <span><code>${escape(index.columns.join(', '))}</code>
+                        <span class="badge ${index.status === 'ready' ? 'bg-success' : index.status === 'building' ? 'bg-info' : 'bg-danger'} ms-2">${escape(index.status)}</span>
+                        ${index.error ? `<small class="text-danger ms-2">${escape(index.error)}</small>` : ''}
+                    </span>
+                    <button class="btn btn-outline-danger btn-sm" onclick="ZiqsyAdmin.indexes.drop('${escape(index.name)}')">Drop</button>
+                </div>`).join('') : 'No indexes yet.';
+
+            const suggestions = document.getElementById('indexSuggestions');
+            const suggested = data.suggestions || [];
+            suggestions.innerHTML = suggested.length ? suggested.map(suggestion => `
+                <div class="d-flex justify-content-between align-items-center border-bottom py-1">
+                    <span><code>${escape(suggestion.columns.join(', '))}</code>
+                        <small class="text-muted ms-2">${escape(suggestion.reason)}</small></span>
+                    <button class="btn btn-outline-primary btn-sm" onclick='ZiqsyAdmin.indexes.create(${escape(JSON.stringify(suggestion.columns))})'>Create</button>
+                </div>`).join('') : 'No suggestions yet.';
+
+            const select = document.getElementById('indexColumns');
+            select.innerHTML = (data.columns || []).map(column =>
+                `<option value="${escape(column)}">${escape(column)}</option>`).join('');
+        },
+
+        createFromSelection: function() {
+            const select = document.getElementById('indexColumns');
+            const columns = Array.from(select.selectedOptions).map(option => option.value);
+            if (columns.length === 0) {
+                ZiqsyAdmin.notifications.error('Select at least one column');
+                return;
+            }
+            this.create(columns);
+        },
+
+        /**
+         * Declare an index and follow its background build
+         */
+        create: function(columns) {
+            fetch(`/api/page/${this.pageId()}/indexes`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ columns: columns })
+            })
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) throw new Error(data.message || data.error);
+                    ZiqsyAdmin.notifications.info(`Building index on ${columns.join(', ')}...`);
+                    this.load();
+                    return ZiqsyAdmin.jobs.poll(data.job_id);
+                })
+                .then(job => {
+                    const message = (job.result && job.result.message) || job.error;
+                    if (job.status === 'succeeded') {
+                        ZiqsyAdmin.notifications.success(message);
+                    } else {
+                        ZiqsyAdmin.notifications.error(message);
+                    }
+                    this.load();
+                })
+                .catch(error => ZiqsyAdmin.notifications.error('Index build failed: ' + error.message));
+        },
+
+        drop: function(name) {
+            if (!confirm(`Drop index ${name}?`)) return;
+            fetch(`/api/page/${this.pageId()}/indexes/${encodeURIComponent(name)}`, { method: 'DELETE' })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.success) {
+                        ZiqsyAdmin.notifications.success(data.message);
+                    } else {
+                        ZiqsyAdmin.notifications.error(data.message);
+                    }
+                    this.load();
+                })
+                .catch(error => ZiqsyAdmin.notifications.error('Could not drop index: ' + error.message));
+        },
+
+        escape: function(value) {
+            const div = document.createElement('div');
+            div.textContent = value == null ? '' : String(value);
+            return div.innerHTML.replace(/'/g, '&#39;').replace(/"/g, '&quot;');
+        }
+    },
+
     // Local storage utilities
     storage: {
         /**
@@ -324,6 +523,21 @@ window.ZiqsyAdmin = {
 
 // Initialize when DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
+    // Follow a queued upload after the redirect back to the page
+    const params = new URLSearchParams(window.location.search);
+    if (params.has('job')) {
+        ZiqsyAdmin.jobs.trackUpload(params.get('job'));
+        params.delete('job');
+        const query = params.toString();
+        window.history.replaceState(null, '', window.location.pathname + (query ? `?${query}` : ''));
+    }
+    
+    // Refresh the index manager whenever it opens
+    const indexModal = document.getElementById('indexManagerModal');
+    if (indexModal) {
+        indexModal.addEventListener('show.bs.modal', () => ZiqsyAdmin.indexes.load());
+    }
+    
     // Add global event listeners
     
     // File upload validation
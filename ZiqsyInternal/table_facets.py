@@ -0,0 +1,164 @@
+"""
+Faceted category counts for dynamic tables.
+Columns whose names contain category, group or type are facets. Their distinct
+values and counts come from one GROUP BY per column, each filtered by the
+selections on the other facets, so a page never has to download the table to
+build its filters. Results are cached in process per table version and
+selection. The first facet request declares and builds a secondary index on
+each facet column (see table_indexes.py).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from db_routing import read_connection
+from table_indexes import build_index, declare_index, index_name, list_indexes
+from utils import decode_cursor, encode_cursor, get_table_columns, get_table_version, MAX_PAGE_SIZE
+
+FACET_CACHE_ENTRIES = int(os.environ.get('FACET_CACHE_ENTRIES', '256'))
+FACET_KEYWORDS = ('category', 'group', 'type')
+MAX_FACET_COLUMNS = 8
+MAX_FACET_VALUES = 200
+NULL_VALUE = '__null__'  # Selects rows where the facet is NULL or empty
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (table, version, selection) -> facets
+_indexed = set()  # (table, facet columns) already checked for indexes by this process
+
+
+def facet_columns(table_name, columns=None):
+    """Category columns by the category/group/type naming convention, sorted"""
+    columns = columns if columns is not None else get_table_columns(table_name)
+    return sorted(col for col in columns if any(word in col.lower() for word in FACET_KEYWORDS))[:MAX_FACET_COLUMNS]
+
+
+def parse_selection(args, columns):
+    """Selected values per facet column from facet_<column> query arguments (repeatable)"""
+    selection = {}
+    for column in columns:
+        values = [value for value in args.getlist(f'facet_{column}') if value != '']
+        if values:
+            selection[column] = sorted(set(values))
+    return selection
+
+
+def _selection_sql(selection, skip=None):
+    """WHERE clause matching any selected value per column, all columns together"""
+    clauses, params = [], {}
+    for i, (column, values) in enumerate(sorted(selection.items())):
+        if column == skip:
+            continue
+        parts = []
+        named = [value for value in values if value != NULL_VALUE]
+        if named:
+            names = []
+            for j, value in enumerate(named):
+                params[f's{i}_{j}'] = value
+                names.append(f':s{i}_{j}')
+            parts.append(f'"{column}" IN ({", ".join(names)})')
+        if NULL_VALUE in values:
+            parts.append(f'"{column}" IS NULL OR "{column}" = \'\'')
+        clauses.append('(' + ' OR '.join(parts) + ')')
+    return (f' WHERE {" AND ".join(clauses)}' if clauses else ''), params
+
+
+def get_facets(table_name, selection=None):
+    """Distinct values and counts for every facet column.
+
+    Each column's counts apply the selections on the other columns, so the
+    values on offer are the ones that would still match. NULL and empty
+    values are counted together with value None.
+    """
+    columns = facet_columns(table_name)
+    selection = {col: values for col, values in (selection or {}).items() if col in columns}
+    key_selection = tuple(sorted((col, tuple(values)) for col, values in selection.items()))
+
+    with read_connection() as conn:
+        # Read on the connection that counts, so a lagging replica can't mislabel results
+        version = get_table_version(table_name, conn)
+        key = (table_name, version, key_selection)
+        with _lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return dict(_cache[key], cached=True)
+
+        where_sql, params = _selection_sql(selection)
+        total = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"{where_sql}'), params).scalar()
+        facets = []
+        for column in columns:
+            where_sql, params = _selection_sql(selection, skip=column)
+            rows = conn.execute(text(
+                f'SELECT "{column}" AS value, COUNT(*) AS value_count FROM "{table_name}"{where_sql} '
+                f'GROUP BY "{column}" ORDER BY value_count DESC LIMIT {MAX_FACET_VALUES + 2}'), params).all()
+            counts = {}
+            for value, count in rows:
+                value = None if value is None or value == '' else value
+                counts[value] = counts.get(value, 0) + count
+            values = sorted(counts.items(), key=lambda item: -item[1])
+            facets.append({
+                'column': column,
+                'values': [{'value': value, 'count': count} for value, count in values[:MAX_FACET_VALUES]],
+                'truncated': len(values) > MAX_FACET_VALUES,
+                'selected': selection.get(column, [])
+            })
+
+    result = {'facets': facets, 'total': total, 'version': version}
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > FACET_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return dict(result, cached=False)
+
+
+def get_facet_items(table_name, selection=None, limit=100, cursor=None):
+    """One page of rows matching the selected facet values, in id order"""
+    columns = facet_columns(table_name)
+    selection = {col: values for col, values in (selection or {}).items() if col in columns}
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    where_sql, params = _selection_sql(selection)
+
+    page_where = where_sql
+    if cursor:
+        _, cursor_id = decode_cursor(cursor)
+        page_where = f'{where_sql} AND id > :cursor_id' if where_sql else ' WHERE id > :cursor_id'
+        params = dict(params, cursor_id=cursor_id)
+
+    with read_connection() as conn:
+        total = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"{where_sql}'), params).scalar()
+        result = conn.execute(text(f'SELECT * FROM "{table_name}"{page_where} ORDER BY id LIMIT {limit}'), params)
+        keys = list(result.keys())
+        rows = [dict(zip(keys, row)) for row in result]
+
+    return {
+        'rows': rows,
+        'total': total,
+        'columns': keys,
+        'limit': limit,
+        'next_cursor': encode_cursor(rows[-1]['id'], rows[-1]['id']) if len(rows) == limit else None
+    }
+
+
+def ensure_facet_indexes(table_name, page_id, submit):
+    """Declare and build an index on each facet column that has none yet.
+
+    submit(build_index, table_name, name, columns) queues the build, e.g. on
+    the job queue. Returns the names of the indexes queued.
+    """
+    columns = facet_columns(table_name)
+    with _lock:
+        if (table_name, tuple(columns)) in _indexed:
+            return []
+        _indexed.add((table_name, tuple(columns)))
+    # Failed builds aren't retried here; they can be rebuilt from the page's index settings
+    declared = {index['name'] for index in list_indexes(table_name) if index.get('status') != 'missing'}
+    queued = []
+    for column in columns:
+        if index_name(table_name, [column]) in declared:
+            continue
+        declaration = declare_index(table_name, page_id, [column])
+        submit(build_index, table_name, declaration['name'], declaration['columns'])
+        queued.append(declaration['name'])
+    return queued
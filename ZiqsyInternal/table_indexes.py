@@ -0,0 +1,211 @@
+"""
+Secondary indexes on dynamic tables.
+Indexes are declared per table in DynamicTable.columns_info and built by a
+background job using online DDL, so reads and writes carry on while the index
+builds. query_dynamic_table reports which columns the data API sorts and
+filters on; columns that are used often but not indexed are offered as
+suggestions.
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import text, inspect
+
+from app import db
+from models import DynamicTable
+
+INDEX_SUGGEST_MIN_USES = int(os.environ.get('INDEX_SUGGEST_MIN_USES', '20'))
+TEXT_INDEX_PREFIX = 255  # MySQL can only index a prefix of TEXT columns
+MAX_INDEX_COLUMNS = 4
+
+_lock = threading.Lock()
+_usage = {}  # table -> column -> {'sort': n, 'exact': n, 'substring': n}
+
+
+def record_query_usage(table_name, sort=None, filters=None, exact_filters=None):
+    """Count the columns a data API query sorted and filtered on"""
+    with _lock:
+        table_usage = _usage.setdefault(table_name, {})
+        uses = [(sort, 'sort')] if sort and sort != 'id' else []
+        uses += [(col, 'substring') for col in (filters or {})]
+        uses += [(col, 'exact') for col in (exact_filters or {})]
+        for column, kind in uses:
+            counts = table_usage.setdefault(column, {'sort': 0, 'exact': 0, 'substring': 0})
+            counts[kind] += 1
+
+
+def get_query_usage(table_name):
+    with _lock:
+        return {col: dict(counts) for col, counts in _usage.get(table_name, {}).items()}
+
+
+def index_name(table_name, columns):
+    """Deterministic index name that stays within the 64 character identifier limit"""
+    name = f"ix_{table_name}_{'_'.join(columns)}"
+    if len(name) > 64:
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+        name = f'{name[:55]}_{digest}'
+    return name
+
+
+def list_indexes(table_name):
+    """Declared indexes for a table, each with its build status"""
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    if dynamic_table is None:
+        return []
+    built = {index['name'] for index in inspect(db.engine).get_indexes(table_name)}
+    indexes = []
+    for index in dynamic_table.get_indexes():
+        index = dict(index)
+        if index.get('status') == 'ready' and index['name'] not in built:
+            index['status'] = 'missing'
+        indexes.append(index)
+    return indexes
+
+
+def suggest_indexes(table_name, min_uses=None):
+    """Often sorted or exact-filtered columns that no declared index starts with"""
+    min_uses = min_uses or INDEX_SUGGEST_MIN_USES
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    indexed = {index['columns'][0] for index in dynamic_table.get_indexes()} if dynamic_table else set()
+
+    suggestions = []
+    for column, counts in get_query_usage(table_name).items():
+        indexable_uses = counts['sort'] + counts['exact']
+        if column in indexed or indexable_uses < min_uses:
+            continue
+        suggestions.append({
+            'columns': [column],
+            'uses': indexable_uses,
+            'reason': f"sorted {counts['sort']} times, exact-filtered {counts['exact']} times"
+        })
+    suggestions.sort(key=lambda suggestion: suggestion['uses'], reverse=True)
+    return suggestions
+
+
+def declare_index(table_name, page_id, columns):
+    """Validate and record an index; returns the declaration to build.
+
+    An index that is already built is returned unchanged with status 'ready'
+    and needs no build.
+    """
+    columns = [str(col) for col in columns]
+    if not columns or len(columns) > MAX_INDEX_COLUMNS:
+        raise ValueError(f'An index needs between 1 and {MAX_INDEX_COLUMNS} columns')
+    if len(set(columns)) != len(columns):
+        raise ValueError('Index columns must be distinct')
+
+    table_columns = {col['name'] for col in inspect(db.engine).get_columns(table_name)}
+    unknown = [col for col in columns if col not in table_columns]
+    if unknown:
+        raise ValueError(f'Unknown column(s): {", ".join(unknown)}')
+
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    if dynamic_table is None:
+        dynamic_table = DynamicTable(table_name=table_name, page_id=page_id)
+        db.session.add(dynamic_table)
+
+    name = index_name(table_name, columns)
+    existing = next((index for index in dynamic_table.get_indexes() if index['name'] == name), None)
+    if existing and existing.get('status') == 'ready' and _index_exists(table_name, name):
+        return existing
+    indexes = [index for index in dynamic_table.get_indexes() if index['name'] != name]
+    declaration = {
+        'name': name,
+        'columns': columns,
+        'status': 'building',
+        'error': None,
+        'requested_at': datetime.utcnow().isoformat()
+    }
+    indexes.append(declaration)
+    dynamic_table.set_indexes(indexes)
+    db.session.commit()
+    return declaration
+
+
+def _index_exists(table_name, name):
+    if db.engine.dialect.name == 'mysql':
+        return db.session.execute(text(
+            'SELECT 1 FROM information_schema.statistics '
+            'WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :name LIMIT 1'),
+            {'table': table_name, 'name': name}).first() is not None
+    return name in {index['name'] for index in inspect(db.engine).get_indexes(table_name)}
+
+
+def _index_columns_sql(table_name, columns):
+    schema = {}
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    if dynamic_table:
+        schema = dynamic_table.get_schema()
+    mysql = db.engine.dialect.name == 'mysql'
+    parts = []
+    for col in columns:
+        # Legacy dynamic tables are all TEXT, which MySQL indexes by prefix
+        if mysql and schema.get(col, 'TEXT') == 'TEXT':
+            parts.append(f'"{col}"({TEXT_INDEX_PREFIX})')
+        else:
+            parts.append(f'"{col}"')
+    return ', '.join(parts)
+
+
+def build_index(job, table_name, name, columns):
+    """Background job: build a declared index without locking the table"""
+    columns_sql = _index_columns_sql(table_name, columns)
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'postgresql':
+            # CONCURRENTLY can't run inside a transaction block
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table_name}" ({columns_sql})'))
+        elif dialect == 'mysql':
+            # ADD INDEX has no IF NOT EXISTS; a repeated build must not fail an index in use
+            if not _index_exists(table_name, name):
+                db.session.execute(text(
+                    f'ALTER TABLE "{table_name}" ADD INDEX "{name}" ({columns_sql}), ALGORITHM=INPLACE, LOCK=NONE'))
+        else:
+            db.session.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ({columns_sql})'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _set_index_status(table_name, name, 'failed', str(e))
+        return {'success': False, 'message': f'Index build failed: {str(e)}'}
+
+    _set_index_status(table_name, name, 'ready')
+    return {'success': True, 'message': f'Index {name} is ready', 'index': name}
+
+
+def drop_index(table_name, name):
+    """Drop an index and forget its declaration"""
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    indexes = dynamic_table.get_indexes() if dynamic_table else []
+    if name not in {index['name'] for index in indexes}:
+        return {'success': False, 'message': 'Index not found'}
+
+    try:
+        if name in {index['name'] for index in inspect(db.engine).get_indexes(table_name)}:
+            if db.engine.dialect.name == 'mysql':
+                db.session.execute(text(f'DROP INDEX "{name}" ON "{table_name}"'))
+            else:
+                db.session.execute(text(f'DROP INDEX "{name}"'))
+        dynamic_table.set_indexes([index for index in indexes if index['name'] != name])
+        db.session.commit()
+        return {'success': True, 'message': f'Index {name} dropped'}
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'message': str(e)}
+
+
+def _set_index_status(table_name, name, status, error=None):
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    if dynamic_table is None:
+        return
+    indexes = dynamic_table.get_indexes()
+    for index in indexes:
+        if index['name'] == name:
+            index['status'] = status
+            index['error'] = error
+    dynamic_table.set_indexes(indexes)
+    db.session.commit()
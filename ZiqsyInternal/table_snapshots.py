@@ -0,0 +1,161 @@
+"""
+Columnar snapshots of dynamic tables.
+After an upload or a batch edit the table is written to local disk as an
+uncompressed Arrow IPC file named after its version stamp (see
+utils.get_table_version). Readers memory-map the file, so the analytics
+engine, the full-table data API and any DataFrame built with to_pandas() read
+column buffers straight from the page cache instead of pulling rows out of
+MySQL. A snapshot is only used while its version still matches the live
+table; otherwise readers fall back to the database. Requests for the same table are coalesced while a write is
+queued, and older snapshots are removed once a newer one is in place.
+
+Snapshots need pyarrow; without it nothing is written and readers always use
+the database.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from db_routing import read_connection
+from utils import (arrow_column_array, arrow_column_types, get_dynamic_table_data, get_table_version,
+                   table_json_value)
+
+SNAPSHOT_FOLDER = os.environ.get('SNAPSHOT_FOLDER', 'snapshots')
+SNAPSHOT_BATCH_ROWS = int(os.environ.get('SNAPSHOT_BATCH_ROWS', '50000'))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = set()  # Tables with a snapshot write queued but not yet started
+_write_lock = threading.Lock()  # One write at a time, so cleanup never races a newer file
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+    except ImportError:
+        raise ValueError('Table snapshots require the pyarrow package')
+    return pa, ipc
+
+
+def snapshot_path(table_name, version):
+    digest = hashlib.sha1(version.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_FOLDER, f'{table_name}.{digest}.arrow')
+
+
+def write_snapshot(table_name):
+    """Write the table's current contents to a new snapshot; returns its path and version"""
+    pa, ipc = _pyarrow()
+    started = time.perf_counter()
+    os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
+    column_types = arrow_column_types(pa, table_name)
+
+    # The stamp and the rows are read in one transaction on one connection, so
+    # the snapshot is labelled with the version of the rows it holds
+    with read_connection() as conn:
+        version = get_table_version(table_name, conn)
+        path = snapshot_path(table_name, version)
+        if os.path.exists(path):
+            return {'success': True, 'path': path, 'version': version, 'skipped': True}
+
+        result = conn.execution_options(stream_results=True, yield_per=SNAPSHOT_BATCH_ROWS).execute(
+            text(f'SELECT * FROM "{table_name}" ORDER BY id'))
+        columns = list(result.keys())
+        schema = pa.schema([pa.field(column, column_types.get(column, pa.string())) for column in columns],
+                           metadata={'table_name': table_name, 'version': version})
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=SNAPSHOT_FOLDER)
+        os.close(fd)
+        rows = 0
+        try:
+            with pa.OSFile(temp_path, 'wb') as sink, ipc.new_file(sink, schema) as writer:
+                for batch in result.partitions(SNAPSHOT_BATCH_ROWS):
+                    arrays = [arrow_column_array(pa, [row[i] for row in batch], schema.field(i).type)
+                              for i in range(len(columns))]
+                    writer.write_batch(pa.record_batch(arrays, schema=schema))
+                    rows += len(batch)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Readers that already mapped an older file keep it until they let go
+    for old_path in glob.glob(os.path.join(SNAPSHOT_FOLDER, f'{glob.escape(table_name)}.*.arrow')):
+        if old_path != path:
+            os.remove(old_path)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Wrote snapshot of {table_name} ({rows} rows, version {version}) in {elapsed:.2f}s")
+    return {'success': True, 'path': path, 'version': version, 'rows': rows,
+            'bytes': os.path.getsize(path), 'elapsed_seconds': round(elapsed, 4)}
+
+
+def read_snapshot(table_name, version=None):
+    """The table as a memory-mapped Arrow table, or None if there is no current snapshot.
+
+    version defaults to the live table's version stamp; pass it when the
+    caller already has it.
+    """
+    try:
+        pa, ipc = _pyarrow()
+    except ValueError:
+        return None
+    path = snapshot_path(table_name, version or get_table_version(table_name))
+    try:
+        # Zero-copy: the table's buffers point into the mapping and keep it open
+        return ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    except FileNotFoundError:
+        return None
+    except (OSError, pa.ArrowInvalid) as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def read_table_rows(table_name):
+    """The whole table as JSON-ready row dicts, from the current snapshot or else the database.
+
+    Both sources give the same values (see utils.table_json_value).
+    """
+    snapshot = read_snapshot(table_name)
+    if snapshot is None:
+        return get_dynamic_table_data(table_name)
+    return [{column: table_json_value(value) for column, value in row.items()} for row in snapshot.to_pylist()]
+
+
+def snapshot_job(job, table_name):
+    """Background job: write a table snapshot"""
+    with _lock:
+        # Changes made from here on need another snapshot
+        _pending.discard(table_name)
+    with _write_lock:
+        return write_snapshot(table_name)
+
+
+def request_snapshot(table_name, submit):
+    """Queue a snapshot write unless one is already waiting for this table.
+
+    submit(snapshot_job, table_name) queues the write, e.g. on the job queue.
+    Returns whether a write was queued.
+    """
+    try:
+        _pyarrow()
+    except ValueError:
+        return False
+    with _lock:
+        if table_name in _pending:
+            return False
+        _pending.add(table_name)
+    try:
+        submit(snapshot_job, table_name)
+    except Exception:
+        with _lock:
+            _pending.discard(table_name)
+        raise
+    return True
@@ -1,70 +1,380 @@
 """
 Temporary in-memory storage for when database is unavailable
-This allows the application to function normally while PostgreSQL recovers
+This allows the application to function normally while the database recovers.
+
+Sections and pages are indexed by id (and pages by section_id) so lookups are
+O(1). Every change is appended to a local journal, which is reloaded on
+restart; a background replayer flushes the journal into the sections and
+pages tables once the database is reachable again.
+
+All worker processes share the journal. Every read and write of it holds an
+flock on a side lock file, each process rebuilds its in-memory view whenever
+another process has changed the journal, and only one process replays at a
+time. A change that keeps failing to replay is moved to a dead-letter file
+after TEMP_STORAGE_MAX_ATTEMPTS tries so it can't hold up the rest.
 """
 
+import fcntl
 import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+# Ids handed out while the database is down start here so they can't be
+# mistaken for real sections and pages
+TEMP_ID_START = 1_000_000_000
+TEMP_STORAGE_JOURNAL = os.environ.get('TEMP_STORAGE_JOURNAL', 'temp_storage.journal')
+REPLAY_INTERVAL_SECONDS = float(os.environ.get('TEMP_STORAGE_REPLAY_SECONDS', '15'))
+MAX_REPLAY_ATTEMPTS = int(os.environ.get('TEMP_STORAGE_MAX_ATTEMPTS', '5'))
+
+logger = logging.getLogger(__name__)
+
+
+def is_temp_id(item_id):
+    return item_id is not None and item_id >= TEMP_ID_START
+
+
 class TempStorage:
-    def __init__(self):
-        self.sections = []
-        self.pages = []
-        self.dynamic_tables = []
-        self.file_repositories = []
-        self._section_id_counter = 1
-        self._page_id_counter = 1
-        self._table_id_counter = 1
-        self._file_id_counter = 1
-    
+    def __init__(self, journal_path=TEMP_STORAGE_JOURNAL):
+        self.journal_path = journal_path
+        self.lock_path = f'{journal_path}.lock'
+        self.dead_letter_path = f'{journal_path}.dead'
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._journal_stamp = None
+        self._replayer = None
+        self.clear()
+        with self._locked():
+            self._refresh()
+        if self._entries:
+            self.start_replayer()
+
+    @property
+    def sections(self):
+        with self._locked():
+            self._refresh()
+            return list(self._sections.values())
+
+    @property
+    def pages(self):
+        with self._locked():
+            self._refresh()
+            return list(self._pages.values())
+
     def add_section(self, name):
-        section = {
-            'id': self._section_id_counter,
-            'name': name,
-            'created_at': datetime.utcnow(),
-            'pages': []
-        }
-        self.sections.append(section)
-        self._section_id_counter += 1
-        return section
-    
+        with self._locked():
+            self._refresh()
+            section = self._apply('add_section', {'id': self._section_id_counter, 'name': name,
+                                                  'created_at': datetime.utcnow().isoformat()})
+            self._journal('add_section', {'id': section['id'], 'name': name,
+                                          'created_at': section['created_at'].isoformat()})
+            return section
+
     def get_sections(self):
-        # Add pages to sections
-        for section in self.sections:
-            section['pages'] = [p for p in self.pages if p['section_id'] == section['id']]
-        return self.sections
-    
+        with self._locked():
+            self._refresh()
+            return [dict(section, pages=list(self._pages_by_section.get(section['id'], {}).values()))
+                    for section in self._sections.values()]
+
     def delete_section(self, section_id):
-        self.sections = [s for s in self.sections if s['id'] != section_id]
-        # Also delete associated pages
-        self.pages = [p for p in self.pages if p['section_id'] != section_id]
-    
+        with self._locked():
+            self._refresh()
+            self._apply('delete_section', {'id': section_id})
+            self._journal('delete_section', {'id': section_id})
+
     def add_page(self, name, page_type, section_id, table_name=None, config=None):
-        page = {
-            'id': self._page_id_counter,
-            'name': name,
-            'page_type': page_type,
-            'section_id': section_id,
-            'table_name': table_name,
-            'config': config,
-            'created_at': datetime.utcnow()
-        }
-        self.pages.append(page)
-        self._page_id_counter += 1
-        return page
-    
+        with self._locked():
+            self._refresh()
+            data = {'id': self._page_id_counter, 'name': name, 'page_type': page_type,
+                    'section_id': section_id, 'table_name': table_name, 'config': config,
+                    'created_at': datetime.utcnow().isoformat()}
+            page = self._apply('add_page', data)
+            self._journal('add_page', data)
+            return page
+
     def get_page(self, page_id):
-        return next((p for p in self.pages if p['id'] == page_id), None)
-    
+        with self._locked():
+            self._refresh()
+            return self._pages.get(page_id)
+
     def delete_page(self, page_id):
-        self.pages = [p for p in self.pages if p['id'] != page_id]
-    
+        with self._locked():
+            self._refresh()
+            self._apply('delete_page', {'id': page_id})
+            self._journal('delete_page', {'id': page_id})
+
+    def pending_changes(self):
+        """Number of journaled changes not yet written to the database"""
+        with self._locked():
+            self._refresh()
+            return len(self._entries)
+
     def clear(self):
         """Clear all temporary data"""
-        self.sections = []
-        self.pages = []
-        self.dynamic_tables = []
-        self.file_repositories = []
+        with self._lock:
+            self._reset_indexes()
+            self._entries = []
+            self.dynamic_tables = []
+            self.file_repositories = []
+            self._section_id_counter = TEMP_ID_START
+            self._page_id_counter = TEMP_ID_START
+            self._table_id_counter = 1
+            self._file_id_counter = 1
+
+    # In-memory indexes
+
+    def _reset_indexes(self):
+        self._sections = {}
+        self._pages = {}
+        self._pages_by_section = {}
+
+    def _reindex(self):
+        """Rebuild the in-memory indexes from the pending entries"""
+        self._reset_indexes()
+        for entry in self._entries:
+            self._apply(entry['op'], entry['data'])
+
+    def _apply(self, op, data):
+        """Apply one change to the in-memory indexes"""
+        if op == 'add_section':
+            section = {'id': data['id'], 'name': data['name'],
+                       'created_at': datetime.fromisoformat(data['created_at']), 'pages': []}
+            self._sections[section['id']] = section
+            self._section_id_counter = max(self._section_id_counter, section['id'] + 1)
+            return section
+        if op == 'delete_section':
+            self._sections.pop(data['id'], None)
+            # Also delete associated pages
+            for page_id in self._pages_by_section.pop(data['id'], {}):
+                self._pages.pop(page_id, None)
+            return None
+        if op == 'add_page':
+            page = dict(data, created_at=datetime.fromisoformat(data['created_at']))
+            self._pages[page['id']] = page
+            self._pages_by_section.setdefault(page['section_id'], {})[page['id']] = page
+            self._page_id_counter = max(self._page_id_counter, page['id'] + 1)
+            return page
+        if op == 'delete_page':
+            page = self._pages.pop(data['id'], None)
+            if page:
+                self._pages_by_section.get(page['section_id'], {}).pop(page['id'], None)
+            return None
+        raise ValueError(f'Unknown journal operation: {op}')
+
+    # Journal
+
+    @contextmanager
+    def _locked(self, blocking=True):
+        """Hold this process's lock and the cross-process journal lock.
+
+        Yields False without waiting if blocking is off and another process
+        holds the journal lock. Nested use in one thread doesn't lock twice.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield True
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+                self._lock_depth = 1
+                try:
+                    yield True
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stat_journal(self):
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _refresh(self):
+        """Reload the journal if another process changed it; call with the journal lock held"""
+        stamp = self._stat_journal()
+        if stamp == self._journal_stamp:
+            return
+        self._entries = []
+        if stamp is not None:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        if 'op' not in entry or 'data' not in entry:
+                            raise KeyError('op')
+                        self._entries.append(entry)
+                    except (ValueError, KeyError) as e:
+                        # A torn last line from a crash mid-write; everything before it is intact
+                        logger.warning(f"Skipping unreadable temp storage journal entry: {e}")
+        self._reindex()
+        self._journal_stamp = stamp
+
+    def _journal(self, op, data):
+        """Append a change; call with the journal lock held"""
+        entry = {'op': op, 'data': data}
+        self._entries.append(entry)
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.error(f"Could not write temp storage journal: {e}")
+        self._journal_stamp = self._stat_journal()
+        self.start_replayer()
+
+    def _rewrite_journal(self):
+        """Atomically replace the journal with the entries still pending; call with the journal lock held"""
+        if not self._entries:
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+        else:
+            tmp_path = f'{self.journal_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self._entries:
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+        self._journal_stamp = self._stat_journal()
+
+    def _dead_letter(self, entry, error):
+        """Set aside a change that keeps failing to replay"""
+        logger.error(f"Giving up on temp storage change after {entry['attempts']} attempts, "
+                     f"moved to {self.dead_letter_path}: {entry} ({error})")
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(entry, error=str(error), failed_at=datetime.utcnow().isoformat())) + '\n')
+        except OSError as e:
+            logger.error(f"Could not write temp storage dead-letter file: {e}")
+
+    # Replay into the database
+
+    def start_replayer(self):
+        """Start the background thread that flushes the journal, if it isn't running"""
+        if self._replayer and self._replayer.is_alive():
+            return
+        self._replayer = threading.Thread(target=self._replay_loop, name='temp-storage-replayer', daemon=True)
+        self._replayer.start()
+
+    def _replay_loop(self):
+        while True:
+            time.sleep(REPLAY_INTERVAL_SECONDS)
+            if not self.pending_changes():
+                continue
+            try:
+                self.replay()
+            except Exception as e:
+                logger.debug(f"Temp storage replay deferred: {e}")
+
+    def replay(self):
+        """Write journaled changes to the database, oldest first.
+
+        Each change commits on its own and is dropped from the journal straight
+        after, so a failure part-way leaves only the unwritten changes queued.
+        A change that has failed MAX_REPLAY_ATTEMPTS times is dead-lettered and
+        replay moves on. Returns the number of changes written (0 when another
+        process is already replaying).
+        """
+        from sqlalchemy import text
+        from app import app, db
+        from models import Section, Page
+        from navigation import invalidate_navigation
+        from db_health import db_breaker
+
+        if db_breaker.is_open():
+            return 0  # The breaker's own probe decides when the database is back
+
+        written = 0
+        with app.app_context():
+            db.session.execute(text('SELECT 1'))  # Raises while the database is still down
+            with self._locked(blocking=False) as acquired:
+                if not acquired:
+                    return 0  # Another worker is replaying
+                self._refresh()
+                while self._entries:
+                    entry = self._entries[0]
+                    try:
+                        ids = self._write_entry(db, Section, Page, entry['op'], entry['data'])
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        entry['attempts'] = entry.get('attempts', 0) + 1
+                        if entry['attempts'] < MAX_REPLAY_ATTEMPTS:
+                            self._rewrite_journal()
+                            raise
+                        self._dead_letter(entry, e)
+                        self._entries.pop(0)
+                        self._rewrite_journal()
+                        self._reindex()
+                        continue
+                    self._entries.pop(0)
+                    if ids:
+                        self._remap(*ids)
+                    self._rewrite_journal()
+                    self._reindex()
+                    written += 1
+            db.session.remove()
+
+        if written:
+            invalidate_navigation()
+            logger.info(f"Replayed {written} temp storage changes into the database")
+        return written
+
+    def _write_entry(self, db, Section, Page, op, data):
+        """Apply one journal entry to the database; returns (kind, temp_id, real_id) for creates"""
+        if op == 'add_section':
+            section = Section(name=data['name'], created_at=datetime.fromisoformat(data['created_at']))
+            db.session.add(section)
+            db.session.flush()
+            return 'section', data['id'], section.id
+        if op == 'add_page':
+            if is_temp_id(data['section_id']):
+                return None  # Its section was deleted before it reached the database
+            page = Page(name=data['name'], page_type=data['page_type'], section_id=data['section_id'],
+                        table_name=data.get('table_name'), config=data.get('config'),
+                        created_at=datetime.fromisoformat(data['created_at']))
+            db.session.add(page)
+            db.session.flush()
+            return 'page', data['id'], page.id
+        if op in ('delete_section', 'delete_page'):
+            if is_temp_id(data['id']):
+                return None  # Never reached the database
+            model = Section if op == 'delete_section' else Page
+            record = db.session.get(model, data['id'])
+            if record:
+                db.session.delete(record)
+            return None
+        raise ValueError(f'Unknown journal operation: {op}')
+
+    def _remap(self, kind, temp_id, real_id):
+        """Point pending entries at the real id of an item that reached the database"""
+        for entry in self._entries:
+            data = entry['data']
+            if kind == 'section':
+                if entry['op'] == 'delete_section' and data['id'] == temp_id:
+                    data['id'] = real_id
+                elif entry['op'] == 'add_page' and data['section_id'] == temp_id:
+                    data['section_id'] = real_id
+            elif entry['op'] == 'delete_page' and data['id'] == temp_id:
+                data['id'] = real_id
 
 # Global temporary storage instance
-temp_storage = TempStorage()
\ No newline at end of file
+temp_storage = TempStorage()
@@ -1,26 +1,54 @@
 import pandas as pd
 import os
+import logging
+import json
+import base64
+import csv
+import io
+import zlib
 import tempfile
-from sqlalchemy import text, inspect
+import time
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import text, inspect, update
+from sqlalchemy.exc import SQLAlchemyError
 from app import db
-from models import DynamicTable
+from models import DynamicTable, DatasetProfile
+from dataset_profile import empty_profile, add_rows, remove_rows
+from db_routing import read_connection
+from ingest import SessionTarget, bulk_insert, build_insert_sql
+from table_indexes import record_query_usage
+from column_types import (UNKNOWN_TYPE, coerce_input, convert_rows, infer_schema,
+                          normalize_sql_type, widen_type)
+
+# Rows per DataFrame chunk when streaming uploads into the insert stage
+UPLOAD_CHUNK_ROWS = int(os.environ.get('UPLOAD_CHUNK_ROWS', '10000'))
+# Rows fetched per round-trip from the server-side cursor during exports
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '5000'))
 
 def create_dynamic_table(table_name, columns):
-    """Create a dynamic table based on CSV columns"""
+    """Create a dynamic table based on CSV columns.
+
+    columns is a list of names (stored as TEXT) or a dict of name -> SQL type.
+    """
     try:
         # Sanitize table name
         table_name = table_name.replace(' ', '_').replace('-', '_').lower()
         
+        if not isinstance(columns, dict):
+            columns = {col: 'TEXT' for col in columns}
+        
         # Create table with dynamic columns
         columns_sql = []
-        for col in columns:
+        for col, sql_type in columns.items():
             col_name = col.replace(' ', '_').replace('-', '_').lower()
-            columns_sql.append(f'"{col_name}" TEXT')
+            columns_sql.append(f'"{col_name}" {sql_type or UNKNOWN_TYPE}')
         
-        # Add id and metadata columns
+        # Add id and metadata columns (SQLite only auto-numbers INTEGER PRIMARY KEY)
+        id_sql = 'INTEGER PRIMARY KEY AUTOINCREMENT' if db.engine.dialect.name == 'sqlite' else 'SERIAL PRIMARY KEY'
         sql = f'''
         CREATE TABLE IF NOT EXISTS "{table_name}" (
-            id SERIAL PRIMARY KEY,
+            id {id_sql},
             {', '.join(columns_sql)},
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -35,109 +63,722 @@ def create_dynamic_table(table_name, columns):
         db.session.rollback()
         return {'success': False, 'error': str(e)}
 
-def insert_csv_data(table_name, df):
-    """Insert DataFrame data into dynamic table"""
+def sanitize_column_name(column_name):
+    """Convert "User Name" -> "user_name" for use as a SQL column"""
+    return str(column_name).replace(' ', '_').replace('-', '_').lower()
+
+def insert_csv_data(table_name, df, batch_size=None, schema=None):
+    """Insert DataFrame data into dynamic table using batched parameterized inserts.
+
+    schema maps column -> SQL type; values are converted to match it and nulls
+    are stored as NULL. Without a schema the column types are inferred from df.
+    """
     try:
         # Sanitize column names
-        df.columns = [col.replace(' ', '_').replace('-', '_').lower() for col in df.columns]
-        
-        # Insert data
-        for _, row in df.iterrows():
-            columns = ', '.join([f'"{col}"' for col in df.columns])
-            escaped_values = []
-            for val in row:
-                str_val = str(val)
-                escaped_val = str_val.replace("'", "''")
-                escaped_values.append(f"'{escaped_val}'")
-            values = ', '.join(escaped_values)
-            
-            sql = f'INSERT INTO "{table_name}" ({columns}) VALUES ({values})'
-            db.session.execute(text(sql))
+        df.columns = [sanitize_column_name(col) for col in df.columns]
         
-        db.session.commit()
-        return {'success': True, 'rows_inserted': len(df)}
+        rows = convert_rows(df, schema or infer_schema(df))
+        target = SessionTarget(db.session, before_commit=lambda: bump_table_version(table_name))
+        result = bulk_insert(target, table_name, list(df.columns), rows, batch_size=batch_size)
+        if result['success']:
+            _apply_profile_change(table_name, list(df.columns),
+                                  added=df.itertuples(index=False, name=None))
+        return result
     except Exception as e:
         db.session.rollback()
         return {'success': False, 'error': str(e)}
 
+def table_json_value(value):
+    """One JSON representation for table values, whether read from the database or a snapshot"""
+    if isinstance(value, bool):
+        return int(value)  # MySQL returns BOOLEAN (TINYINT) columns as 0/1
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')  # As SQLite stores it
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
 def get_dynamic_table_data(table_name):
     """Get all data from a dynamic table"""
     try:
         sql = f'SELECT * FROM "{table_name}" ORDER BY id'
-        result = db.session.execute(text(sql))
-        
-        # Convert to list of dictionaries
-        columns = result.keys()
-        data = []
-        for row in result:
-            data.append(dict(zip(columns, row)))
+        with read_connection() as conn:
+            result = conn.execute(text(sql))
+            
+            # Convert to list of dictionaries
+            columns = result.keys()
+            data = []
+            for row in result:
+                data.append({col: table_json_value(value) for col, value in zip(columns, row)})
         
         return data
     except Exception as e:
         return []
 
-def update_dynamic_table_row(table_name, row_id, values):
-    """Update a row in dynamic table"""
+def bump_table_version(table_name):
+    """Count a write to a dynamic table; call inside the transaction that makes the write"""
+    db.session.execute(update(DynamicTable)
+                       .where(DynamicTable.table_name == table_name)
+                       .values(data_version=DynamicTable.data_version + 1))
+
+def get_table_version(table_name, conn=None):
+    """Version stamp for a dynamic table; changes with every committed write.
+
+    It is the table's data_version counter (see bump_table_version). Tables
+    without a DynamicTable record fall back to row count, max id and max
+    updated_at. conn reads the stamp on a given connection, e.g. the one that
+    is about to read the rows.
+    """
+    # The stamp names the table, so caches keyed on it alone never mix up two tables
+    execute = (conn or db.session).execute
+    counter = execute(text('SELECT data_version FROM dynamic_table WHERE table_name = :table_name'),
+                      {'table_name': table_name}).scalar()
+    if counter is not None:
+        return f'{table_name}:v{counter}'
+    count, max_id, max_updated = execute(
+        text(f'SELECT COUNT(*), MAX(id), MAX(updated_at) FROM "{table_name}"')).one()
+    return f'{table_name}:{count}:{max_id}:{max_updated}'
+
+def count_table_rows(table_name):
+    """Row count of a dynamic table"""
+    return db.session.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(sort_value, row_id):
+    """Encode a keyset cursor pointing just past the given row"""
+    payload = json.dumps({'v': sort_value, 'id': row_id}, default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a keyset cursor produced by encode_cursor"""
     try:
-        set_clauses = []
-        for key, value in values.items():
-            if key != 'id':  # Don't update the ID
-                key = key.replace(' ', '_').replace('-', '_').lower()
-                escaped_value = str(value).replace("'", "''")
-                set_clauses.append(f'"{key}" = \'{escaped_value}\'')
-        
-        if set_clauses:
-            set_clauses.append('updated_at = CURRENT_TIMESTAMP')
-            sql = f'UPDATE "{table_name}" SET {", ".join(set_clauses)} WHERE id = {row_id}'
-            db.session.execute(text(sql))
-            db.session.commit()
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return payload.get('v'), int(payload['id'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def query_dynamic_table(table_name, limit=100, offset=0, cursor=None, sort=None, order='asc',
+                        filters=None, exact_filters=None):
+    """Get one page of a dynamic table with sorting, filtering and a total count.
+
+    filters maps column -> substring match, exact_filters maps column -> exact match.
+    When cursor is given, keyset pagination on (sort column, id) replaces offset.
+    """
+    columns = get_table_columns(table_name)
+    if not columns:
+        return {'rows': [], 'total': 0, 'columns': [], 'limit': limit, 'offset': offset, 'next_cursor': None}
+    
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = max(0, int(offset))
+    sort = sort or 'id'
+    if sort not in columns:
+        raise ValueError(f'Unknown sort column: {sort}')
+    descending = str(order).lower() == 'desc'
+    
+    where_clauses = []
+    params = {}
+    for i, (column, value) in enumerate((filters or {}).items()):
+        if column not in columns:
+            raise ValueError(f'Unknown filter column: {column}')
+        where_clauses.append(f'LOWER("{column}") LIKE :f{i}')
+        params[f'f{i}'] = f'%{str(value).lower()}%'
+    for i, (column, value) in enumerate((exact_filters or {}).items()):
+        if column not in columns:
+            raise ValueError(f'Unknown filter column: {column}')
+        where_clauses.append(f'"{column}" = :e{i}')
+        params[f'e{i}'] = value
+    
+    where_sql = f' WHERE {" AND ".join(where_clauses)}' if where_clauses else ''
+    record_query_usage(table_name, sort, filters, exact_filters)
+    
+    page_clauses = list(where_clauses)
+    if cursor:
+        cursor_value, cursor_id = decode_cursor(cursor)
+        op = '<' if descending else '>'
+        if sort == 'id':
+            page_clauses.append(f'id {op} :cursor_id')
+        elif cursor_value is None:
+            # NULLs sort first ascending and last descending (MySQL ordering)
+            if descending:
+                page_clauses.append(f'("{sort}" IS NULL AND id < :cursor_id)')
+            else:
+                page_clauses.append(f'("{sort}" IS NOT NULL OR id > :cursor_id)')
+        else:
+            nulls_after = f' OR "{sort}" IS NULL' if descending else ''
+            page_clauses.append(f'("{sort}" {op} :cursor_value OR ("{sort}" = :cursor_value AND id {op} :cursor_id){nulls_after})')
+            params['cursor_value'] = cursor_value
+        params['cursor_id'] = cursor_id
+        offset = 0
+    
+    direction = 'DESC' if descending else 'ASC'
+    order_sql = f'id {direction}' if sort == 'id' else f'"{sort}" {direction}, id {direction}'
+    page_where = f' WHERE {" AND ".join(page_clauses)}' if page_clauses else ''
+    sql = f'SELECT * FROM "{table_name}"{page_where} ORDER BY {order_sql} LIMIT {limit} OFFSET {offset}'
+    # Both statements on one replica connection, so the count and the page agree
+    with read_connection() as conn:
+        total = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"{where_sql}'), params).scalar()
+        result = conn.execute(text(sql), params)
+        keys = list(result.keys())
+        rows = [dict(zip(keys, row)) for row in result]
+    
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.get(sort), last['id'])
+    
+    return {
+        'rows': rows,
+        'total': total,
+        'columns': keys,
+        'limit': limit,
+        'offset': offset,
+        'next_cursor': next_cursor
+    }
+
+MAX_BATCH_OPERATIONS = 5000
+
+def apply_row_mutations(table_name, operations):
+    """Apply a list of insert/update/delete operations in one transaction.
+
+    Each operation is {'action': 'insert', 'values': {...}},
+    {'action': 'update', 'id': ..., 'values': {...}} or {'action': 'delete', 'id': ...}.
+    Consecutive operations of the same shape run as one executemany statement.
+    Invalid operations reject the whole batch; updates and deletes of missing
+    rows are reported as not_found and change nothing.
+    """
+    started = time.perf_counter()
+    if not isinstance(operations, list) or not operations:
+        return {'success': False, 'message': 'operations must be a non-empty list', 'results': []}
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return {'success': False, 'message': f'At most {MAX_BATCH_OPERATIONS} operations per batch', 'results': []}
+    
+    inspector = inspect(db.engine)
+    if not inspector.has_table(table_name):
+        return {'success': False, 'message': 'Table not found', 'results': []}
+    schema = _get_table_schema(table_name, inspector)
+    
+    # Validate everything before touching the table
+    results = []
+    prepared = []
+    for index, op in enumerate(operations):
+        result = {'index': index, 'action': op.get('action') if isinstance(op, dict) else None}
+        try:
+            prepared.append(_prepare_mutation(op, schema))
+            result['status'] = 'ok'
+            if result['action'] != 'insert':
+                result['id'] = prepared[-1]['id']
+        except (ValueError, TypeError, KeyError) as e:
+            prepared.append(None)
+            result['status'] = 'error'
+            result['message'] = str(e)
+        results.append(result)
+    
+    if any(result['status'] == 'error' for result in results):
+        return {'success': False, 'message': 'Batch rejected: some operations are invalid', 'results': results}
+    
+    try:
+        # Current state of every row the batch touches, for not_found checks and the profile
+        columns, before = _fetch_rows(table_name, {op['id'] for op in prepared if op['action'] != 'insert'})
+        state = dict(before)
+        inserted = []
+        
+        for action, keys, group in _group_mutations(prepared):
+            live = []
+            for i, op in group:
+                if action != 'insert' and state.get(op['id']) is None:
+                    results[i]['status'] = 'not_found'
+                    continue
+                live.append(op)
+                if action == 'delete':
+                    state[op['id']] = None
+                elif action == 'update':
+                    row = dict(zip(columns, state[op['id']]))
+                    row.update(op['values'])
+                    state[op['id']] = tuple(row.get(col) for col in columns)
+                else:
+                    inserted.append(tuple(op['values'].get(col) for col in columns))
+            if live:
+                _execute_mutation_group(table_name, action, keys, live)
         
-        return {'success': True, 'message': 'Row updated successfully'}
+        bump_table_version(table_name)
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
-        return {'success': False, 'message': str(e)}
+        return {'success': False, 'message': str(e), 'results': results}
+    
+    removed = [row for row in before.values()]
+    added = [row for row in state.values() if row is not None] + inserted
+    if removed or added:
+        _apply_profile_change(table_name, columns, added=added, removed=removed)
+    
+    elapsed = time.perf_counter() - started
+    applied = sum(1 for result in results if result['status'] == 'ok')
+    return {
+        'success': True,
+        'message': f'Applied {applied} of {len(operations)} operations',
+        'results': results,
+        'applied': applied,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(applied / elapsed, 1) if elapsed > 0 else float(applied)
+    }
+
+def _prepare_mutation(op, schema):
+    """Validate one operation and convert its values for the column types"""
+    if not isinstance(op, dict):
+        raise ValueError('Operation must be an object')
+    action = op.get('action')
+    if action not in ('insert', 'update', 'delete'):
+        raise ValueError(f'Unknown action: {action}')
+    
+    prepared = {'action': action}
+    if action != 'insert':
+        prepared['id'] = int(op['id'])
+    if action == 'delete':
+        return prepared
+    
+    values = {}
+    for key, value in (op.get('values') or {}).items():
+        column = sanitize_column_name(key)
+        if column in ('id', 'created_at', 'updated_at'):
+            continue
+        if column not in schema:
+            raise ValueError(f'Unknown column: {column}')
+        values[column] = coerce_input(value, schema[column])
+    if action == 'update' and not values:
+        raise ValueError('Update has no values')
+    prepared['values'] = values
+    return prepared
+
+def _group_mutations(prepared):
+    """Group consecutive operations that can share one statement, keeping order"""
+    groups = []
+    for i, op in enumerate(prepared):
+        keys = tuple(sorted(op.get('values', {})))
+        if groups and groups[-1][0] == op['action'] and groups[-1][1] == keys:
+            groups[-1][2].append((i, op))
+        else:
+            groups.append((op['action'], keys, [(i, op)]))
+    return groups
+
+def _execute_mutation_group(table_name, action, keys, ops):
+    if action == 'insert':
+        target = SessionTarget(db.session)
+        target.executemany(build_insert_sql(target, table_name, list(keys)),
+                           [[op['values'][key] for key in keys] for op in ops])
+    elif action == 'update':
+        assignments = ', '.join(f'"{key}" = :v{i}' for i, key in enumerate(keys))
+        sql = f'UPDATE "{table_name}" SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = :id'
+        params = [dict({f'v{i}': op['values'][key] for i, key in enumerate(keys)}, id=op['id']) for op in ops]
+        db.session.execute(text(sql), params)
+    else:
+        db.session.execute(text(f'DELETE FROM "{table_name}" WHERE id = :id'), [{'id': op['id']} for op in ops])
+
+def _fetch_rows(table_name, row_ids):
+    """Get (columns, {id: row}) for the given ids"""
+    if not row_ids:
+        result = db.session.execute(text(f'SELECT * FROM "{table_name}" WHERE 1 = 0'))
+        return list(result.keys()), {}
+    rows = {}
+    ids = sorted(row_ids)
+    columns = []
+    for start in range(0, len(ids), 1000):
+        chunk = ids[start:start + 1000]
+        placeholders = ', '.join(f':id{i}' for i in range(len(chunk)))
+        result = db.session.execute(text(f'SELECT * FROM "{table_name}" WHERE id IN ({placeholders})'),
+                                    {f'id{i}': row_id for i, row_id in enumerate(chunk)})
+        columns = list(result.keys())
+        for row in result:
+            rows[row[columns.index('id')]] = tuple(row)
+    return columns, rows
+
+def update_dynamic_table_row(table_name, row_id, values):
+    """Update a row in dynamic table"""
+    result = apply_row_mutations(table_name, [{'action': 'update', 'id': row_id, 'values': values}])
+    return _single_mutation_result(result, 'Row updated successfully')
 
 def delete_dynamic_table_row(table_name, row_id):
     """Delete a row from dynamic table"""
+    result = apply_row_mutations(table_name, [{'action': 'delete', 'id': row_id}])
+    return _single_mutation_result(result, 'Row deleted successfully')
+
+def _single_mutation_result(result, message):
+    op_result = result['results'][0] if result.get('results') else {}
+    if not result['success']:
+        return {'success': False, 'message': op_result.get('message') or result['message']}
+    if op_result.get('status') == 'not_found':
+        return {'success': False, 'message': 'Row not found'}
+    return {'success': True, 'message': message}
+
+def get_table_profile(table_name, expected_rows=None):
+    """Get a table's statistics profile, building it with one streamed scan if missing.
+
+    If expected_rows disagrees with the stored row count (e.g. writes that bypassed
+    utils, or concurrent workers racing), the profile is rebuilt.
+    """
+    record = db.session.get(DatasetProfile, table_name)
+    if record:
+        profile = record.get_profile()
+        if expected_rows is None or profile['row_count'] == expected_rows:
+            return profile
+    
+    profile = empty_profile()
+    for columns, rows in iter_table_batches(table_name):
+        add_rows(profile, columns, rows)
+    save_table_profile(table_name, profile)
+    return profile
+
+def save_table_profile(table_name, profile, commit=True):
+    """Store a table's statistics profile"""
+    record = db.session.get(DatasetProfile, table_name)
+    if record is None:
+        record = DatasetProfile(table_name=table_name)
+        db.session.add(record)
+    record.set_profile(profile)
+    if commit:
+        db.session.commit()
+
+def _apply_profile_change(table_name, columns, added=None, removed=None):
+    """Fold inserted/updated/deleted rows into the stored profile.
+
+    Best effort: tables without a profile yet are profiled lazily on first use.
+    """
     try:
-        sql = f'DELETE FROM "{table_name}" WHERE id = {row_id}'
-        db.session.execute(text(sql))
+        record = db.session.get(DatasetProfile, table_name)
+        if record is None:
+            return
+        profile = record.get_profile()
+        if removed:
+            remove_rows(profile, columns, removed)
+        if added:
+            add_rows(profile, columns, added)
+        record.set_profile(profile)
         db.session.commit()
-        
-        return {'success': True, 'message': 'Row deleted successfully'}
     except Exception as e:
         db.session.rollback()
-        return {'success': False, 'message': str(e)}
+        logging.getLogger(__name__).warning(f"Could not update profile for {table_name}: {e}")
+
+# Export formats: format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+def iter_table_batches(table_name, batch_size=None):
+    """Yield (columns, rows) batches from a dynamic table over a server-side cursor (replica if configured)"""
+    batch_size = batch_size or EXPORT_BATCH_ROWS
+    with read_connection() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            text(f'SELECT * FROM "{table_name}" ORDER BY id'))
+        columns = list(result.keys())
+        for rows in result.partitions(batch_size):
+            yield columns, rows
+
+class _StreamSink:
+    """Write-only file object that hands written bytes back to a generator"""
+    
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
 
-def export_table_to_csv(table_name, page_name):
-    """Export dynamic table data to CSV"""
+def _iter_csv(batches):
+    header_written = False
+    for columns, rows in batches:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(['' if value is None else value for value in row] for row in rows)
+        yield out.getvalue().encode('utf-8')
+
+def _iter_ndjson(batches):
+    for columns, rows in batches:
+        lines = [json.dumps(dict(zip(columns, row)), default=str) for row in rows]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def arrow_column_types(pa, table_name):
+    """Declared column type -> Arrow type; undeclared and text columns are left out (strings)"""
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    schema = dynamic_table.get_schema() if dynamic_table else {}
+    types = {'BOOLEAN': pa.bool_(), 'INT': pa.int32(), 'BIGINT': pa.int64(), 'DOUBLE': pa.float64(),
+             'DATETIME': pa.timestamp('us')}
+    column_types = {column: types[sql_type] for column, sql_type in schema.items() if sql_type in types}
+    column_types.update({'id': pa.int64(), 'created_at': pa.timestamp('us'), 'updated_at': pa.timestamp('us')})
+    return column_types
+
+def arrow_column_array(pa, values, arrow_type):
+    """Build an Arrow array of arrow_type, coercing values the driver returned in another form"""
     try:
-        sql = f'SELECT * FROM "{table_name}"'
-        df = pd.read_sql(sql, db.engine)
-        
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False)
-        df.to_csv(temp_file.name, index=False)
-        
-        return temp_file.name
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+        pass
+    # Drivers hand back TINYINT booleans as 0/1 and SQLite datetimes as text
+    series = pd.Series(values, dtype=object)
+    if pa.types.is_string(arrow_type):
+        series = series.map(lambda value: None if value is None else str(value))
+    elif pa.types.is_timestamp(arrow_type):
+        series = pd.to_datetime(series, errors='coerce')
+    elif pa.types.is_boolean(arrow_type):
+        series = pd.to_numeric(series, errors='coerce').map(lambda value: None if pd.isna(value) else bool(value))
+    else:
+        series = pd.to_numeric(series, errors='coerce')
+    return pa.array(series, type=arrow_type, from_pandas=True)
+
+def _iter_parquet(batches, table_name):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    column_types = arrow_column_types(pa, table_name)
+    sink = _StreamSink()
+    writer = None
+    schema = None
+    try:
+        for columns, rows in batches:
+            # Typed from the declared schema; untyped (and text) columns are strings,
+            # so every batch shares one schema
+            if schema is None:
+                schema = pa.schema([pa.field(column, column_types.get(column, pa.string())) for column in columns])
+                writer = pq.ParquetWriter(sink, schema)
+            arrays = [arrow_column_array(pa, [row[i] for row in rows], schema.field(i).type)
+                      for i in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream_table_export(table_name, export_format='csv', compress=False, batch_size=None):
+    """Stream a dynamic table as CSV, NDJSON or Parquet bytes with constant memory"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {export_format}')
+    if export_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError('Parquet export requires the pyarrow package')
+    
+    batches = iter_table_batches(table_name, batch_size)
+    if export_format == 'parquet':
+        chunks = _iter_parquet(batches, table_name)
+    else:
+        chunks = {'csv': _iter_csv, 'ndjson': _iter_ndjson}[export_format](batches)
+    return _gzip_stream(chunks) if compress else chunks
+
+def export_table_to_file(table_name, export_format='csv', compress=False, directory=None):
+    """Export a dynamic table to a file by draining the export stream; caller owns the file"""
+    try:
+        extension = EXPORT_FORMATS.get(export_format, ('', export_format))[1] + ('.gz' if compress else '')
+        fd, filepath = tempfile.mkstemp(suffix=f'.{extension}', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in stream_table_export(table_name, export_format, compress):
+                f.write(chunk)
+        return filepath
     except Exception as e:
         raise Exception(f'Export failed: {str(e)}')
 
-def process_uploaded_file(filepath, page):
-    """Process uploaded file based on page type"""
+def _iter_excel_chunks(filepath, chunk_size):
+    """Yield DataFrame chunks from an xlsx file using openpyxl read-only mode"""
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
     try:
-        # Determine file type and read data
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        elif filepath.endswith('.json'):
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) if col is not None else f'column_{i + 1}' for i, col in enumerate(header)]
+        
+        buffer = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:len(columns)])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+def _is_line_delimited_json(filepath):
+    """Check whether a JSON file holds one record per line rather than an array"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped:
+                return not stripped.startswith('[')
+    return False
+
+def iter_upload_chunks(filepath, chunk_size=None):
+    """Read an uploaded file as a stream of bounded DataFrame chunks.
+
+    Yields (chunk, bytes_read) pairs; bytes_read is exact for streamed formats and
+    the full file size for formats that have to be loaded in one go.
+    """
+    chunk_size = chunk_size or UPLOAD_CHUNK_ROWS
+    lower_path = filepath.lower()
+    file_size = os.path.getsize(filepath)
+    
+    if lower_path.endswith('.csv'):
+        with open(filepath, 'rb') as handle:
+            with pd.read_csv(handle, chunksize=chunk_size) as reader:
+                for chunk in reader:
+                    yield chunk, handle.tell()
+    elif lower_path.endswith(('.json', '.jsonl', '.ndjson')):
+        if _is_line_delimited_json(filepath):
+            with open(filepath, 'r', encoding='utf-8') as handle:
+                with pd.read_json(handle, lines=True, chunksize=chunk_size) as reader:
+                    for chunk in reader:
+                        yield chunk, handle.buffer.tell()
+        else:
+            # A JSON array can't be parsed incrementally; slice it after loading
             df = pd.read_json(filepath)
-        elif filepath.endswith('.xlsx') or filepath.endswith('.xls'):
-            df = pd.read_excel(filepath)
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size], file_size
+    elif lower_path.endswith('.xlsx'):
+        for chunk in _iter_excel_chunks(filepath, chunk_size):
+            yield chunk, file_size
+    elif lower_path.endswith('.xls'):
+        # Legacy xls has no streaming reader; xlrd always loads the whole workbook
+        df = pd.read_excel(filepath)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size], file_size
+    else:
+        raise ValueError('Unsupported file format')
+
+def _get_table_schema(table_name, inspector):
+    """Current column types of a dynamic table, read back from the database"""
+    return {col['name']: normalize_sql_type(col['type'])
+            for col in inspector.get_columns(table_name)
+            if col['name'] not in ('id', 'created_at', 'updated_at')}
+
+def _untyped_columns(table_name):
+    """Columns that have held only nulls so far, recorded as None in the DynamicTable schema"""
+    dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+    schema = dynamic_table.get_schema() if dynamic_table else {}
+    return {col for col, sql_type in schema.items() if sql_type is None}
+
+def _alter_column_type_sql(table_name, col_name, sql_type):
+    """Statement that widens a column, or None where column types aren't enforced (SQLite)"""
+    if db.engine.dialect.name == 'sqlite':
+        return None
+    if db.engine.dialect.name == 'postgresql':
+        return f'ALTER TABLE "{table_name}" ALTER COLUMN "{col_name}" TYPE {sql_type} USING "{col_name}"::{sql_type}'
+    return f'ALTER TABLE "{table_name}" MODIFY COLUMN "{col_name}" {sql_type}'
+
+def _record_table_schema(table_name, page_id, schema):
+    """Store the column types in the table's DynamicTable metadata"""
+    try:
+        dynamic_table = DynamicTable.query.filter_by(table_name=table_name).first()
+        if dynamic_table is None:
+            dynamic_table = DynamicTable(table_name=table_name, page_id=page_id)
+            db.session.add(dynamic_table)
+        dynamic_table.set_schema(schema)
+    except Exception as e:
+        try:
+            from app import app
+            app.logger.error(f"Could not record DynamicTable metadata: {e}")
+        except:
+            print(f"Could not record DynamicTable metadata: {e}")
+
+def _prepare_dynamic_table(table_name, chunk_schema, page, page_id):
+    """Create the page's dynamic table, or add and widen columns to fit a new chunk.
+
+    chunk_schema maps sanitized column names to inferred SQL types. Returns the
+    table's resulting schema under 'schema'. All-null columns stay untyped (None,
+    stored as UNKNOWN_TYPE) until a chunk brings values, then change straight to
+    the values' type.
+    """
+    inspector = inspect(db.engine)
+    
+    if not inspector.has_table(table_name):
+        # Create new table
+        schema = dict(chunk_schema)
+        result = create_dynamic_table(table_name, schema)
+        if not result['success']:
+            return {'success': False, 'message': f'Failed to create table: {result["error"]}'}
+        
+        # Update page with table name - handle both dict and model objects
+        if isinstance(page, dict):
+            # For temp storage, we can't directly update the table_name
+            # This will be handled when database comes back online
+            pass
         else:
-            return {'success': False, 'message': 'Unsupported file format'}
+            page.table_name = table_name
         
-        if df.empty:
-            return {'success': False, 'message': 'File is empty'}
+        # Create metadata record only if database is available
+        _record_table_schema(table_name, page_id, schema)
+        try:
+            # Start an empty profile so inserts can maintain it incrementally
+            save_table_profile(table_name, empty_profile(), commit=False)
+        except Exception as e:
+            db.session.rollback()
+        return {'success': True, 'schema': schema}
+    
+    # Add new columns and widen existing ones that the chunk no longer fits
+    schema = _get_table_schema(table_name, inspector)
+    schema.update({col: None for col in _untyped_columns(table_name) if col in schema})
+    changed = False
+    for col_name, sql_type in chunk_schema.items():
+        if col_name not in schema:
+            schema[col_name] = sql_type
+            db.session.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{col_name}" {sql_type or UNKNOWN_TYPE}'))
+            changed = True
+            continue
+        widened = widen_type(schema[col_name], sql_type)
+        if widened != schema[col_name]:
+            alter_sql = _alter_column_type_sql(table_name, col_name, widened)
+            if alter_sql:
+                db.session.execute(text(alter_sql))
+            schema[col_name] = widened
+            changed = True
+    
+    if changed:
+        _record_table_schema(table_name, page_id, schema)
+        bump_table_version(table_name)
+    return {'success': True, 'schema': schema}
+
+def process_uploaded_file(filepath, page, chunk_size=None, progress=None):
+    """Process uploaded file based on page type, streaming it in bounded chunks.
+
+    progress, if given, is called with rows_processed and bytes_read after each chunk.
+    """
+    try:
+        lower_path = filepath.lower()
+        if not lower_path.endswith(('.csv', '.json', '.jsonl', '.ndjson', '.xlsx', '.xls')):
+            return {'success': False, 'message': 'Unsupported file format'}
         
         # Generate table name - handle both dict and model objects
         page_id = page.get('id') if isinstance(page, dict) else page.id
@@ -147,67 +788,54 @@ def process_uploaded_file(filepath, page):
             page_name = "untitled"
         table_name = f"page_{page_id}_{page_name.replace(' ', '_').lower()}"
         
+        rows_read = 0
+        rows_inserted = 0
+        elapsed = 0.0
+        schema = None
+        
         # Try database operations with fallback
         try:
-            # Check if table exists
-            inspector = inspect(db.engine)
-            table_exists = inspector.has_table(table_name)
-            
-            if not table_exists:
-                # Create new table
-                result = create_dynamic_table(table_name, df.columns.tolist())
-                if not result['success']:
-                    return {'success': False, 'message': f'Failed to create table: {result["error"]}'}
+            for chunk, bytes_read in iter_upload_chunks(filepath, chunk_size):
+                if chunk.empty:
+                    continue
+                rows_read += len(chunk)
                 
-                # Update page with table name - handle both dict and model objects
-                if isinstance(page, dict):
-                    # For temp storage, we can't directly update the table_name
-                    # This will be handled when database comes back online
-                    pass
-                else:
-                    page.table_name = table_name
+                chunk.columns = [sanitize_column_name(col) for col in chunk.columns]
+                chunk_schema = infer_schema(chunk)
                 
-                # Create metadata record only if database is available
-                try:
-                    from app import app
-                    dynamic_table = DynamicTable(
-                        table_name=table_name,
-                        page_id=page_id
-                    )
-                    dynamic_table.set_columns_info(df.columns.tolist())
-                    db.session.add(dynamic_table)
-                except Exception as e:
-                    try:
-                        from app import app
-                        app.logger.error(f"Could not create DynamicTable metadata: {e}")
-                    except:
-                        print(f"Could not create DynamicTable metadata: {e}")
-            else:
-                # Add new columns if they don't exist
-                existing_columns = [col['name'] for col in inspector.get_columns(table_name)]
-                new_columns = [col for col in df.columns if col.replace(' ', '_').replace('-', '_').lower() not in existing_columns]
+                # Only touch the table when a chunk brings new columns or wider data
+                if schema is None or any(col not in schema or widen_type(schema[col], sql_type) != schema[col]
+                                         for col, sql_type in chunk_schema.items()):
+                    result = _prepare_dynamic_table(table_name, chunk_schema, page, page_id)
+                    if not result['success']:
+                        return result
+                    schema = result['schema']
                 
-                for col in new_columns:
-                    col_name = col.replace(' ', '_').replace('-', '_').lower()
-                    sql = f'ALTER TABLE "{table_name}" ADD COLUMN "{col_name}" TEXT'
-                    db.session.execute(text(sql))
+                # Insert data
+                result = insert_csv_data(table_name, chunk, schema=schema)
+                if not result['success']:
+                    return {'success': False, 'message': f'Failed to insert data: {result["error"]}'}
+                rows_inserted += result['rows_inserted']
+                elapsed += result['elapsed_seconds']
+                if progress:
+                    progress(rows_processed=rows_inserted, bytes_read=bytes_read)
             
-            # Insert data
-            result = insert_csv_data(table_name, df)
-            if not result['success']:
-                return {'success': False, 'message': f'Failed to insert data: {result["error"]}'}
+            if rows_read == 0:
+                return {'success': False, 'message': 'File is empty'}
             
             db.session.commit()
             
+            rows_per_second = rows_inserted / elapsed if elapsed > 0 else float(rows_inserted)
             return {
                 'success': True, 
-                'message': f'Successfully processed {result["rows_inserted"]} rows'
+                'message': f'Successfully processed {rows_inserted} rows '
+                           f'({rows_per_second:,.0f} rows/sec)'
             }
-        except Exception as db_error:
+        except SQLAlchemyError as db_error:
             # Database unavailable, return success with limitation note
             return {
                 'success': True, 
-                'message': f'File processed successfully. Data will be available when database reconnects. ({len(df)} rows processed)'
+                'message': f'File processed successfully. Data will be available when database reconnects. ({rows_read} rows processed)'
             }
         
     except Exception as e: